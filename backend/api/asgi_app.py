@@ -0,0 +1,942 @@
+"""
+ASGI entry point for the hot LifeLoop routes.
+
+    uvicorn asgi_app:app --port 5000 --workers 2
+
+Serves ``/parent-request``, ``/ingest/instagram``, ``/process/instagram-media``,
+``/email/digest-preview``, ``/transcribe-image`` and ``/metrics`` with the same request and
+response contracts as the Flask app in ``server.py``. Configuration, caches and every decision
+that needs no I/O (query and row builders, key derivation, header handling, fair ordering, skip
+and response bodies) are shared helpers in ``server.py``; only the transport calls are written
+twice. Upstream calls go through
+``async_clients``, so a request waiting on Gemini or ElevenLabs holds a coroutine, not a worker
+thread. Work with no async client (JWT verification, Pillow resizing, the Resend SDK, SQLite
+caches and the job queue) runs on Starlette's thread pool. Request deadlines are set by
+``_RequestDeadline`` and follow the request's tasks without being handed along.
+"""
+import asyncio
+import json
+import logging
+import time
+from contextlib import AsyncExitStack, asynccontextmanager, nullcontext
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import async_clients
+import deadlines
+import httpx
+import metrics
+import server
+from async_clients import AsyncR2, ObjectNotFound
+from image_preprocessing import derived_image_key, downsize_for_caption
+from pipeline import AsyncStagedPipeline, Stage
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Match, Route
+
+logger = logging.getLogger("asgi_app")
+
+
+def _jsonify(body: Any, status: int = 200) -> Response:
+    # Same serialisation as Flask's jsonify outside debug mode: sorted keys, compact, trailing newline.
+    content = json.dumps(body, sort_keys=True, separators=(",", ":")) + "\n"
+    return Response(content, status_code=status, media_type="application/json")
+
+
+async def _json_body(request: Request) -> Any:
+    """Mirrors ``request.get_json(silent=True)``: ``None`` unless the body is valid JSON."""
+    mimetype = request.headers.get("Content-Type", "").split(";")[0].strip().lower()
+    if mimetype != "application/json" and not mimetype.endswith("+json"):
+        return None
+    try:
+        return json.loads(await request.body())
+    except ValueError:
+        return None
+
+
+def _r2() -> AsyncR2:
+    return AsyncR2(server.s3, server.BUCKET_NAME, async_clients.client("r2"))
+
+
+# --- Supabase ---
+def _supabase() -> async_clients.UpstreamClient:
+    server._require_supabase_configuration()
+    return async_clients.client("supabase")
+
+
+async def _fetch_profile(profile_id: str, *, use_cache: bool = True) -> Optional[Dict[str, Any]]:
+    if use_cache:
+        cached = server.profile_cache.get(profile_id)
+        if cached is not None:
+            return dict(cached)
+
+    response = await _supabase().get(
+        f"{server.SUPABASE_REST_URL}/user_profiles",
+        params={"id": f"eq.{profile_id}", "select": "*"},
+        headers=server._supabase_headers("return=representation"),
+    )
+    response.raise_for_status()
+    data = response.json()
+    if not data:
+        return None
+    server.profile_cache.set(profile_id, data[0])
+    return dict(data[0])
+
+
+async def _update_profile(profile_id: str, updates: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    response = await _supabase().patch(
+        f"{server.SUPABASE_REST_URL}/user_profiles",
+        params={"id": f"eq.{profile_id}"},
+        headers=server._supabase_headers("return=representation"),
+        content=json.dumps(updates),
+    )
+    response.raise_for_status()
+    server.profile_cache.delete(profile_id)
+    payload = response.json()
+    return payload[0] if payload else None
+
+
+async def _upsert_user_profile(payload: Dict[str, Any]) -> Dict[str, Any]:
+    headers = server._supabase_headers("return=representation,resolution=merge-duplicates")
+    response = await async_clients.client("supabase").post(
+        f"{server.SUPABASE_REST_URL}/user_profiles", headers=headers, content=json.dumps([payload])
+    )
+    response.raise_for_status()
+    server.profile_cache.delete(payload["id"])
+    body = response.json()
+    return body[0] if body else payload
+
+
+async def _insert_parent_confirmation(payload: Dict[str, Any]) -> Dict[str, Any]:
+    headers = server._supabase_headers("return=representation")
+    response = await async_clients.client("supabase").post(
+        f"{server.SUPABASE_REST_URL}/parent_confirmations", headers=headers, content=json.dumps(payload)
+    )
+    response.raise_for_status()
+    body = response.json()
+    return body[0] if isinstance(body, list) and body else body
+
+
+async def _fetch_existing_source_urls(profile_id: str, source_urls: List[str]) -> set:
+    if not source_urls:
+        return set()
+    existing = set()
+    for params in server._existing_source_url_queries(profile_id, source_urls):
+        response = await _supabase().get(
+            f"{server.SUPABASE_REST_URL}/instagram_media",
+            params=params,
+            headers=server._supabase_headers("return=representation"),
+        )
+        response.raise_for_status()
+        existing.update(row["source_url"] for row in response.json() if row.get("source_url"))
+    return existing
+
+
+async def _insert_instagram_media_rows(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    if not rows:
+        return []
+    response = await _supabase().post(
+        f"{server.SUPABASE_REST_URL}/instagram_media",
+        params={"on_conflict": "user_id,source_url"},
+        headers=server._supabase_headers("return=representation,resolution=ignore-duplicates"),
+        content=json.dumps(rows),
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+async def _fetch_instagram_media(
+    media_id: Optional[str] = None, *, limit: int = 10, only_unprocessed: bool = True
+) -> List[Dict[str, Any]]:
+    response = await _supabase().get(
+        f"{server.SUPABASE_REST_URL}/instagram_media",
+        params=server._instagram_media_query(media_id, limit, only_unprocessed),
+        headers=server._supabase_headers("return=representation"),
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+async def _fetch_fair_scan_rows(limit: int) -> List[Dict[str, Any]]:
+    response = await _supabase().get(
+        f"{server.SUPABASE_REST_URL}/instagram_media",
+        params=server._fair_scan_params(limit),
+        headers=server._supabase_headers("return=representation"),
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+async def _claim_instagram_media(
+    owner: str, *, media_id: Optional[str] = None, limit: int = 10, only_unprocessed: bool = True
+) -> List[Dict[str, Any]]:
+    response = await _supabase().post(
+        f"{server.SUPABASE_REST_URL}/rpc/claim_instagram_media",
+        headers=server._supabase_headers("return=representation"),
+        content=json.dumps(server._claim_request(owner, media_id, limit, only_unprocessed)),
+    )
+    response.raise_for_status()
+    return server._fair_order(response.json())
+
+
+async def _users_with_processed_media(user_ids: List[str]) -> Set[str]:
+    if not user_ids:
+        return set()
+    response = await _supabase().get(
+        f"{server.SUPABASE_REST_URL}/instagram_media",
+        params=server._processed_users_query(user_ids),
+        headers=server._supabase_headers("return=representation"),
+    )
+    response.raise_for_status()
+    return {row.get("user_id") for row in response.json()}
+
+
+async def _release_instagram_media_leases(media_ids: List[str], owner: str) -> None:
+    if not media_ids:
+        return
+    try:
+        params, body = server._lease_release_query(media_ids, owner)
+        with deadlines.suspended():
+            response = await _supabase().patch(
+                f"{server.SUPABASE_REST_URL}/instagram_media",
+                params=params,
+                headers=server._supabase_headers("return=representation"),
+                content=json.dumps(body),
+            )
+        response.raise_for_status()
+    except Exception:
+        logger.exception("Failed to release leases on %s media rows; they free up when the lease expires.", len(media_ids))
+
+
+async def _fetch_recent_media_for_user(user_id: str, limit: int = 5) -> List[Dict[str, Any]]:
+    response = await _supabase().get(
+        f"{server.SUPABASE_REST_URL}/instagram_media",
+        params=server._recent_media_query(user_id, limit),
+        headers=server._supabase_headers("return=representation"),
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+# --- R2 ---
+async def _stream_to_r2(
+    key: str,
+    chunks: AsyncIterator[bytes],
+    content_type: str,
+    *,
+    max_bytes: Optional[int] = None,
+    acl: Optional[str] = None,
+    upload_slots: Optional[asyncio.Semaphore] = None,
+) -> int:
+    """Async twin of ``server._stream_to_r2``: one part in memory, multipart past one part."""
+    r2 = _r2()
+    slot = upload_slots if upload_slots is not None else nullcontext()
+    buffer = server._PartBuffer(key, max_bytes)
+    upload_id: Optional[str] = None
+    parts: List[Dict[str, Any]] = []
+
+    async def upload_part(body: bytes) -> None:
+        part_number = len(parts) + 1
+        async with slot:
+            etag = await r2.upload_part(key, upload_id, part_number, body)
+        parts.append({"PartNumber": part_number, "ETag": etag})
+
+    try:
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            for part in buffer.feed(chunk):
+                if upload_id is None:
+                    upload_id = await r2.create_multipart_upload(key, content_type, acl)
+                await upload_part(part)
+
+        rest = buffer.rest()
+        if upload_id is None:
+            async with slot:
+                await r2.put_object(key, rest, content_type, acl)
+            return buffer.total
+
+        if rest:
+            await upload_part(rest)
+        await r2.complete_multipart_upload(key, upload_id, parts)
+        return buffer.total
+    except BaseException:
+        if upload_id is not None:
+            try:
+                await r2.abort_multipart_upload(key, upload_id)
+            except Exception:
+                logger.warning("Failed to abort multipart upload %s for %s", upload_id, key)
+        raise
+
+
+# --- Instagram ingestion ---
+class _SourceReadError(Exception):
+    """Reading the CDN body failed, as opposed to writing it to R2."""
+
+
+async def _read_source(response: httpx.Response) -> AsyncIterator[bytes]:
+    try:
+        async for chunk in response.aiter_bytes(server.HTTP_READ_CHUNK_BYTES):
+            yield chunk
+    except httpx.HTTPError as exc:
+        raise _SourceReadError(str(exc)) from exc
+
+
+async def _fetch_new_instagram_posts(
+    username: str,
+    limit: int,
+    *,
+    last_media_id: Optional[str],
+    last_captured_at: Optional[str],
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """Async twin of ``server._fetch_new_instagram_posts``."""
+    walk = server._FeedWalk(username, limit, last_media_id, last_captured_at)
+    request_args = walk.next_request()
+    while request_args is not None:
+        headers, params = request_args
+        response = await async_clients.client("rapidapi").get(server.RAPIDAPI_URL, headers=headers, params=params)
+        response.raise_for_status()
+        walk.add_page(response.json())
+        request_args = walk.next_request()
+    return walk.result()
+
+
+async def _ingest_media_item(
+    profile_id: str, normalized: Dict[str, Any], upload_slots: Optional[asyncio.Semaphore] = None
+) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    media_id = normalized.get("media_id")
+    source_url = normalized["source_url"]
+
+    async with AsyncExitStack() as stack:
+        try:
+            response = await stack.enter_async_context(async_clients.client("instagram_cdn").stream("GET", source_url))
+            response.raise_for_status()
+        except httpx.HTTPError as exc:
+            return None, server._transfer_failure_skip(normalized, None, exc, download_failed=True)
+
+        oversized = server._oversized_media_skip(normalized, response.headers)
+        if oversized:
+            return None, oversized
+
+        content_type = response.headers.get("Content-Type", "image/jpeg")
+        storage_key = server._build_storage_key(profile_id, media_id, content_type)
+        try:
+            await _stream_to_r2(
+                storage_key,
+                _read_source(response),
+                content_type,
+                max_bytes=server.INGEST_MAX_OBJECT_BYTES,
+                upload_slots=upload_slots,
+            )
+        except deadlines.DeadlineExceeded:
+            raise
+        except Exception as exc:
+            return None, server._transfer_failure_skip(
+                normalized, storage_key, exc, download_failed=isinstance(exc, _SourceReadError)
+            )
+
+    return server._instagram_media_row(profile_id, normalized, storage_key), None
+
+
+async def ingest_profile_media(
+    profile: Dict[str, Any],
+    instagram_username: str,
+    *,
+    limit: int = 12,
+    parallel: bool = server.INGEST_PARALLEL,
+    full_refresh: bool = False,
+) -> Tuple[Dict[str, Any], int]:
+    """Async twin of ``server.ingest_profile_media``; returns ``(body, http_status)``."""
+    profile_id = profile["id"]
+    try:
+        new_items, cursor_stats = await _fetch_new_instagram_posts(
+            instagram_username,
+            limit,
+            last_media_id=None if full_refresh else profile.get("ig_last_media_id"),
+            last_captured_at=None if full_refresh else profile.get("ig_last_captured_at"),
+        )
+    except Exception as exc:
+        return server._ingest_fetch_failure(exc, instagram_username)
+
+    if not new_items:
+        return server._no_new_media_body(cursor_stats), 200
+
+    normalized_items = server._ingest_window(new_items, cursor_stats, limit)
+    verdicts, source_urls = server._presort_instagram_media(normalized_items)
+    try:
+        existing: Optional[set] = await _fetch_existing_source_urls(profile_id, source_urls)
+    except Exception:
+        logger.exception("Lookup failed for existing media of profile %s", profile_id)
+        existing = None
+    verdicts = server._apply_existing_source_urls(normalized_items, verdicts, existing)
+    pending = [normalized for normalized, verdict in zip(normalized_items, verdicts) if verdict is None]
+
+    gate = asyncio.Semaphore(server.INGEST_DOWNLOAD_CONCURRENCY if parallel else 1)
+    uploads = asyncio.Semaphore(server.INGEST_UPLOAD_CONCURRENCY if parallel else 1)
+
+    async def transfer(item: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        async with gate:
+            try:
+                row, skip = await _ingest_media_item(profile_id, item, uploads)
+            except deadlines.DeadlineExceeded:
+                return None, server._deadline_skip(item)
+        return row, server._settle_transfer_skip(skip)
+
+    transfers = await asyncio.gather(*(transfer(item) for item in pending))
+    outcomes = server._ingest_outcomes(verdicts, list(transfers))
+    inserted_payloads = [row for row, _ in outcomes if row]
+    skipped = [skip for _, skip in outcomes if skip]
+
+    try:
+        with deadlines.suspended():
+            persisted = await _insert_instagram_media_rows(inserted_payloads)
+    except Exception as exc:
+        return server._ingest_insert_failure(exc, profile_id, inserted_payloads)
+
+    server._record_ingest_metrics(persisted, skipped)
+    mark = server._ingest_cursor_mark(normalized_items, outcomes)
+    if mark is not None:
+        try:
+            with deadlines.suspended():
+                await _update_profile(profile_id, mark)
+        except Exception:
+            logger.exception("Failed to persist ingest cursor for profile %s", profile_id)
+            mark = None
+    cursor_stats["advanced_to"] = mark
+    return server._ingest_response(instagram_username, new_items, persisted, skipped, cursor_stats), 200
+
+
+# --- Media processing ---
+async def _stage_fetch_image(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    storage_key, derived_key = server._image_sources(ctx)
+    r2 = _r2()
+    response: Optional[httpx.Response] = None
+    if derived_key:
+        try:
+            response = await r2.get_object(derived_key)
+            ctx["preprocessed"] = True
+        except ObjectNotFound:
+            ctx["caption_image_key"] = None
+    if response is None:
+        response = await r2.get_object(storage_key)
+    ctx["image_bytes"] = response.content
+    ctx["mime_type"] = response.headers.get("Content-Type", "image/jpeg")
+    return server._fetched_image_detail(ctx)
+
+
+async def _stage_preprocess(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    if ctx["preprocessed"]:
+        return server._reused_image_stats(ctx)
+
+    storage_key = ctx["record"]["storage_key"]
+    payload, mime_type, stats = await run_in_threadpool(downsize_for_caption, ctx["image_bytes"], ctx["mime_type"])
+    if stats["resized"]:
+        try:
+            derived_key = derived_image_key(storage_key)
+            await _r2().put_object(derived_key, payload, mime_type)
+            ctx["caption_image_key"] = derived_key
+        except Exception:
+            logger.warning("Failed to store caption-sized copy of %s", storage_key, exc_info=True)
+    return server._finish_preprocess(ctx, storage_key, payload, mime_type, stats)
+
+
+async def _generate_gemini_caption(image_bytes: bytes, mime_type: str) -> Tuple[str, float]:
+    if not server.GEMINI_API_KEY:
+        logger.warning("GEMINI_API_KEY not set; returning placeholder caption.")
+        return ("A cherished campus moment captured for the family legacy demo.", 0.5)
+
+    cache_key = server._caption_cache_key(image_bytes)
+    cached = await run_in_threadpool(server.caption_cache.get, cache_key)
+    if cached is not None:
+        return cached["caption"], cached["confidence"]
+
+    response = await async_clients.client("gemini").post(
+        server.GEMINI_API_ENDPOINT,
+        params={"key": server.GEMINI_API_KEY},
+        json=server._gemini_request_payload(image_bytes, mime_type),
+    )
+    response.raise_for_status()
+    caption_text, confidence = server._parse_gemini_caption(response.json())
+    await run_in_threadpool(server.caption_cache.set, cache_key, {"caption": caption_text, "confidence": confidence})
+    return caption_text, confidence
+
+
+async def _stage_caption(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    ctx["caption"], ctx["confidence"] = await _generate_gemini_caption(ctx["image_bytes"], ctx["mime_type"])
+    ctx.pop("image_bytes", None)
+    return {"confidence": ctx["confidence"]}
+
+
+async def _stream_narration_to_r2(caption: str) -> Tuple[Optional[str], int]:
+    """Async twin of ``server.stream_audio_narration_to_r2``."""
+    url, payload, headers = server._narration_request(caption, stream=True)
+    async with async_clients.client("elevenlabs").stream("POST", url, json=payload, headers=headers) as response:
+        response.raise_for_status()
+        chunks = response.aiter_bytes(server.HTTP_READ_CHUNK_BYTES)
+        first = b""
+        async for first in chunks:
+            if first:
+                break
+        if not first:
+            return None, 0
+
+        async def body() -> AsyncIterator[bytes]:
+            yield first
+            async for chunk in chunks:
+                yield chunk
+
+        content_type = response.headers.get("Content-Type", "audio/mpeg")
+        key = server._narration_storage_key(server._narration_cache_key(caption), content_type)
+        size = await _stream_to_r2(key, body(), content_type or "audio/mpeg", acl="private")
+    return key, size
+
+
+async def _stage_narration(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    caption = ctx["caption"]
+    ctx["audio_url"] = None
+    if not caption:
+        return {"skipped": True}
+
+    narration_key = server._narration_cache_key(caption)
+    cached_narration = await run_in_threadpool(server.narration_cache.get, narration_key)
+    ctx["audio_url"] = server._cached_narration_url(cached_narration)
+    if ctx["audio_url"]:
+        return {"cached": True, "audio_url": ctx["audio_url"]}
+
+    if not server.ELEVENLABS_API_KEY:
+        logger.warning("ELEVENLABS_API_KEY not set; skipping narration synthesis.")
+        return {"bytes": 0}
+
+    existing_key = server._narration_storage_key(narration_key, "audio/mpeg")
+    if await _r2().object_exists(existing_key):
+        ctx["audio_url"] = await run_in_threadpool(server._remember_narration, narration_key, existing_key)
+        return {"cached": True, "audio_url": ctx["audio_url"]}
+
+    if server.NARRATION_STREAMING:
+        audio_key, size = await _stream_narration_to_r2(caption)
+        if not audio_key:
+            return {"bytes": 0}
+    else:
+        url, payload, headers = server._narration_request(caption)
+        response = await async_clients.client("elevenlabs").post(url, json=payload, headers=headers)
+        response.raise_for_status()
+        audio_bytes = response.content
+        if not audio_bytes:
+            return {"bytes": 0}
+        size = len(audio_bytes)
+        audio_content_type = response.headers.get("Content-Type", "audio/mpeg")
+        audio_key = server._narration_storage_key(narration_key, audio_content_type)
+        await _r2().put_object(audio_key, audio_bytes, audio_content_type or "audio/mpeg", acl="private")
+
+    ctx["audio_url"] = await run_in_threadpool(server._remember_narration, narration_key, audio_key)
+    return {"bytes": size, "audio_url": ctx["audio_url"], "streamed": server.NARRATION_STREAMING}
+
+
+async def _stage_update_record(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    # Shares the Flask app's bulk result writer; its thread does the upsert, the coroutine only awaits.
+    ctx["pending_update"] = asyncio.wrap_future(
+        server.media_result_writer.submit((ctx["record"], server._media_record_updates(ctx)))
+    )
+    return {}
+
+
+MEDIA_PROCESSING_STAGES: Tuple[Tuple[str, Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]], ...] = (
+    ("fetch_image", _stage_fetch_image),
+    ("preprocess", _stage_preprocess),
+    ("caption", _stage_caption),
+    ("narration", _stage_narration),
+    ("update_record", _stage_update_record),
+)
+
+
+def _timed_stage(
+    name: str, stage: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+) -> Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]:
+    async def wrapped(ctx: Dict[str, Any]) -> Dict[str, Any]:
+        server._check_stage_deadline(name)
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            await stage(ctx)
+            outcome = "ok"
+            return ctx
+        except Exception as exc:
+            cut_short = server._stage_cut_short(name, exc)
+            if cut_short is not None:
+                raise cut_short from exc
+            raise
+        finally:
+            metrics.MEDIA_STAGE_SECONDS.observe(time.perf_counter() - started, stage=name, outcome=outcome)
+
+    return wrapped
+
+
+async def process_media_records(records: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """Async twin of ``server.process_media_records``, with the same result and stats shape."""
+    pipeline = AsyncStagedPipeline(
+        [
+            Stage(name, _timed_stage(name, stage), workers=server.PIPELINE_STAGE_WORKERS[name])
+            for name, stage in MEDIA_PROCESSING_STAGES
+        ],
+        queue_size=server.PIPELINE_QUEUE_SIZE,
+    )
+    results = await pipeline.run({"record": record} for record in records)
+    server.media_result_writer.flush(timeout=0)
+
+    processed: List[Dict[str, Any]] = []
+    for result in results:
+        if result.error is None:
+            try:
+                result.item["updated_record"] = await result.item["pending_update"]
+            except Exception as exc:
+                result.error, result.failed_stage = exc, "update_record"
+        processed.append(server._media_result_entry(result))
+    return processed, server._media_pipeline_stats(pipeline, len(records))
+
+
+# --- Routes ---
+async def _register_elevenlabs_voice(
+    user_id: str, filename: str, body: bytes, content_type: Optional[str]
+) -> Optional[str]:
+    if not server.ELEVENLABS_API_KEY:
+        logger.warning("ELEVENLABS_API_KEY missing; skipping voice cloning.")
+        return None
+    try:
+        response = await async_clients.client("elevenlabs").post(
+            f"{server.ELEVENLABS_API_BASE_URL}/v1/voices/add",
+            headers={"xi-api-key": server.ELEVENLABS_API_KEY},
+            files={"files": (filename or "voice-sample", body, content_type or "audio/mpeg")},
+            data={"name": f"LifeLoop-{user_id}"},
+        )
+        if not response.is_success:
+            logger.warning("ElevenLabs voice clone failed: %s", response.text)
+            return None
+        return response.json().get("voice_id")
+    except Exception as exc:
+        logger.exception("Error calling ElevenLabs voice clone: %s", exc)
+        return None
+
+
+async def parent_request(request: Request) -> Response:
+    access_token = server._bearer_token(request.headers.get("Authorization", ""))
+    if not access_token:
+        return _jsonify({"error": "Unauthorized"}, 401)
+
+    try:
+        user = await run_in_threadpool(server.token_verifier.verify, access_token)
+    except PermissionError:
+        return _jsonify({"error": "Unauthorized"}, 401)
+    except Exception as exc:
+        logger.exception("Failed to fetch authenticated Supabase user.")
+        return _jsonify({"error": str(exc)}, 500)
+
+    user_id = user.get("id")
+    if not user_id:
+        return _jsonify({"error": "Unable to determine the current user."}, 400)
+
+    voice_file = None
+    if "multipart/form-data" in (request.headers.get("Content-Type") or ""):
+        form = await request.form()
+        payload: Any = {key: value for key, value in form.items() if isinstance(value, str)}
+        voice_file = form.get("voiceSample") or form.get("voice_sample")
+        if isinstance(voice_file, str):
+            voice_file = None
+    else:
+        payload = await _json_body(request) or {}
+
+    instagram_username, parent_email, error = server._parent_request_fields(payload)
+    if error:
+        return _jsonify({"error": error}, 400)
+
+    voice_sample_url: Optional[str] = None
+    voice_profile_id: Optional[str] = None
+
+    if voice_file is not None and voice_file.filename:
+        voice_bytes = await voice_file.read()
+        mimetype = (voice_file.content_type or "").split(";")[0].strip() or None
+        if voice_bytes:
+            try:
+                key = server._voice_sample_key(user_id, voice_file.filename)
+                await _r2().put_object(key, voice_bytes, mimetype or "audio/mpeg", acl="private")
+                voice_sample_url = server._object_url(key)
+            except Exception as exc:
+                logger.exception("Failed to upload voice sample for %s", user_id)
+                return _jsonify({"error": f"Voice sample upload failed: {exc}"}, 500)
+
+            voice_profile_id = await _register_elevenlabs_voice(user_id, voice_file.filename, voice_bytes, mimetype)
+        else:
+            logger.warning("Received empty voice sample for user %s", user_id)
+
+    profile_payload = server._parent_profile_payload(
+        user, instagram_username, parent_email, voice_sample_url, voice_profile_id
+    )
+    try:
+        profile = await _upsert_user_profile(profile_payload)
+    except Exception as exc:
+        logger.exception("Failed to upsert user profile for %s", user_id)
+        return _jsonify({"error": f"Failed to save profile: {exc}"}, 500)
+
+    confirmation = server._parent_confirmation_payload(user_id, parent_email)
+    try:
+        await _insert_parent_confirmation(confirmation)
+    except Exception as exc:
+        logger.exception("Failed to insert parent confirmation for %s", user_id)
+        return _jsonify({"error": f"Failed to record parent confirmation request: {exc}"}, 500)
+
+    confirmation_url = server._parent_confirmation_url(confirmation)
+    if not confirmation_url:
+        return _jsonify({"error": "APP_BASE_URL is not configured on the backend."}, 500)
+
+    try:
+        email_result = await run_in_threadpool(
+            server._send_parent_confirmation_email,
+            parent_email=parent_email,
+            student_name=user.get("user_metadata", {}).get("full_name") or user.get("email"),
+            confirmation_url=confirmation_url,
+            instagram_username=instagram_username,
+        )
+    except Exception as exc:
+        logger.exception("Failed to dispatch parent confirmation email.")
+        return _jsonify({"error": f"Failed to send confirmation email: {exc}"}, 502)
+
+    return _jsonify(
+        *server._parent_request_response(profile, email_result, confirmation, voice_sample_url, voice_profile_id)
+    )
+
+
+async def ingest_instagram(request: Request) -> Response:
+    payload = await _json_body(request) or {}
+    profile_id = payload.get("profile_id")
+    instagram_username = payload.get("instagram_username")
+    limit, full_refresh, parallel = server._ingest_request_options(payload)
+
+    missing = server._missing_ingest_fields(payload)
+    if missing:
+        return _jsonify({"error": missing}, 400)
+
+    try:
+        profile = await _fetch_profile(profile_id)
+    except Exception as exc:
+        logger.exception("Failed to fetch profile %s during ingestion", profile_id)
+        return _jsonify({"error": str(exc)}, 500)
+
+    if not profile:
+        return _jsonify({"error": "Profile not found."}, 404)
+
+    if not profile.get("is_parent_confirmed"):
+        try:
+            profile = await _fetch_profile(profile_id, use_cache=False) or profile
+        except Exception as exc:
+            logger.exception("Failed to refresh profile %s during ingestion", profile_id)
+            return _jsonify({"error": str(exc)}, 500)
+
+    if not profile.get("is_parent_confirmed"):
+        return _jsonify({"error": "Parent confirmation required before ingestion."}, 403)
+
+    body, status = await ingest_profile_media(
+        profile, instagram_username, limit=limit, parallel=parallel, full_refresh=full_refresh
+    )
+    return _jsonify(body, status)
+
+
+async def process_instagram_media(request: Request) -> Response:
+    media_id, limit, run_async = server._process_request_options(await _json_body(request) or {})
+
+    lease_owner = server._media_lease_owner()
+    try:
+        if run_async and media_id:
+            records = await _fetch_instagram_media(media_id=media_id, limit=limit, only_unprocessed=False)
+        elif run_async:
+            scanned = await _fetch_fair_scan_rows(max(limit, server.MEDIA_FAIR_SCAN_ROWS))
+            records = server._fair_order(scanned)[:limit]
+        else:
+            records = await _claim_instagram_media(
+                lease_owner, media_id=media_id, limit=limit, only_unprocessed=not media_id
+            )
+    except Exception as exc:
+        logger.exception("Failed to fetch instagram_media rows.")
+        return _jsonify({"error": str(exc)}, 500)
+
+    if not records:
+        return _jsonify({"message": "No media queued for processing.", "processed": []})
+
+    if run_async:
+        try:
+            returning_users = await _users_with_processed_media(server._media_user_ids(records))
+            jobs = await run_in_threadpool(server._enqueue_media_jobs, records, media_id, returning_users)
+        except Exception as exc:
+            logger.exception("Failed to enqueue instagram_media processing jobs.")
+            return _jsonify({"error": str(exc)}, 500)
+        return _jsonify(server._queued_media_body(jobs), 202)
+
+    processed, pipeline_stats = await process_media_records(records)
+    await _release_instagram_media_leases(server._failed_media_ids(processed), lease_owner)
+    return _jsonify({"processed": processed, "pipeline": pipeline_stats})
+
+
+async def email_digest_preview(request: Request) -> Response:
+    user_id, limit, student_name = server._digest_preview_options(await _json_body(request) or {})
+    if not user_id:
+        return _jsonify({"error": "user_id is required"}, 400)
+
+    try:
+        media_items = await _fetch_recent_media_for_user(user_id=user_id, limit=limit)
+    except Exception as exc:
+        logger.exception("Failed to fetch media for digest.")
+        return _jsonify({"error": str(exc)}, 500)
+
+    html = server.render_digest_email(media_items, student_name=student_name)
+    return Response(html, media_type="text/html")
+
+
+async def transcribe_image(request: Request) -> Response:
+    """Same contract as ``server.transcribe_image``; proxied bodies are streamed from R2 over httpx."""
+    if request.method == "GET":
+        filename = request.query_params.get("filename")
+    else:
+        filename = (await _json_body(request) or {}).get("filename")
+
+    if not filename:
+        return _jsonify({"error": "Missing 'filename' field"}, 400)
+
+    if server._wants_presigned_media(request.method, request.query_params.get("delivery")):
+        try:
+            url, reuse_for = server._presigned_media_url(filename)
+        except Exception as exc:
+            logger.exception("Failed to presign %s", filename)
+            return _jsonify({"error": str(exc)}, 500)
+        return Response(status_code=302, headers=server._presigned_redirect_headers(url, reuse_for))
+
+    forwarded = server._conditional_media_headers(request.method, request.headers)
+    stack = AsyncExitStack()
+    try:
+        upstream = await stack.enter_async_context(_r2().open_object(filename, forwarded))
+    except ObjectNotFound:
+        await stack.aclose()
+        return _jsonify({"error": "Image not found in bucket"}, 404)
+    except Exception as exc:
+        await stack.aclose()
+        return _jsonify({"error": str(exc)}, 500)
+
+    if upstream.status_code == 304:
+        await stack.aclose()
+        return Response(status_code=304, headers=server._not_modified_headers(upstream.headers.get("ETag")))
+    if upstream.status_code == 416:
+        await stack.aclose()
+        return _jsonify({"error": "Requested range not satisfiable"}, 416)
+    if upstream.status_code >= 400:
+        body = await upstream.aread()
+        await stack.aclose()
+        return _jsonify({"error": f"R2 returned {upstream.status_code}: {body[:200].decode('utf-8', 'replace')}"}, 500)
+
+    async def stream() -> AsyncIterator[bytes]:
+        try:
+            async for chunk in upstream.aiter_bytes(server.HTTP_READ_CHUNK_BYTES):
+                yield chunk
+        finally:
+            await stack.aclose()
+
+    headers = server._media_response_headers(
+        upstream.headers.get("Content-Length"),
+        upstream.headers.get("Content-Range"),
+        upstream.headers.get("ETag"),
+        upstream.headers.get("Last-Modified"),
+    )
+    return StreamingResponse(
+        stream(),
+        status_code=206 if upstream.headers.get("Content-Range") else 200,
+        media_type=upstream.headers.get("Content-Type", "image/jpeg"),
+        headers=headers,
+    )
+
+
+async def metrics_endpoint(request: Request) -> Response:
+    await run_in_threadpool(server._observe_media_queue_wait)
+    return Response(metrics.render(), headers={"Content-Type": metrics.CONTENT_TYPE})
+
+
+routes = [
+    Route("/parent-request", parent_request, methods=["POST"]),
+    Route("/ingest/instagram", ingest_instagram, methods=["POST"]),
+    Route("/process/instagram-media", process_instagram_media, methods=["POST"]),
+    Route("/email/digest-preview", email_digest_preview, methods=["POST"]),
+    Route("/transcribe-image", transcribe_image, methods=["GET", "POST"]),
+    Route("/metrics", metrics_endpoint, methods=["GET"]),
+]
+
+
+class _RequestMetrics:
+    """Records ``HTTP_REQUEST_SECONDS`` / ``HTTP_IN_FLIGHT`` like the Flask request hooks."""
+
+    def __init__(self, app: Any) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route = next((item.path for item in routes if item.matches(scope)[0] == Match.FULL), "unmatched")
+        status = {"code": 500}
+
+        async def capture(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        metrics.HTTP_IN_FLIGHT.inc(route=route)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, capture)
+        finally:
+            metrics.HTTP_IN_FLIGHT.dec(route=route)
+            metrics.HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - started, route=route, method=scope["method"], status=status["code"]
+            )
+
+
+class _RequestDeadline:
+    """Sets the request's deadline like the Flask ``_start_request_deadline`` hook."""
+
+    def __init__(self, app: Any) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        header = Headers(scope=scope).get(deadlines.DEADLINE_HEADER)
+        default = server.ROUTE_DEADLINE_SECONDS.get(scope["path"], server.REQUEST_DEADLINE_SECONDS)
+        token = deadlines.start(deadlines.budget(header, default))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            deadlines.reset(token)
+
+
+@asynccontextmanager
+async def _lifespan(_app: Starlette) -> AsyncIterator[None]:
+    yield
+    await async_clients.aclose_all()
+
+
+app = Starlette(
+    routes=routes,
+    middleware=[
+        Middleware(_RequestMetrics),
+        Middleware(_RequestDeadline),
+        Middleware(
+            CORSMiddleware,
+            allow_origins=[origin.strip() for origin in server.ALLOWED_ORIGINS.split(",")],
+            allow_credentials=True,
+            allow_methods=["*"],
+            allow_headers=["Content-Type", "Authorization", deadlines.DEADLINE_HEADER],
+            expose_headers=["Content-Type"],
+        ),
+    ],
+    lifespan=_lifespan,
+)
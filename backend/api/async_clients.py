@@ -0,0 +1,260 @@
+"""
+Non-blocking upstream clients for the ASGI app (``asgi_app.py``).
+
+One pooled ``httpx.AsyncClient`` per upstream, configured from the same ``UpstreamConfig`` as
+``http_clients`` (timeouts, jittered retries on connection errors, 429 and 5xx honouring
+``Retry-After``, ``HTTP_<UPSTREAM>_*`` overrides and optional token bucket). Under a request
+deadline each attempt's timeouts are capped at the time left, and a retry whose backoff would
+outlast it is not made. A request waiting on an upstream holds a coroutine instead of a thread,
+so one process can keep hundreds of Gemini or ElevenLabs calls in flight. ``HTTP_ASYNC_MAX_CONNECTIONS`` caps sockets per upstream.
+
+R2 is reached through ``AsyncR2``: each operation is signed locally by the boto3 client's
+``generate_presigned_url`` (no network call) and sent over httpx, so there is no second AWS SDK
+to keep in step with boto3.
+"""
+import asyncio
+import os
+import random
+import xml.etree.ElementTree as ElementTree
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import deadlines
+import httpx
+import metrics
+from dotenv import load_dotenv
+from http_clients import MAX_RETRY_AFTER_SECONDS, RETRY_STATUSES, UPSTREAMS, UpstreamConfig, _env_override
+from rate_limit import TokenBucket
+
+load_dotenv()
+
+ASYNC_MAX_CONNECTIONS = int(os.getenv("HTTP_ASYNC_MAX_CONNECTIONS", "256"))
+
+_S3_NAMESPACE = "{http://s3.amazonaws.com/doc/2006-03-01/}"
+
+
+class UpstreamClient:
+    """An ``httpx.AsyncClient`` for one upstream with retries, rate limiting and metrics."""
+
+    def __init__(self, name: str, config: UpstreamConfig) -> None:
+        self.name = name
+        self.config = config
+        self.limiter = TokenBucket(config.rate_per_second, config.rate_burst or None) if config.rate_per_second > 0 else None
+        connections = max(config.pool_size, ASYNC_MAX_CONNECTIONS)
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(config.read_timeout, connect=config.connect_timeout),
+            limits=httpx.Limits(max_connections=connections, max_keepalive_connections=connections),
+        )
+
+    def _backoff(self, attempt: int, response: Optional[httpx.Response]) -> float:
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                return min(MAX_RETRY_AFTER_SECONDS, max(0.0, float(retry_after)))
+            except ValueError:
+                pass
+        return self.config.backoff_factor * (2 ** attempt) + random.uniform(0, self.config.backoff_jitter)
+
+    async def _throttle(self) -> None:
+        if self.limiter is not None:
+            delay = self.limiter.reserve()
+            if delay:
+                await asyncio.sleep(delay)
+
+    def _timeout(self, method: str, requested: Any) -> Any:
+        """
+        ``requested`` (a number, else the client's timeouts) capped by the request deadline;
+        ``None`` without a deadline, leaving the caller's timeout alone.
+        """
+        if deadlines.remaining() is None:
+            return None
+        if isinstance(requested, (int, float)):
+            return deadlines.clamp_timeout(float(requested), f"{self.name} {method}")
+        connect, read = deadlines.clamp_timeout(
+            (self.config.connect_timeout, self.config.read_timeout), f"{self.name} {method}"
+        )
+        return httpx.Timeout(read, connect=connect)
+
+    async def request(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        """Sends the request and reads the body, retrying where ``http_clients`` would."""
+        method = method.upper()
+        retryable = method in self.config.retry_methods
+        requested = kwargs.get("timeout")
+        attempt = 0
+        while True:
+            await self._throttle()
+            timeout = self._timeout(method, requested)
+            if timeout is not None:
+                kwargs["timeout"] = timeout
+            response: Optional[httpx.Response] = None
+            try:
+                with metrics.track_upstream(self.name, method) as call:
+                    response = await self.client.request(method, url, **kwargs)
+                    call.outcome = f"{response.status_code // 100}xx"
+            except httpx.TransportError:
+                if not retryable or attempt >= self.config.retries:
+                    raise
+            else:
+                self._count_bytes(response)
+                if response.status_code not in RETRY_STATUSES or not retryable or attempt >= self.config.retries:
+                    return response
+            delay = self._backoff(attempt, response)
+            left = deadlines.remaining()
+            if left is not None and delay >= left:
+                if response is not None:
+                    return response
+                raise deadlines.DeadlineExceeded(f"No time left to retry {self.name} {method}.")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs: Any) -> AsyncIterator[httpx.Response]:
+        """Opens a streamed response; the body is read by the caller, so nothing is retried."""
+        method = method.upper()
+        await self._throttle()
+        timeout = self._timeout(method, kwargs.get("timeout"))
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        with metrics.track_upstream(self.name, method) as call:
+            async with self.client.stream(method, url, **kwargs) as response:
+                call.outcome = f"{response.status_code // 100}xx"
+                yield response
+
+    def _count_bytes(self, response: httpx.Response) -> None:
+        sent = response.request.headers.get("Content-Length")
+        if sent and sent.isdigit():
+            metrics.BYTES_TRANSFERRED.inc(int(sent), upstream=self.name, direction="sent")
+        metrics.BYTES_TRANSFERRED.inc(len(response.content), upstream=self.name, direction="received")
+
+    async def get(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def patch(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("PATCH", url, **kwargs)
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+
+class ObjectNotFound(Exception):
+    """The R2 key does not exist."""
+
+
+class AsyncR2:
+    """
+    The handful of S3 operations the API uses, over an ``UpstreamClient``. ``s3`` is the boto3
+    client from ``server.py``; only its signer is used. Raises ``ObjectNotFound`` for missing
+    keys and ``httpx.HTTPStatusError`` for other failures.
+    """
+
+    def __init__(self, s3: Any, bucket: Optional[str], client: UpstreamClient) -> None:
+        self.s3 = s3
+        self.bucket = bucket
+        self.client = client
+
+    def _url(self, operation: str, **params: Any) -> str:
+        if not self.bucket:
+            raise RuntimeError("R2 bucket configuration missing. Set R2_BUCKET_NAME.")
+        return self.s3.generate_presigned_url(operation, Params={"Bucket": self.bucket, **params}, ExpiresIn=300)
+
+    @staticmethod
+    def _raise_for_status(response: httpx.Response, key: str) -> None:
+        if response.status_code == 404:
+            raise ObjectNotFound(key)
+        response.raise_for_status()
+
+    @asynccontextmanager
+    async def open_object(self, key: str, headers: Optional[Dict[str, str]] = None) -> AsyncIterator[httpx.Response]:
+        """
+        Streams ``GET`` for ``key``. ``headers`` (``Range``, ``If-None-Match``...) are passed to R2
+        unsigned, and 206/304/416 responses are yielded for the caller to interpret.
+        """
+        async with self.client.stream("GET", self._url("get_object", Key=key), headers=headers or {}) as response:
+            if response.status_code == 404:
+                raise ObjectNotFound(key)
+            yield response
+
+    async def get_object(self, key: str) -> httpx.Response:
+        response = await self.client.get(self._url("get_object", Key=key))
+        self._raise_for_status(response, key)
+        return response
+
+    async def object_exists(self, key: str) -> bool:
+        response = await self.client.request("HEAD", self._url("head_object", Key=key))
+        if response.status_code == 404:
+            return False
+        response.raise_for_status()
+        return True
+
+    async def put_object(self, key: str, body: bytes, content_type: str, acl: Optional[str] = None) -> None:
+        params: Dict[str, Any] = {"Key": key, "ContentType": content_type}
+        headers = {"Content-Type": content_type}
+        if acl:
+            params["ACL"] = acl
+            headers["x-amz-acl"] = acl
+        response = await self.client.request("PUT", self._url("put_object", **params), content=body, headers=headers)
+        self._raise_for_status(response, key)
+
+    async def create_multipart_upload(self, key: str, content_type: str, acl: Optional[str] = None) -> str:
+        params: Dict[str, Any] = {"Key": key, "ContentType": content_type}
+        headers = {"Content-Type": content_type}
+        if acl:
+            params["ACL"] = acl
+            headers["x-amz-acl"] = acl
+        response = await self.client.post(self._url("create_multipart_upload", **params), headers=headers)
+        self._raise_for_status(response, key)
+        document = ElementTree.fromstring(response.content)
+        upload_id = document.findtext(f"{_S3_NAMESPACE}UploadId") or document.findtext("UploadId")
+        if not upload_id:
+            raise RuntimeError(f"R2 did not return an upload id for {key}.")
+        return upload_id
+
+    async def upload_part(self, key: str, upload_id: str, part_number: int, body: bytes) -> str:
+        url = self._url("upload_part", Key=key, UploadId=upload_id, PartNumber=part_number)
+        response = await self.client.request("PUT", url, content=body)
+        self._raise_for_status(response, key)
+        return response.headers["ETag"]
+
+    async def complete_multipart_upload(self, key: str, upload_id: str, parts: List[Dict[str, Any]]) -> None:
+        document = "".join(
+            f"<Part><PartNumber>{part['PartNumber']}</PartNumber><ETag>{part['ETag']}</ETag></Part>" for part in parts
+        )
+        response = await self.client.post(
+            self._url("complete_multipart_upload", Key=key, UploadId=upload_id),
+            content=f"<CompleteMultipartUpload>{document}</CompleteMultipartUpload>".encode("utf-8"),
+            headers={"Content-Type": "application/xml"},
+        )
+        self._raise_for_status(response, key)
+
+    async def abort_multipart_upload(self, key: str, upload_id: str) -> None:
+        response = await self.client.request("DELETE", self._url("abort_multipart_upload", Key=key, UploadId=upload_id))
+        self._raise_for_status(response, key)
+
+
+_clients: Dict[str, UpstreamClient] = {}
+
+# Like the other upstreams, only idempotent methods are retried: GET/PUT/DELETE, not the POSTs that
+# create and complete multipart uploads.
+R2_UPSTREAM = UpstreamConfig(pool_size=32, read_timeout=60.0)
+
+
+def client(upstream: str) -> UpstreamClient:
+    """Returns the process-wide async client for ``upstream`` (one of ``UPSTREAMS`` or ``"r2"``)."""
+    existing = _clients.get(upstream)
+    if existing is not None:
+        return existing
+    config = R2_UPSTREAM if upstream == "r2" else UPSTREAMS.get(upstream)
+    if config is None:
+        raise KeyError(f"Unknown upstream '{upstream}'.")
+    _clients[upstream] = UpstreamClient(upstream, _env_override(upstream, config))
+    return _clients[upstream]
+
+
+async def aclose_all() -> None:
+    """Closes every client; call on application shutdown."""
+    clients = list(_clients.values())
+    _clients.clear()
+    await asyncio.gather(*(upstream.aclose() for upstream in clients))
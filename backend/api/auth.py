@@ -0,0 +1,134 @@
+"""
+Local verification of Supabase access tokens.
+
+Tokens signed with the project's legacy HS256 secret are checked against ``SUPABASE_JWT_SECRET``;
+asymmetric tokens (RS256/ES256) are checked against the project's JWKS, which is fetched once
+and cached. Verified claims are cached by token hash until the token expires, so authenticated
+requests normally cost no upstream call. Anything we cannot verify locally (no secret
+configured, unknown key id, JWKS unreachable) falls back to the remote ``/auth/v1/user`` lookup.
+
+Local verification accepts a token until its ``exp`` even if the session was revoked
+server-side; Supabase access tokens are short-lived, which bounds that window.
+"""
+import hashlib
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, Optional
+
+import jwt
+from cache import TTLCache
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+SUPABASE_JWKS_URL = os.getenv(
+    "SUPABASE_JWKS_URL",
+    f"{SUPABASE_URL.rstrip('/')}/auth/v1/.well-known/jwks.json" if SUPABASE_URL else "",
+)
+SUPABASE_JWT_AUDIENCE = os.getenv("SUPABASE_JWT_AUDIENCE", "authenticated")
+AUTH_CLAIMS_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CLAIMS_CACHE_TTL_SECONDS", "300"))
+AUTH_CLAIMS_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CLAIMS_CACHE_MAX_ENTRIES", "4096"))
+AUTH_JWKS_CACHE_SECONDS = int(os.getenv("AUTH_JWKS_CACHE_SECONDS", "600"))
+
+ASYMMETRIC_ALGORITHMS = ("RS256", "ES256", "EdDSA")
+
+
+def _claims_to_user(claims: Dict[str, Any]) -> Dict[str, Any]:
+    """Shapes JWT claims like the ``/auth/v1/user`` response the routes already consume."""
+    return {
+        "id": claims.get("sub"),
+        "email": claims.get("email"),
+        "phone": claims.get("phone"),
+        "role": claims.get("role"),
+        "aud": claims.get("aud"),
+        "app_metadata": claims.get("app_metadata") or {},
+        "user_metadata": claims.get("user_metadata") or {},
+    }
+
+
+class TokenVerifier:
+    def __init__(
+        self,
+        *,
+        remote_lookup: Callable[[str], Dict[str, Any]],
+        jwt_secret: Optional[str] = SUPABASE_JWT_SECRET,
+        jwks_url: Optional[str] = SUPABASE_JWKS_URL,
+        audience: str = SUPABASE_JWT_AUDIENCE,
+    ) -> None:
+        self.remote_lookup = remote_lookup
+        self.jwt_secret = jwt_secret
+        self.audience = audience
+        self._jwks_client = (
+            jwt.PyJWKClient(jwks_url, cache_keys=True, lifespan=AUTH_JWKS_CACHE_SECONDS) if jwks_url else None
+        )
+        self._claims_cache = TTLCache(max_entries=AUTH_CLAIMS_CACHE_MAX_ENTRIES, ttl=AUTH_CLAIMS_CACHE_TTL_SECONDS)
+
+    def verify(self, access_token: str) -> Dict[str, Any]:
+        """
+        Returns the user for ``access_token``. Raises ``PermissionError`` for invalid or expired
+        tokens, mirroring ``_fetch_authenticated_user``.
+        """
+        cache_key = hashlib.sha256(access_token.encode("utf-8")).hexdigest()
+        cached = self._claims_cache.get(cache_key)
+        if cached is not None:
+            if cached["exp"] > time.time():
+                return cached["user"]
+            self._claims_cache.delete(cache_key)
+
+        claims = self._verify_locally(access_token)
+        if claims is None:
+            user = self.remote_lookup(access_token)
+            try:
+                exp = float(jwt.decode(access_token, options={"verify_signature": False}).get("exp", 0))
+            except jwt.PyJWTError:
+                exp = 0.0
+        else:
+            user = _claims_to_user(claims)
+            exp = float(claims["exp"])
+
+        ttl = min(AUTH_CLAIMS_CACHE_TTL_SECONDS, exp - time.time())
+        if ttl > 0 and user.get("id"):
+            self._claims_cache.set(cache_key, {"user": user, "exp": exp}, ttl=ttl)
+        return user
+
+    def _verify_locally(self, access_token: str) -> Optional[Dict[str, Any]]:
+        """Returns verified claims, or ``None`` when the token must be checked remotely."""
+        try:
+            header = jwt.get_unverified_header(access_token)
+        except jwt.PyJWTError as exc:
+            raise PermissionError("Invalid or expired session token.") from exc
+
+        algorithm = header.get("alg")
+        try:
+            if algorithm == "HS256":
+                if not self.jwt_secret:
+                    return None
+                key: Any = self.jwt_secret
+            elif algorithm in ASYMMETRIC_ALGORITHMS:
+                if not self._jwks_client:
+                    return None
+                key = self._jwks_client.get_signing_key_from_jwt(access_token)
+            else:
+                return None
+        except jwt.PyJWKClientError as exc:
+            logger.warning("JWKS lookup failed (%s); falling back to remote token verification.", exc)
+            return None
+
+        try:
+            return jwt.decode(
+                access_token,
+                key,
+                algorithms=[algorithm],
+                audience=self.audience,
+                options={"require": ["exp", "sub"]},
+            )
+        except jwt.PyJWTError as exc:
+            raise PermissionError("Invalid or expired session token.") from exc
+
+    def stats(self) -> Dict[str, Any]:
+        return self._claims_cache.stats()
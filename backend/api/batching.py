@@ -0,0 +1,127 @@
+"""
+Buffered batch writer.
+
+Callers ``submit`` items from any thread and get a ``Future`` back. A background thread hands
+the buffered items to ``write`` in batches of up to ``max_batch``, as soon as the batch is full
+or ``max_delay`` seconds after its oldest item arrived, whichever comes first. ``flush`` skips
+the wait for everything already buffered; ``close`` flushes and stops the thread.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import Future, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class BatchWriter:
+    """
+    ``write`` receives a list of items and returns one result per item, in order. A result that
+    is an ``Exception`` fails only that item's future; if ``write`` itself raises, every item
+    in the batch fails with that exception.
+    """
+
+    def __init__(
+        self,
+        write: Callable[[List[Any]], List[Any]],
+        *,
+        max_batch: int = 50,
+        max_delay: float = 0.1,
+        name: str = "batch-writer",
+    ) -> None:
+        if max_batch < 1:
+            raise ValueError("BatchWriter max_batch must be at least 1.")
+        self.write = write
+        self.max_batch = max_batch
+        self.max_delay = max(0.0, max_delay)
+        self.name = name
+        self._pending: List[Tuple[Any, Future, float]] = []
+        self._condition = threading.Condition()
+        self._flush_requested = False
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        self._batches = 0
+        self._items = 0
+
+    def submit(self, item: Any) -> Future:
+        future: Future = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError(f"{self.name} is closed.")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+            self._pending.append((item, future, time.monotonic()))
+            self._condition.notify_all()
+        return future
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """
+        Writes everything buffered now without waiting out ``max_delay``. Blocks until those items
+        are written or ``timeout`` passes; ``timeout=0`` only requests the flush.
+        """
+        with self._condition:
+            futures = [future for _, future, _ in self._pending]
+            if not futures:
+                return
+            self._flush_requested = True
+            self._condition.notify_all()
+        wait(futures, timeout=timeout)
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Flushes the buffer and stops the writer thread. Further ``submit`` calls raise."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                "batches": self._batches,
+                "items": self._items,
+                "pending": len(self._pending),
+                "avg_batch": round(self._items / self._batches, 2) if self._batches else 0.0,
+            }
+
+    def _next_batch(self) -> Optional[List[Tuple[Any, Future, float]]]:
+        with self._condition:
+            while not self._pending and not self._closed:
+                self._condition.wait()
+            if not self._pending:
+                return None
+            deadline = self._pending[0][2] + self.max_delay
+            while len(self._pending) < self.max_batch and not (self._closed or self._flush_requested):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch = self._pending[: self.max_batch]
+            del self._pending[: self.max_batch]
+            if not self._pending:
+                self._flush_requested = False
+            self._batches += 1
+            self._items += len(batch)
+            return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            items = [item for item, _, _ in batch]
+            try:
+                results = self.write(items)
+                if len(results) != len(items):
+                    raise RuntimeError(f"{self.name} write returned {len(results)} results for {len(items)} items.")
+            except Exception as exc:
+                logger.exception("%s failed to write a batch of %s items", self.name, len(items))
+                results = [exc] * len(items)
+            for (_, future, _), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
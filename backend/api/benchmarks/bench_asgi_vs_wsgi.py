@@ -0,0 +1,280 @@
+"""
+Load comparison of the Flask app (``server.py``) and the ASGI app (``asgi_app.py``).
+
+    python benchmarks/bench_asgi_vs_wsgi.py --requests 200 --concurrency 100
+    python benchmarks/bench_asgi_vs_wsgi.py --workloads process --wsgi-threads 16 --latency gemini=2
+
+Boots ``fake_upstreams``, seeds profiles and ingested media through ``server.py``, then serves
+each app from its own process on a local port: Flask behind a fixed pool of ``--wsgi-threads``
+worker threads (how gunicorn's gthread worker runs it) and the ASGI app under one uvicorn
+worker. Both get the same stream of ``--concurrency`` simultaneous requests per workload:
+
+- ``process``: ``POST /process/instagram-media`` with one ``media_id`` each (Gemini + ElevenLabs).
+- ``digest``: ``POST /email/digest-preview`` (one Supabase query).
+- ``media``: ``GET /transcribe-image?filename=`` proxied from R2.
+
+Reports requests/second, p50/p99 latency, errors, and the server process's peak RSS and thread
+count (read from ``/proc``, so Linux only).
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+
+from benchmarks.bench_end_to_end import _percentile  # noqa: E402
+from benchmarks.fake_upstreams import environment_for, parse_pairs, start_fake_upstreams  # noqa: E402
+
+
+def _serve_wsgi(port: int, threads: int) -> None:
+    """Child-process entry point: Flask on a bounded thread pool."""
+    from werkzeug.serving import BaseWSGIServer
+
+    import server
+
+    class PooledWSGIServer(BaseWSGIServer):
+        request_queue_size = 2048
+
+        def __init__(self) -> None:
+            super().__init__("127.0.0.1", port, server.app)
+            self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="wsgi")
+
+        def process_request(self, request: Any, client_address: Any) -> None:
+            self.pool.submit(self._handle, request, client_address)
+
+        def _handle(self, request: Any, client_address: Any) -> None:
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    PooledWSGIServer().serve_forever()
+
+
+def _free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def _proc_status(pid: int) -> Dict[str, int]:
+    values: Dict[str, int] = {}
+    try:
+        with open(f"/proc/{pid}/status", "r", encoding="utf-8") as handle:
+            for line in handle:
+                name, _, rest = line.partition(":")
+                if name in {"VmHWM", "Threads"}:
+                    values[name] = int(rest.split()[0])
+    except OSError:
+        pass
+    return values
+
+
+class _ThreadSampler:
+    """Polls the server's thread count while a workload runs (``/proc`` only has the current value)."""
+
+    def __init__(self, pid: int) -> None:
+        self.pid = pid
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.peak = max(self.peak, _proc_status(self.pid).get("Threads", 0))
+            self._stop.wait(0.1)
+
+    def __enter__(self) -> "_ThreadSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def _start_server(kind: str, port: int, threads: int, env: Dict[str, str]) -> subprocess.Popen:
+    if kind == "wsgi":
+        command = [sys.executable, os.path.abspath(__file__), "--serve-wsgi", str(port), "--wsgi-threads", str(threads)]
+    else:
+        command = [
+            sys.executable, "-m", "uvicorn", "asgi_app:app",
+            "--port", str(port), "--log-level", "warning", "--backlog", "2048",
+        ]
+    process = subprocess.Popen(command, cwd=API_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return process
+        except OSError:
+            if process.poll() is not None:
+                raise RuntimeError(f"{kind} server exited with {process.returncode}")
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"{kind} server did not start on port {port}")
+
+
+async def _drive(base_url: str, calls: List[Tuple[str, str, Dict[str, Any]]], concurrency: int) -> Dict[str, Any]:
+    import httpx
+
+    gate = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async with httpx.AsyncClient(
+        base_url=base_url,
+        timeout=httpx.Timeout(600.0),
+        limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+    ) as client:
+
+        async def one(method: str, path: str, options: Dict[str, Any]) -> None:
+            nonlocal errors
+            async with gate:
+                started = time.perf_counter()
+                try:
+                    response = await client.request(method, path, **options)
+                    body = response.json() if response.headers.get("content-type", "").startswith("application/json") else None
+                    failed = response.status_code >= 400 or bool(
+                        body and any("error" in entry for entry in body.get("processed", []))
+                    )
+                except Exception:
+                    failed = True
+                latencies.append(time.perf_counter() - started)
+                errors += int(failed)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(method, path, options) for method, path, options in calls))
+        wall = time.perf_counter() - started
+
+    return {
+        "requests": len(calls),
+        "errors": errors,
+        "wall_seconds": round(wall, 3),
+        "requests_per_second": round(len(calls) / wall, 2) if wall > 0 else 0.0,
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 1),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 1),
+    }
+
+
+def _seed(server: Any, profiles: int, posts: int) -> List[Dict[str, Any]]:
+    rows = [
+        {"id": f"00000000-0000-0000-0000-{index:012d}", "ig_username": f"student{index}", "is_parent_confirmed": True}
+        for index in range(profiles)
+    ]
+    server.supabase_session.post(f"{server.SUPABASE_REST_URL}/user_profiles", data=json.dumps(rows)).raise_for_status()
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda profile: server.ingest_profile_media(profile, profile["ig_username"], limit=posts), rows))
+    response = server.supabase_session.get(
+        f"{server.SUPABASE_REST_URL}/instagram_media", params={"select": "id,user_id,storage_key"}
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def _calls(workload: str, media: List[Dict[str, Any]], count: int) -> List[Tuple[str, str, Dict[str, Any]]]:
+    picks = [media[index % len(media)] for index in range(count)]
+    if workload == "process":
+        return [("POST", "/process/instagram-media", {"json": {"media_id": row["id"], "async": False}}) for row in picks]
+    if workload == "digest":
+        return [("POST", "/email/digest-preview", {"json": {"user_id": row["user_id"]}}) for row in picks]
+    if workload == "media":
+        return [("GET", "/transcribe-image", {"params": {"filename": row["storage_key"]}}) for row in picks]
+    raise ValueError(f"Unknown workload '{workload}'.")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200, help="Requests per workload and server.")
+    parser.add_argument("--concurrency", type=int, default=100, help="Requests in flight at once.")
+    parser.add_argument("--wsgi-threads", type=int, default=8, help="Flask worker threads.")
+    parser.add_argument("--workloads", default="process,digest,media")
+    parser.add_argument("--servers", default="wsgi,asgi")
+    parser.add_argument("--latency", type=parse_pairs, default={}, help="Per-upstream seconds, e.g. gemini=0.8")
+    parser.add_argument("--json-out", help="Write results to this file.")
+    parser.add_argument("--serve-wsgi", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_wsgi:
+        _serve_wsgi(args.serve_wsgi, max(1, args.wsgi_threads))
+        return
+
+    posts = 10
+    profiles = max(1, -(-args.requests // posts))
+    fakes, urls = start_fake_upstreams(args.latency, {}, posts_per_user=posts)
+    scratch = tempfile.mkdtemp(prefix="lifeloop-bench-")
+    os.environ.update(environment_for(urls))
+    os.environ.update(
+        {
+            "PROCESSING_MODE": "sync",
+            "JOBS_DB_PATH": os.path.join(scratch, "seed-jobs.sqlite3"),
+            "CAPTION_CACHE_DB_PATH": os.path.join(scratch, "seed-cache.sqlite3"),
+            "NARRATION_CACHE_DB_PATH": os.path.join(scratch, "seed-cache.sqlite3"),
+        }
+    )
+    for name in ("R2_PUBLIC_BASE_URL", "SUPABASE_JWT_SECRET", "RESEND_API_KEY"):
+        os.environ.pop(name, None)
+
+    results: List[Dict[str, Any]] = []
+    try:
+        import server  # noqa: E402  (reads the environment above at import)
+
+        media = _seed(server, profiles, posts)
+        for kind in [name.strip() for name in args.servers.split(",") if name.strip()]:
+            # Separate caches per server, so neither answers from captions the other produced.
+            env = {
+                **os.environ,
+                "JOBS_DB_PATH": os.path.join(scratch, f"{kind}-jobs.sqlite3"),
+                "CAPTION_CACHE_DB_PATH": os.path.join(scratch, f"{kind}-cache.sqlite3"),
+                "NARRATION_CACHE_DB_PATH": os.path.join(scratch, f"{kind}-cache.sqlite3"),
+            }
+            port = _free_port()
+            process = _start_server(kind, port, args.wsgi_threads, env)
+            try:
+                for workload in [name.strip() for name in args.workloads.split(",") if name.strip()]:
+                    calls = _calls(workload, media, args.requests)
+                    with _ThreadSampler(process.pid) as sampler:
+                        summary = asyncio.run(_drive(f"http://127.0.0.1:{port}", calls, args.concurrency))
+                    status = _proc_status(process.pid)
+                    results.append(
+                        {
+                            "server": kind,
+                            "workload": workload,
+                            **summary,
+                            "peak_rss_mb": round(status.get("VmHWM", 0) / 1024, 1),
+                            "peak_threads": sampler.peak,
+                        }
+                    )
+            finally:
+                process.terminate()
+                process.wait(timeout=10)
+    finally:
+        fakes.terminate()
+
+    print(f"requests={args.requests} concurrency={args.concurrency} wsgi_threads={args.wsgi_threads}")
+    for entry in results:
+        print(
+            f"{entry['server']:5} {entry['workload']:8} {entry['requests_per_second']:8.2f} req/s  "
+            f"p50 {entry['p50_ms']:8.1f} ms  p99 {entry['p99_ms']:8.1f} ms  errors {entry['errors']}  "
+            f"peak RSS {entry['peak_rss_mb']} MB  threads {entry['peak_threads']}"
+        )
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as handle:
+            json.dump(results, handle, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Digest rendering throughput.
+
+    python benchmarks/bench_digest.py --digests 2000 --items 5
+
+Renders ``--digests`` digests of ``--items`` memories with the original f-string renderer
+("before") and ``email_templates.render_digest_email`` ("after"), and reports renders/second.
+Digests are spread over ``--families`` students so the "after" run sees the same mix of
+fragment-cache hits as a real dispatch over many families.
+"""
+import argparse
+import datetime as dt
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from email_templates import render_digest_email  # noqa: E402
+
+
+def legacy_render_digest_email(media_items: List[Dict[str, Any]], student_name: Optional[str] = None) -> str:
+    """The renderer as it was before templates were precompiled, kept verbatim as the baseline."""
+    intro_name = student_name or "your student"
+    formatted_items = []
+
+    for item in media_items:
+        caption = item.get("caption") or "We captured a new moment for your family archive."
+        audio_url = item.get("audio_url")
+        image_fallback = item.get("source_url") or "#"
+        processed_at = item.get("processed_at") or item.get("created_at")
+        processed_label = ""
+        if processed_at:
+            try:
+                processed_dt = dt.datetime.fromisoformat(processed_at.replace("Z", "+00:00"))
+                processed_label = processed_dt.strftime("%B %d, %Y")
+            except ValueError:
+                processed_label = processed_at
+
+        audio_section = ""
+        if audio_url:
+            audio_section = f"""
+                <p style="margin: 8px 0;">
+                    <strong>Listen:</strong>
+                    <a href="{audio_url}" style="color: #6C63FF; text-decoration: underline;">Play narrated update</a>
+                </p>
+                <audio controls style="width: 100%; margin-top: 8px;">
+                    <source src="{audio_url}" type="audio/mpeg" />
+                    <p>Your device cannot play the audio clip. Download it <a href="{audio_url}">here</a>.</p>
+                </audio>
+            """
+
+        formatted_items.append(
+            f"""
+            <tr>
+                <td style="padding: 16px; border-bottom: 1px solid #e4e7ec;">
+                    <div style="font-size: 14px; color: #475467; margin-bottom: 8px;">{processed_label}</div>
+                    <img src="{image_fallback}" alt="Latest memory from {intro_name}" style="width: 100%; border-radius: 12px; object-fit: cover;" />
+                    <p style="margin: 12px 0; font-size: 16px; color: #344054; line-height: 1.4;">{caption}</p>
+                    {audio_section}
+                </td>
+            </tr>
+            """
+        )
+
+    memories_html = "".join(formatted_items) or """
+        <tr>
+            <td style="padding: 32px; text-align: center; color: #667085;">
+                No new memories yet, but we are ready to capture the next moment.
+            </td>
+        </tr>
+    """
+
+    return f"""
+    <!DOCTYPE html>
+    <html lang="en">
+    <head>
+        <meta charset="UTF-8" />
+        <title>LifeLoop Legacy Digest</title>
+        <meta name="viewport" content="width=device-width, initial-scale=1.0" />
+    </head>
+    <body style="margin: 0; background-color: #f4f5fb; font-family: 'Helvetica Neue', Arial, sans-serif;">
+        <table role="presentation" cellpadding="0" cellspacing="0" border="0" width="100%">
+            <tr>
+                <td align="center" style="padding: 32px;">
+                    <table width="600" cellpadding="0" cellspacing="0" style="background-color: #ffffff; border-radius: 16px; overflow: hidden;">
+                        <tr>
+                            <td style="padding: 32px; text-align: center; background-color: #6C63FF; color: #ffffff;">
+                                <h1 style="margin: 0; font-size: 28px;">LifeLoop Legacy Digest</h1>
+                                <p style="margin: 12px 0 0; font-size: 16px;">
+                                    Fresh highlights from {intro_name}'s story so everyone stays connected.
+                                </p>
+                            </td>
+                        </tr>
+                        {memories_html}
+                        <tr>
+                            <td style="padding: 24px; background-color: #f8f9ff; color: #475467; font-size: 14px;">
+                                <p style="margin: 0 0 12px;">
+                                    LifeLoop bridges students, parents, and grandparents with narrated memories, AI captions, and keepsakes.
+                                </p>
+                                <p style="margin: 0; font-size: 13px; color: #98A2B3;">
+                                    Future roadmap: printable photobooks, facial recognition tagging, and automated Instagram archive imports.
+                                </p>
+                            </td>
+                        </tr>
+                    </table>
+                </td>
+            </tr>
+        </table>
+    </body>
+    </html>
+    """
+
+
+def build_workload(digests: int, items: int, families: int) -> List[Dict[str, Any]]:
+    base = dt.datetime(2025, 1, 1)
+    workload = []
+    for index in range(digests):
+        family = index % families
+        media = [
+            {
+                "id": f"{family}-{position}",
+                "caption": f"Family {family} memory {position}: a sunny afternoon on the quad with friends & coffee.",
+                "source_url": f"https://cdn.example.com/instagram/{family}/{position}.jpg",
+                "audio_url": f"https://cdn.example.com/narrations/{family}-{position}.mp3" if position % 2 else None,
+                "processed_at": (base + dt.timedelta(hours=family * items + position)).isoformat() + "Z",
+            }
+            for position in range(items)
+        ]
+        workload.append({"student_name": f"Student {family}", "media": media})
+    return workload
+
+
+def measure(render: Callable[..., str], workload: List[Dict[str, Any]], repeat: int) -> float:
+    """Best renders/second over ``repeat`` passes; later passes run against a warm fragment cache."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for digest in workload:
+            render(digest["media"], student_name=digest["student_name"])
+        best = min(best, time.perf_counter() - started)
+    return len(workload) / best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--digests", type=int, default=2000)
+    parser.add_argument("--items", type=int, default=5)
+    parser.add_argument("--families", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    workload = build_workload(args.digests, args.items, max(1, args.families))
+    before = measure(legacy_render_digest_email, workload, args.repeat)
+    after = measure(render_digest_email, workload, args.repeat)
+    print(f"digests={args.digests} items={args.items} families={args.families} repeat={args.repeat}")
+    print(f"before: {before:,.0f} renders/s")
+    print(f"after:  {after:,.0f} renders/s ({after / before:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
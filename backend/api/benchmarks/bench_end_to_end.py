@@ -0,0 +1,195 @@
+"""
+End-to-end ingest and processing throughput against local fake upstreams.
+
+    python benchmarks/bench_end_to_end.py --profiles 20 --posts 12 --concurrency 4
+    python benchmarks/bench_end_to_end.py --latency gemini=0.2 --error-rate gemini=0.05 --json-out run.json
+    python benchmarks/bench_end_to_end.py --baseline run.json --max-regression 0.15
+
+Boots ``fake_upstreams`` in a child process, points ``server.py`` at it through the usual
+environment variables and drives two workloads through the Flask routes:
+
+- ``ingest``: ``POST /ingest/instagram`` once per profile, ``--concurrency`` requests at a time.
+- ``process``: ``POST /process/instagram-media`` in batches of ``--batch`` until no
+  unprocessed rows remain.
+
+Reports items/second, p50/p99 request latency and peak RSS of the benchmark process (the fakes
+run in their own process). With ``--baseline``, exits non-zero when items/second dropped or
+p99 latency grew by more than ``--max-regression``.
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_upstreams import environment_for, parse_pairs, start_fake_upstreams  # noqa: E402
+
+
+def _percentile(samples: List[float], fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def _summarise(name: str, items: int, errors: int, latencies: List[float], wall: float) -> Dict[str, Any]:
+    return {
+        "workload": name,
+        "requests": len(latencies),
+        "items": items,
+        "errors": errors,
+        "wall_seconds": round(wall, 3),
+        "items_per_second": round(items / wall, 2) if wall > 0 else 0.0,
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 1),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 1),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def _timed(call: Callable[[], Any]) -> Tuple[Any, float]:
+    started = time.perf_counter()
+    result = call()
+    return result, time.perf_counter() - started
+
+
+def run_ingest(server: Any, profiles: List[Dict[str, Any]], posts: int, concurrency: int) -> Dict[str, Any]:
+    def ingest(profile: Dict[str, Any]) -> Tuple[Any, float]:
+        client = server.app.test_client()
+        return _timed(
+            lambda: client.post(
+                "/ingest/instagram",
+                json={"profile_id": profile["id"], "instagram_username": profile["ig_username"], "limit": posts},
+            )
+        )
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(ingest, profiles))
+    wall = time.perf_counter() - started
+
+    items = sum(response.get_json().get("inserted", 0) for response, _ in outcomes if response.status_code == 200)
+    errors = sum(1 for response, _ in outcomes if response.status_code != 200)
+    return _summarise("ingest", items, errors, [seconds for _, seconds in outcomes], wall)
+
+
+def run_process(server: Any, batch: int) -> Dict[str, Any]:
+    client = server.app.test_client()
+    latencies: List[float] = []
+    items = errors = 0
+    started = time.perf_counter()
+    while True:
+        response, seconds = _timed(
+            lambda: client.post("/process/instagram-media", json={"limit": batch, "async": False})
+        )
+        latencies.append(seconds)
+        body = response.get_json() or {}
+        processed = body.get("processed", [])
+        if response.status_code != 200 or not processed:
+            errors += int(response.status_code != 200)
+            break
+        failed = sum(1 for entry in processed if "error" in entry)
+        items += len(processed) - failed
+        errors += failed
+        if failed == len(processed):
+            break
+    wall = time.perf_counter() - started
+    return _summarise("process", items, errors, latencies, wall)
+
+
+def _regressions(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float) -> List[str]:
+    previous = {entry["workload"]: entry for entry in baseline}
+    problems = []
+    for current in results:
+        before = previous.get(current["workload"])
+        if not before:
+            continue
+        if current["items_per_second"] < before["items_per_second"] * (1 - tolerance):
+            problems.append(
+                f"{current['workload']}: items/s {current['items_per_second']} < baseline {before['items_per_second']}"
+            )
+        if before["p99_ms"] and current["p99_ms"] > before["p99_ms"] * (1 + tolerance):
+            problems.append(f"{current['workload']}: p99 {current['p99_ms']}ms > baseline {before['p99_ms']}ms")
+    return problems
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--profiles", type=int, default=20)
+    parser.add_argument("--posts", type=int, default=12, help="Posts ingested per profile (max 40).")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent ingest requests.")
+    parser.add_argument("--batch", type=int, default=10, help="Records per /process/instagram-media call.")
+    parser.add_argument("--latency", type=parse_pairs, default={}, help="Per-upstream seconds, e.g. gemini=0.8")
+    parser.add_argument("--error-rate", type=parse_pairs, default={}, help="Per-upstream 503 rate, e.g. gemini=0.05")
+    parser.add_argument("--workloads", default="ingest,process")
+    parser.add_argument("--json-out", help="Write results to this file.")
+    parser.add_argument("--baseline", help="Compare against results written by --json-out.")
+    parser.add_argument("--max-regression", type=float, default=0.15)
+    args = parser.parse_args()
+
+    fakes, urls = start_fake_upstreams(args.latency, args.error_rate, posts_per_user=max(args.posts, 1))
+    scratch = tempfile.mkdtemp(prefix="lifeloop-bench-")
+    os.environ.update(environment_for(urls))
+    os.environ.update(
+        {
+            "PROCESSING_MODE": "sync",
+            "JOBS_DB_PATH": os.path.join(scratch, "jobs.sqlite3"),
+            "CAPTION_CACHE_DB_PATH": os.path.join(scratch, "cache.sqlite3"),
+            "NARRATION_CACHE_DB_PATH": os.path.join(scratch, "cache.sqlite3"),
+        }
+    )
+    for name in ("R2_PUBLIC_BASE_URL", "SUPABASE_JWT_SECRET", "RESEND_API_KEY"):
+        os.environ.pop(name, None)
+
+    import server  # noqa: E402  (reads the environment above at import)
+
+    profiles = [
+        {"id": f"00000000-0000-0000-0000-{index:012d}", "ig_username": f"student{index}", "is_parent_confirmed": True}
+        for index in range(args.profiles)
+    ]
+    server.supabase_session.post(f"{server.SUPABASE_REST_URL}/user_profiles", data=json.dumps(profiles)).raise_for_status()
+
+    results: List[Dict[str, Any]] = []
+    workloads = {name.strip() for name in args.workloads.split(",")}
+    try:
+        if "ingest" in workloads:
+            results.append(run_ingest(server, profiles, min(args.posts, 40), max(1, args.concurrency)))
+        if "process" in workloads:
+            results.append(run_process(server, max(1, args.batch)))
+    finally:
+        fakes.terminate()
+
+    print(f"profiles={args.profiles} posts={args.posts} concurrency={args.concurrency} batch={args.batch}")
+    for entry in results:
+        print(
+            f"{entry['workload']:8} {entry['items']:6d} items  {entry['items_per_second']:8.2f} items/s  "
+            f"p50 {entry['p50_ms']:8.1f} ms  p99 {entry['p99_ms']:8.1f} ms  "
+            f"errors {entry['errors']}  peak RSS {entry['peak_rss_mb']} MB"
+        )
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as handle:
+            json.dump(results, handle, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as handle:
+            problems = _regressions(results, json.load(handle), args.max_regression)
+        for problem in problems:
+            print(f"REGRESSION {problem}")
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
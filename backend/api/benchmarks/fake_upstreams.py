@@ -0,0 +1,615 @@
+"""
+Local stand-ins for the services the API talks to, for offline benchmarks.
+
+    python benchmarks/fake_upstreams.py --latency gemini=0.8,elevenlabs=1.2 --error-rate gemini=0.05
+
+Starts one HTTP server per upstream and prints the environment variables that point the API
+at them:
+
+- ``supabase``: in-memory PostgREST subset (``eq``/``neq``/``gt``/``gte``/``lt``/``lte``/``in``/
+  ``is`` filters and ``or=(...)``, ``order``, ``limit``, ``select``, upserts with ``on_conflict``,
+  ``PATCH``, and the ``rpc/`` functions in ``docs/supabase.sql``).
+- ``r2``: path-style S3 subset (put/get/head with ``Range`` and ``If-None-Match``, multipart
+  upload, ``NoSuchKey``).
+- ``rapidapi``: a deterministic paginated feed of ``--posts-per-user`` posts per username.
+- ``cdn``: JPEG images, unique per URL so caption caching does not flatter the numbers.
+- ``gemini`` and ``elevenlabs``: canned caption and audio responses (``/stream`` TTS is sent chunked).
+
+``--latency`` adds a fixed delay per request (seconds, with +/-20% jitter) and ``--error-rate``
+answers that fraction of requests with 503. ``start_fake_upstreams`` runs the servers in a
+child process so they do not count towards the benchmarked process's CPU or memory.
+"""
+import argparse
+import datetime as dt
+import hashlib
+import io
+import itertools
+import json
+import multiprocessing
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+UPSTREAM_NAMES = ("supabase", "r2", "rapidapi", "cdn", "gemini", "elevenlabs")
+DEFAULT_LATENCY = {
+    "supabase": 0.02,
+    "r2": 0.02,
+    "rapidapi": 0.3,
+    "cdn": 0.05,
+    "gemini": 0.8,
+    "elevenlabs": 1.2,
+}
+BUCKET = "lifeloop-bench"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    upstream = ""
+    latency = 0.0
+    error_rate = 0.0
+    state: Dict[str, Any] = {}
+
+    def log_message(self, *_: Any) -> None:
+        pass
+
+    def _inject(self) -> bool:
+        if self.latency:
+            time.sleep(self.latency * random.uniform(0.8, 1.2))
+        if self.error_rate and random.random() < self.error_rate:
+            self._body()
+            self._send(503, b'{"error":"injected"}', "application/json")
+            return True
+        return False
+
+    def _body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send(self, status: int, body: bytes = b"", content_type: str = "application/json", **headers: str) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name.replace("_", "-"), value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _json(self, status: int, payload: Any) -> None:
+        self._send(status, json.dumps(payload).encode("utf-8"))
+
+    def _dispatch(self) -> None:
+        if self._inject():
+            return
+        handler = getattr(self, f"handle_{self.command.lower()}", None)
+        if handler is None:
+            self._body()
+            self._send(405)
+            return
+        handler()
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_HEAD = _dispatch
+
+
+# --- Supabase PostgREST ---
+def _split_in_list(raw: str) -> List[str]:
+    values, current, quoted, escaped = [], "", False, False
+    for char in raw:
+        if escaped:
+            current += char
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif char == '"':
+            quoted = not quoted
+        elif char == "," and not quoted:
+            values.append(current)
+            current = ""
+        else:
+            current += char
+    values.append(current)
+    return values
+
+
+def _matches(row: Dict[str, Any], column: str, expression: str) -> bool:
+    negate = expression.startswith("not.")
+    if negate:
+        expression = expression[4:]
+    operator, _, operand = expression.partition(".")
+    value = row.get(column)
+    if operator == "is":
+        result = value is None if operand == "null" else str(value).lower() == operand
+    elif operator == "in":
+        result = value is not None and str(value) in _split_in_list(operand.strip("()"))
+    elif value is None:
+        result = False
+    else:
+        current = str(value).lower() if isinstance(value, bool) else str(value)
+        result = {
+            "eq": current == operand,
+            "neq": current != operand,
+            "gt": current > operand,
+            "gte": current >= operand,
+            "lt": current < operand,
+            "lte": current <= operand,
+        }.get(operator, False)
+    return result != negate
+
+
+def _leased(row: Dict[str, Any], now: str) -> bool:
+    return bool(row.get("lease_owner")) and (row.get("lease_expires_at") or "") > now
+
+
+class _PostgRESTHandler(_Handler):
+    def _table(self) -> Tuple[Optional[str], Dict[str, List[str]]]:
+        parts = urlsplit(self.path)
+        match = re.match(r"^/rest/v1/([A-Za-z0-9_]+)$", parts.path)
+        return (match.group(1) if match else None), parse_qs(parts.query, keep_blank_values=True)
+
+    def _filtered(self, rows: List[Dict[str, Any]], query: Dict[str, List[str]]) -> List[Dict[str, Any]]:
+        reserved = {"select", "order", "limit", "offset", "on_conflict"}
+        for column, expressions in query.items():
+            if column in reserved:
+                continue
+            for expression in expressions:
+                if column == "or":
+                    alternatives = [
+                        alternative.split(".", 1) for alternative in _split_in_list(expression.strip("()"))
+                    ]
+                    rows = [
+                        row for row in rows if any(_matches(row, name, clause) for name, clause in alternatives)
+                    ]
+                    continue
+                rows = [row for row in rows if _matches(row, column, expression)]
+        return rows
+
+    def handle_get(self) -> None:
+        table, query = self._table()
+        if table is None:
+            self._json(404, {"message": "not found"})
+            return
+        with self.state["lock"]:
+            rows = [dict(row) for row in self.state["tables"].get(table, [])]
+        rows = self._filtered(rows, query)
+        for clause in reversed(query.get("order", [""])[0].split(",")):
+            if not clause:
+                continue
+            column, _, direction = clause.partition(".")
+            descending = direction.startswith("desc")
+            present = sorted(
+                (row for row in rows if row.get(column) is not None),
+                key=lambda row: str(row[column]),
+                reverse=descending,
+            )
+            rows = present + [row for row in rows if row.get(column) is None]
+        if "limit" in query:
+            rows = rows[: int(query["limit"][0])]
+        select = query.get("select", ["*"])[0]
+        if select and select != "*":
+            columns = select.split(",")
+            rows = [{column: row.get(column) for column in columns} for row in rows]
+        self._json(200, rows)
+
+    def _claim_instagram_media(self, args: Dict[str, Any]) -> List[Dict[str, Any]]:
+        now = dt.datetime.utcnow().isoformat()
+        expires_at = (dt.datetime.utcnow() + dt.timedelta(seconds=args.get("p_lease_seconds", 600))).isoformat()
+        cap = args.get("p_max_per_user", 2)
+        with self.state["lock"]:
+            rows = self.state["tables"].get("instagram_media", [])
+            leased: Dict[str, int] = {}
+            processed = set()
+            for row in rows:
+                if _leased(row, now):
+                    leased[row.get("user_id")] = leased.get(row.get("user_id"), 0) + 1
+                if row.get("processed_at") is not None:
+                    processed.add(row.get("user_id"))
+            candidates = [
+                row
+                for row in rows
+                if (not args.get("p_media_id") or row["id"] == args["p_media_id"])
+                and (not args.get("p_only_unprocessed", True) or row.get("processed_at") is None)
+                and (not row.get("lease_expires_at") or row["lease_expires_at"] <= now)
+            ]
+            candidates.sort(key=lambda row: row.get("created_at") or "", reverse=True)
+            ranked = []
+            for row in candidates:
+                user_id = row.get("user_id")
+                leased[user_id] = leased.get(user_id, 0) + 1
+                if args.get("p_media_id") or cap is None or leased[user_id] <= cap:
+                    ranked.append((user_id not in processed, leased[user_id], row))
+            ranked.sort(key=lambda entry: (not entry[0], entry[1]))  # stable: newest first within a slot
+            claimed = [row for _, _, row in ranked[: args.get("p_limit", 5)]]
+            for row in claimed:
+                row.update(lease_owner=args["p_owner"], lease_expires_at=expires_at)
+            return [dict(row) for row in claimed]
+
+    def _media_processing_backlog(self, _args: Dict[str, Any]) -> List[Dict[str, Any]]:
+        now = dt.datetime.utcnow().isoformat()
+        backlog: Dict[str, Dict[str, Any]] = {}
+        with self.state["lock"]:
+            rows = self.state["tables"].get("instagram_media", [])
+            processed = {row.get("user_id") for row in rows if row.get("processed_at") is not None}
+            for row in rows:
+                if row.get("processed_at") is not None:
+                    continue
+                entry = backlog.setdefault(
+                    row.get("user_id"),
+                    {
+                        "user_id": row.get("user_id"),
+                        "unprocessed": 0,
+                        "leased": 0,
+                        "oldest_unprocessed_at": row.get("created_at"),
+                        "first_time": row.get("user_id") not in processed,
+                    },
+                )
+                entry["unprocessed"] += 1
+                entry["leased"] += int(_leased(row, now))
+                entry["oldest_unprocessed_at"] = min(entry["oldest_unprocessed_at"] or "", row.get("created_at") or "")
+        return sorted(backlog.values(), key=lambda entry: entry["oldest_unprocessed_at"] or "")
+
+    def _recent_media_for_users(self, args: Dict[str, Any]) -> List[Dict[str, Any]]:
+        user_ids = set(args.get("p_user_ids") or [])
+        columns = ("id", "user_id", "caption", "audio_url", "source_url", "processed_at", "created_at")
+        with self.state["lock"]:
+            rows = [
+                {column: row.get(column) for column in columns}
+                for row in self.state["tables"].get("instagram_media", [])
+                if row.get("user_id") in user_ids
+                and (row.get("processed_at") or "") >= args["p_since"]
+                and (not args.get("p_until") or row["processed_at"] < args["p_until"])
+            ]
+        rows.sort(key=lambda row: row["processed_at"], reverse=True)
+        counts: Dict[str, int] = {}
+        recent = []
+        for row in rows:
+            counts[row["user_id"]] = counts.get(row["user_id"], 0) + 1
+            if counts[row["user_id"]] <= args.get("p_per_user", 5):
+                recent.append(row)
+        return sorted(recent, key=lambda row: row["user_id"])
+
+    def _update_instagram_media_results(self, args: Dict[str, Any]) -> List[Dict[str, Any]]:
+        with self.state["lock"]:
+            rows = {row["id"]: row for row in self.state["tables"].get("instagram_media", [])}
+            updated = []
+            for result in args.get("p_rows") or []:
+                row = rows.get(result["id"])
+                if row is not None:
+                    row.update(result)
+                    updated.append(dict(row))
+        return updated
+
+    def handle_post(self) -> None:
+        rpc = re.match(r"^/rest/v1/rpc/([A-Za-z0-9_]+)$", urlsplit(self.path).path)
+        if rpc:
+            function = {
+                "claim_instagram_media": self._claim_instagram_media,
+                "media_processing_backlog": self._media_processing_backlog,
+                "recent_media_for_users": self._recent_media_for_users,
+                "update_instagram_media_results": self._update_instagram_media_results,
+            }.get(rpc.group(1))
+            if function is None:
+                self._json(404, {"message": "function not found"})
+                return
+            self._json(200, function(json.loads(self._body() or b"{}")))
+            return
+        table, query = self._table()
+        payload = json.loads(self._body() or b"[]")
+        if table is None:
+            self._json(404, {"message": "not found"})
+            return
+        incoming = payload if isinstance(payload, list) else [payload]
+        conflict_columns = [c for c in query.get("on_conflict", [""])[0].split(",") if c]
+        prefer = self.headers.get("Prefer", "")
+        created: List[Dict[str, Any]] = []
+        with self.state["lock"]:
+            rows = self.state["tables"].setdefault(table, [])
+            for item in incoming:
+                row = {"id": str(uuid.uuid4()), "created_at": dt.datetime.utcnow().isoformat(), **item}
+                keys = conflict_columns or ["id"]
+                existing = next((r for r in rows if all(r.get(k) == row.get(k) for k in keys)), None)
+                if existing is not None:
+                    if "resolution=ignore-duplicates" in prefer:
+                        continue
+                    if "resolution=merge-duplicates" in prefer:
+                        existing.update(item)
+                        created.append(dict(existing))
+                        continue
+                    self._json(409, {"code": "23505", "message": "duplicate key value"})
+                    return
+                rows.append(row)
+                created.append(dict(row))
+        self._json(201, created if "return=representation" in prefer else [])
+
+    def handle_patch(self) -> None:
+        table, query = self._table()
+        updates = json.loads(self._body() or b"{}")
+        with self.state["lock"]:
+            rows = self.state["tables"].get(table or "", [])
+            matched = self._filtered(rows, query)
+            for row in matched:
+                row.update(updates)
+            result = [dict(row) for row in matched]
+        self._json(200, result)
+
+
+# --- R2 / S3 ---
+class _S3Handler(_Handler):
+    def _key(self) -> Tuple[str, Dict[str, List[str]]]:
+        parts = urlsplit(self.path)
+        path = unquote(parts.path).lstrip("/")
+        _, _, key = path.partition("/")
+        return key, parse_qs(parts.query, keep_blank_values=True)
+
+    def _no_such_key(self) -> None:
+        body = b"<?xml version='1.0' encoding='UTF-8'?><Error><Code>NoSuchKey</Code><Message>missing</Message></Error>"
+        self._send(404, body, "application/xml")
+
+    def handle_put(self) -> None:
+        key, query = self._key()
+        body = self._body()
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+        with self.state["lock"]:
+            if "uploadId" in query:
+                self.state["uploads"][query["uploadId"][0]][int(query["partNumber"][0])] = body
+            else:
+                self.state["objects"][key] = (body, self.headers.get("Content-Type", "binary/octet-stream"))
+        self._send(200, b"", "application/xml", ETag=etag)
+
+    def handle_post(self) -> None:
+        key, query = self._key()
+        self._body()
+        if "uploads" in query:
+            upload_id = uuid.uuid4().hex
+            with self.state["lock"]:
+                self.state["uploads"][upload_id] = {"_content_type": self.headers.get("Content-Type", "binary/octet-stream")}
+            body = (
+                "<?xml version='1.0' encoding='UTF-8'?><InitiateMultipartUploadResult>"
+                f"<Bucket>{BUCKET}</Bucket><Key>{key}</Key><UploadId>{upload_id}</UploadId>"
+                "</InitiateMultipartUploadResult>"
+            )
+            self._send(200, body.encode("utf-8"), "application/xml")
+            return
+        upload_id = query["uploadId"][0]
+        with self.state["lock"]:
+            parts = self.state["uploads"].pop(upload_id)
+            content_type = parts.pop("_content_type")
+            self.state["objects"][key] = (b"".join(parts[number] for number in sorted(parts)), content_type)
+        body = (
+            "<?xml version='1.0' encoding='UTF-8'?><CompleteMultipartUploadResult>"
+            f"<Bucket>{BUCKET}</Bucket><Key>{key}</Key><ETag>\"{upload_id}\"</ETag>"
+            "</CompleteMultipartUploadResult>"
+        )
+        self._send(200, body.encode("utf-8"), "application/xml")
+
+    def handle_delete(self) -> None:
+        key, query = self._key()
+        with self.state["lock"]:
+            if "uploadId" in query:
+                self.state["uploads"].pop(query["uploadId"][0], None)
+            else:
+                self.state["objects"].pop(key, None)
+        self._send(204)
+
+    def handle_get(self) -> None:
+        key, _ = self._key()
+        with self.state["lock"]:
+            stored = self.state["objects"].get(key)
+        if stored is None:
+            self._no_such_key()
+            return
+        body, content_type = stored
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+        if self.headers.get("If-None-Match") == etag:
+            self._send(304, b"", content_type, ETag=etag)
+            return
+        match = re.match(r"^bytes=(\d*)-(\d*)$", self.headers.get("Range", ""))
+        if match:
+            start = int(match.group(1)) if match.group(1) else max(0, len(body) - int(match.group(2)))
+            end = int(match.group(2)) if match.group(1) and match.group(2) else len(body) - 1
+            if start >= len(body):
+                self._send(416, b"<Error><Code>InvalidRange</Code></Error>", "application/xml")
+                return
+            end = min(end, len(body) - 1)
+            self._send(206, body[start : end + 1], content_type, ETag=etag, Content_Range=f"bytes {start}-{end}/{len(body)}")
+            return
+        self._send(200, body, content_type, ETag=etag)
+
+    handle_head = handle_get
+
+
+# --- RapidAPI Instagram feed ---
+class _RapidAPIHandler(_Handler):
+    def handle_get(self) -> None:
+        query = parse_qs(urlsplit(self.path).query)
+        username = query.get("username", ["student"])[0]
+        amount = int(query.get("amount", ["12"])[0])
+        offset = int(query.get("pagination_token", ["0"])[0])
+        total = self.state["posts_per_user"]
+        base = 1_700_000_000
+        items = [
+            {
+                "id": f"{username}_{index}",
+                "image_url": f"{self.state['cdn_url']}/img/{username}/{index}.jpg",
+                "taken_at": base + index * 3600,
+                "caption_text": f"Post {index} from {username}",
+            }
+            for index in range(total - 1 - offset, max(-1, total - 1 - offset - amount), -1)
+        ]
+        next_offset = offset + len(items)
+        self._json(200, {"data": {"items": items}, "pagination_token": str(next_offset) if next_offset < total else None})
+
+
+# --- Instagram CDN ---
+class _CDNHandler(_Handler):
+    def handle_get(self) -> None:
+        from PIL import Image, ImageDraw
+
+        digest = hashlib.sha256(self.path.encode("utf-8")).digest()
+        width, height = self.state["image_size"]
+        image = Image.new("RGB", (width, height), tuple(digest[:3]))
+        draw = ImageDraw.Draw(image)
+        for index in range(0, 24, 3):
+            x, y = digest[index] * width // 256, digest[index + 1] * height // 256
+            draw.ellipse((x, y, x + width // 4, y + height // 4), fill=tuple(digest[index : index + 3]))
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=90)
+        self._send(200, buffer.getvalue(), "image/jpeg")
+
+
+# --- Gemini ---
+class _GeminiHandler(_Handler):
+    def handle_post(self) -> None:
+        self._body()
+        number = next(self.state["counter"])
+        caption = f"A bright afternoon on the quad, friends laughing over coffee (moment {number})."
+        self._json(
+            200,
+            {
+                "candidates": [
+                    {
+                        "content": {"parts": [{"text": caption}]},
+                        "safetyRatings": [{"probability": "NEGLIGIBLE"}, {"probability": "LOW"}],
+                    }
+                ]
+            },
+        )
+
+
+# --- ElevenLabs ---
+class _ElevenLabsHandler(_Handler):
+    def handle_post(self) -> None:
+        self._body()
+        audio = self.state["audio"]
+        if not urlsplit(self.path).path.endswith("/stream"):
+            self._send(200, audio, "audio/mpeg")
+            return
+        # Like the streaming TTS endpoint: chunked, with no Content-Length up front.
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/mpeg")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for start in range(0, len(audio), 16 * 1024):
+            chunk = audio[start : start + 16 * 1024]
+            self.wfile.write(f"{len(chunk):X}\r\n".encode("ascii") + chunk + b"\r\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+_HANDLERS = {
+    "supabase": _PostgRESTHandler,
+    "r2": _S3Handler,
+    "rapidapi": _RapidAPIHandler,
+    "cdn": _CDNHandler,
+    "gemini": _GeminiHandler,
+    "elevenlabs": _ElevenLabsHandler,
+}
+
+
+def _serve(
+    latency: Dict[str, float],
+    error_rate: Dict[str, float],
+    options: Dict[str, Any],
+    ready: Any,
+) -> None:
+    servers = {}
+    for name in UPSTREAM_NAMES:
+        handler = type(f"{name}_handler", (_HANDLERS[name],), {})
+        handler.upstream = name
+        handler.latency = latency.get(name, 0.0)
+        handler.error_rate = error_rate.get(name, 0.0)
+        servers[name] = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        servers[name].daemon_threads = True
+
+    cdn_url = f"http://127.0.0.1:{servers['cdn'].server_port}"
+    shared = {
+        "lock": threading.Lock(),
+        "tables": {},
+        "objects": {},
+        "uploads": {},
+        "counter": itertools.count(1),
+        "cdn_url": cdn_url,
+        "posts_per_user": options.get("posts_per_user", 24),
+        "image_size": tuple(options.get("image_size", (1600, 1200))),
+        "audio": bytes(options.get("audio_bytes", 48 * 1024)),
+    }
+    for name, server in servers.items():
+        server.RequestHandlerClass.state = shared
+        threading.Thread(target=server.serve_forever, name=f"fake-{name}", daemon=True).start()
+
+    ready.send({name: f"http://127.0.0.1:{server.server_port}" for name, server in servers.items()})
+    threading.Event().wait()
+
+
+def environment_for(urls: Dict[str, str]) -> Dict[str, str]:
+    """Environment variables that point ``server.py`` at the fake upstreams."""
+    return {
+        "SUPABASE_URL": urls["supabase"],
+        "SUPABASE_SERVICE_KEY": "bench-service-key",
+        "R2_ENDPOINT_URL": urls["r2"],
+        "R2_BUCKET_NAME": BUCKET,
+        "AWS_ACCESS_KEY_ID": "bench",
+        "AWS_SECRET_ACCESS_KEY": "bench-secret",
+        "AWS_DEFAULT_REGION": "auto",
+        "RAPIDAPI_KEY": "bench",
+        "RAPIDAPI_INSTAGRAM_URL": f"{urls['rapidapi']}/user_posts",
+        "RAPIDAPI_PAGINATION_PARAM": "pagination_token",
+        "GEMINI_API_KEY": "bench",
+        "GEMINI_API_ENDPOINT": f"{urls['gemini']}/v1beta/models/bench:generateContent",
+        "ELEVENLABS_API_KEY": "bench",
+        "ELEVENLABS_API_BASE_URL": urls["elevenlabs"],
+        "ELEVENLABS_VOICE_ID": "bench-voice",
+    }
+
+
+def start_fake_upstreams(
+    latency: Optional[Dict[str, float]] = None,
+    error_rate: Optional[Dict[str, float]] = None,
+    **options: Any,
+) -> Tuple[multiprocessing.Process, Dict[str, str]]:
+    """Starts the fakes in a daemon child process and returns it with each upstream's base URL."""
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(
+        target=_serve,
+        args=({**DEFAULT_LATENCY, **(latency or {})}, error_rate or {}, options, sender),
+        daemon=True,
+    )
+    process.start()
+    if not receiver.poll(30):
+        process.terminate()
+        raise RuntimeError("Fake upstreams did not start.")
+    return process, receiver.recv()
+
+
+def parse_pairs(raw: str) -> Dict[str, float]:
+    """Parses ``name=value,name=value`` into a dict, rejecting unknown upstream names."""
+    pairs: Dict[str, float] = {}
+    for item in filter(None, (part.strip() for part in raw.split(","))):
+        name, _, value = item.partition("=")
+        if name not in UPSTREAM_NAMES:
+            raise argparse.ArgumentTypeError(f"Unknown upstream '{name}'; expected one of {', '.join(UPSTREAM_NAMES)}.")
+        pairs[name] = float(value)
+    return pairs
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run local fake upstreams for benchmarks.")
+    parser.add_argument("--latency", type=parse_pairs, default={}, help="e.g. gemini=0.8,elevenlabs=1.2")
+    parser.add_argument("--error-rate", type=parse_pairs, default={}, help="e.g. gemini=0.05")
+    parser.add_argument("--posts-per-user", type=int, default=24)
+    args = parser.parse_args()
+
+    process, urls = start_fake_upstreams(args.latency, args.error_rate, posts_per_user=args.posts_per_user)
+    for name, value in environment_for(urls).items():
+        print(f"export {name}={value}")
+    try:
+        process.join()
+    except KeyboardInterrupt:
+        process.terminate()
+
+
+if __name__ == "__main__":
+    main()
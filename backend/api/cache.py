@@ -0,0 +1,225 @@
+"""
+Small cache toolkit used by the API and workers.
+
+Every backend exposes ``get(key)``, ``set(key, value, ttl=None)``, ``delete(key)`` and
+``stats()``; values must be JSON-serialisable for the SQLite tier. ``TieredCache`` chains a
+fast in-process tier in front of a persistent one and promotes persistent hits for the time
+they have left. The SQLite tier drops expired rows when opened and every ``purge_every`` writes.
+"""
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class CacheStats:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class TTLCache:
+    """Thread-safe in-process LRU with a per-entry time-to-live."""
+
+    def __init__(self, *, max_entries: int = 1024, ttl: Optional[float] = None) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[Any, Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = CacheStats()
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self.get_entry(key)
+        return None if entry is None else entry[0]
+
+    def get_entry(self, key: str) -> Optional[Tuple[Any, Optional[float]]]:
+        """``(value, seconds left)`` for a live entry (``None`` left: no expiry), else ``None``."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._stats.record(True)
+                    return value, None if expires_at is None else expires_at - now
+                del self._entries[key]
+        self._stats.record(False)
+        return None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._stats.snapshot(), "entries": len(self._entries), "max_entries": self.max_entries}
+
+
+class SQLiteCache:
+    """Persistent key/value tier in a local SQLite file, shared by every process on the host."""
+
+    def __init__(
+        self, path: str, *, namespace: str = "default", ttl: Optional[float] = None, purge_every: int = 1000
+    ) -> None:
+        self.path = path
+        self.namespace = namespace
+        self.ttl = ttl
+        self.purge_every = purge_every
+        self._local = threading.local()
+        self._stats = CacheStats()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._opened = False
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("pragma journal_mode=wal")
+            conn.execute("pragma synchronous=normal")
+            conn.execute(
+                "create table if not exists cache_entries ("
+                " namespace text not null, key text not null, value text not null, expires_at real,"
+                " primary key (namespace, key))"
+            )
+            self._local.conn = conn
+            with self._lock:
+                first_open, self._opened = not self._opened, True
+            if first_open:
+                self._purge(conn)
+        return conn
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self.get_entry(key)
+        return None if entry is None else entry[0]
+
+    def get_entry(self, key: str) -> Optional[Tuple[Any, Optional[float]]]:
+        """``(value, seconds left)`` for a live entry (``None`` left: no expiry), else ``None``."""
+        row = self._connection().execute(
+            "select value, expires_at from cache_entries where namespace = ? and key = ?",
+            (self.namespace, key),
+        ).fetchone()
+        now = time.time()
+        if row is None or (row[1] is not None and row[1] <= now):
+            self._stats.record(False)
+            return None
+        self._stats.record(True)
+        return json.loads(row[0]), None if row[1] is None else row[1] - now
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl is not None else None
+        conn = self._connection()
+        conn.execute(
+            "insert or replace into cache_entries (namespace, key, value, expires_at) values (?, ?, ?, ?)",
+            (self.namespace, key, json.dumps(value), expires_at),
+        )
+        with self._lock:
+            self._writes += 1
+            due = self.purge_every > 0 and self._writes % self.purge_every == 0
+        if due:
+            self._purge(conn)
+
+    def delete(self, key: str) -> None:
+        self._connection().execute(
+            "delete from cache_entries where namespace = ? and key = ?", (self.namespace, key)
+        )
+
+    def purge_expired(self) -> int:
+        return self._purge(self._connection())
+
+    def _purge(self, conn: sqlite3.Connection) -> int:
+        cursor = conn.execute(
+            "delete from cache_entries where namespace = ? and expires_at is not null and expires_at <= ?",
+            (self.namespace, time.time()),
+        )
+        return cursor.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        return self._stats.snapshot()
+
+
+class TieredCache:
+    """Looks up each tier in order; a hit in a slower tier is copied into the faster ones."""
+
+    def __init__(self, tiers: List[Any]) -> None:
+        if not tiers:
+            raise ValueError("TieredCache needs at least one tier.")
+        self.tiers = tiers
+        self._stats = CacheStats()
+
+    def get(self, key: str) -> Optional[Any]:
+        for index, tier in enumerate(self.tiers):
+            entry = tier.get_entry(key)
+            if entry is not None:
+                value, remaining = entry
+                # Promoted copies expire with the original instead of getting a fresh TTL.
+                for faster in self.tiers[:index]:
+                    faster.set(key, value, remaining)
+                self._stats.record(True)
+                return value
+        self._stats.record(False)
+        return None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        for tier in self.tiers:
+            tier.set(key, value, ttl)
+
+    def delete(self, key: str) -> None:
+        for tier in self.tiers:
+            tier.delete(key)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats.snapshot(),
+            "tiers": [{"backend": type(tier).__name__, **tier.stats()} for tier in self.tiers],
+        }
+
+
+def build_cache(
+    *,
+    namespace: str,
+    max_entries: int,
+    ttl: Optional[float],
+    sqlite_path: Optional[str] = None,
+) -> Any:
+    """Returns an in-process LRU, fronting a SQLite tier when ``sqlite_path`` is set."""
+    memory = TTLCache(max_entries=max_entries, ttl=ttl)
+    if not sqlite_path:
+        return memory
+    return TieredCache([memory, SQLiteCache(sqlite_path, namespace=namespace, ttl=ttl)])
@@ -0,0 +1,132 @@
+"""
+Request-scoped deadlines.
+
+A deadline is an absolute ``time.monotonic()`` instant held in a context variable. The API sets
+one per request from the ``X-Request-Timeout-Ms`` header or a per-route default; the pooled
+``http_clients`` sessions, the async clients and the R2 client then shrink each call's timeout
+to the time left and refuse to start a call once it has passed, raising ``DeadlineExceeded``.
+
+Context variables follow asyncio tasks but not threads, so work handed to a thread pool carries
+the deadline explicitly (``wrap``, or ``bind`` with a captured ``current()``).
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import Any, Callable, Iterator, Optional, Tuple, TypeVar, Union
+
+DEADLINE_HEADER = "X-Request-Timeout-Ms"
+
+Timeout = Union[float, Tuple[float, float]]
+T = TypeVar("T")
+
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """The request's deadline passed, or would pass, before the work could finish."""
+
+
+def current() -> Optional[float]:
+    return _deadline.get()
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current deadline (negative once passed), or ``None`` without one."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def expired() -> bool:
+    """Whether the current deadline has passed; a timeout raised after that is the deadline's doing."""
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def check(what: str = "request") -> None:
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded(f"Deadline passed {-left:.1f}s before {what}.")
+
+
+def clamp_timeout(timeout: Timeout, what: str = "upstream call") -> Timeout:
+    """``timeout`` (seconds or ``(connect, read)``) capped at the time left; raises once it is gone."""
+    left = remaining()
+    if left is None:
+        return timeout
+    check(what)
+    if isinstance(timeout, tuple):
+        return min(timeout[0], left), min(timeout[1], left)
+    return min(timeout, left)
+
+
+def budget(header_value: Optional[str], default_seconds: Optional[float]) -> Optional[float]:
+    """Seconds allowed for a request: the header's milliseconds when valid, else the default (0: none)."""
+    if header_value:
+        try:
+            milliseconds = float(header_value)
+        except ValueError:
+            milliseconds = 0.0
+        if milliseconds > 0:
+            return milliseconds / 1000
+    return default_seconds if default_seconds and default_seconds > 0 else None
+
+
+def start(seconds: Optional[float]) -> Token:
+    """Sets a deadline ``seconds`` from now (none for ``None``); pass the token to ``reset``."""
+    return _deadline.set(time.monotonic() + seconds if seconds else None)
+
+
+def reset(token: Optional[Token]) -> None:
+    if token is not None:
+        _deadline.reset(token)
+
+
+@contextmanager
+def bind(deadline: Optional[float]) -> Iterator[None]:
+    """Runs the block under an absolute deadline captured elsewhere (e.g. by another thread)."""
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+@contextmanager
+def scope(seconds: float) -> Iterator[None]:
+    """Runs the block with at most ``seconds``, never extending an enclosing deadline."""
+    deadline = time.monotonic() + seconds
+    enclosing = _deadline.get()
+    with bind(deadline if enclosing is None else min(enclosing, deadline)):
+        yield
+
+
+@contextmanager
+def suspended() -> Iterator[None]:
+    """
+    Lifts the deadline for bookkeeping that keeps work already paid for (persisting results,
+    releasing leases); skipping it would waste that work rather than save time.
+    """
+    with bind(None):
+        yield
+
+
+def wrap(func: Callable[..., T]) -> Callable[..., T]:
+    """``func`` bound to the caller's current deadline, for running on another thread."""
+    deadline = _deadline.get()
+
+    def bound(*args: Any, **kwargs: Any) -> T:
+        with bind(deadline):
+            return func(*args, **kwargs)
+
+    return bound
+
+
+def guard_boto_client(client: Any) -> None:
+    """Makes every operation on a boto3 ``client`` raise ``DeadlineExceeded`` once the deadline passed."""
+    service = client.meta.service_model.service_id.hyphenize()
+
+    def before_call(model: Any, **_: Any) -> None:
+        check(model.name)
+
+    # Ahead of other before-call handlers (metrics), so a refused call is never counted as started.
+    client.meta.events.register_first(f"before-call.{service}", before_call)
@@ -0,0 +1,235 @@
+"""
+Sends digest emails to every parent-confirmed family.
+
+    python digest_dispatch.py --since-days 7 --checkpoint digest_checkpoint.json
+
+Profiles are streamed in keyset-paginated pages; each page's recent media is loaded with one
+query, rendered with ``render_digest_email`` and sent through Resend's batch API (up to 100
+emails per call) under a token-bucket rate limit. Progress is checkpointed after every page,
+so re-running with the same ``--checkpoint`` after a crash resumes after the last finished
+page, over the same media window as the run it resumes. Each batch carries an idempotency key
+derived from the run and its recipients, so a page that was half-sent when the process died is
+not delivered twice. Batches whose send failed are recorded and re-sent, with the same
+recipients and key, at the end of the run; any still failing keep the run unfinished.
+"""
+import argparse
+import datetime as dt
+import hashlib
+import json
+import logging
+import os
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+import metrics
+import resend
+from email_templates import render_digest_email
+from rate_limit import TokenBucket
+from server import (RESEND_API_KEY, RESEND_FROM_EMAIL, _fetch_confirmed_profiles_page, _fetch_profiles,
+                    _fetch_recent_media_for_users)
+
+logger = logging.getLogger("digest_dispatch")
+
+RESEND_BATCH_SIZE = 100
+RESEND_REQUESTS_PER_SECOND = float(os.getenv("RESEND_REQUESTS_PER_SECOND", "2"))
+DIGEST_PAGE_SIZE = int(os.getenv("DIGEST_PAGE_SIZE", "200"))
+DIGEST_ITEMS_PER_EMAIL = int(os.getenv("DIGEST_ITEMS_PER_EMAIL", "5"))
+
+
+def _load_checkpoint(path: Optional[str]) -> Dict[str, Any]:
+    """Resumes an unfinished run from ``path``; a finished (or missing) checkpoint starts a new run."""
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as handle:
+            checkpoint = json.load(handle)
+        if not checkpoint.get("completed"):
+            logger.info("Resuming digest run %s after %s", checkpoint["run_id"], checkpoint["last_profile_id"])
+            checkpoint.setdefault("failed_batches", [])
+            return checkpoint
+    return {
+        "run_id": str(uuid.uuid4()),
+        "started_at": dt.datetime.utcnow().isoformat(),
+        "last_profile_id": None,
+        "completed": False,
+        "sent": 0,
+        "skipped": 0,
+        "failed": 0,
+        "failed_batches": [],
+    }
+
+
+def _save_checkpoint(path: Optional[str], checkpoint: Dict[str, Any]) -> None:
+    if not path:
+        return
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as handle:
+        json.dump(checkpoint, handle, indent=2)
+    os.replace(temp_path, path)
+
+
+def _student_name(profile: Dict[str, Any]) -> Optional[str]:
+    return profile.get("full_name") or profile.get("ig_username") or profile.get("email")
+
+
+def _build_email(profile: Dict[str, Any], media: List[Dict[str, Any]]) -> Dict[str, Any]:
+    student_name = _student_name(profile)
+    return {
+        "from": RESEND_FROM_EMAIL,
+        "to": [profile["parent_email"]],
+        "subject": f"New LifeLoop memories from {student_name or 'your student'}",
+        "html": render_digest_email(media, student_name=student_name),
+        "text": (
+            f"{student_name or 'Your student'} has {len(media)} new "
+            f"{'memory' if len(media) == 1 else 'memories'} in LifeLoop. "
+            "Open this email in an HTML-capable client to see photos and play narrations.\n"
+        ),
+    }
+
+
+def _send_batch(
+    emails: List[Dict[str, Any]], idempotency_key: str, limiter: TokenBucket, dry_run: bool
+) -> None:
+    limiter.acquire()
+    if dry_run:
+        logger.info("Dry run: would send %s digests (%s)", len(emails), idempotency_key)
+        return
+    with metrics.track_upstream("resend", "batch.send"):
+        resend.Batch.send(emails, {"idempotency_key": idempotency_key})
+
+
+def _digest_emails(
+    profiles: List[Dict[str, Any]], checkpoint: Dict[str, Any], items_per_email: int
+) -> List[Tuple[str, Dict[str, Any]]]:
+    """``(profile_id, email)`` for each profile with a parent email and media in the run's window."""
+    recipients = [profile for profile in profiles if profile.get("parent_email")]
+    # The window is fixed when the run starts, so a resumed or retried batch renders the same
+    # digests it would have the first time and its idempotency key still matches.
+    media_by_user = _fetch_recent_media_for_users(
+        [profile["id"] for profile in recipients],
+        since=checkpoint["since"],
+        until=checkpoint["started_at"],
+        per_user_limit=items_per_email,
+    )
+    emails: List[Tuple[str, Dict[str, Any]]] = []
+    for profile in recipients:
+        media = media_by_user.get(profile["id"]) or []
+        if media:
+            emails.append((profile["id"], _build_email(profile, media)))
+    return emails
+
+
+def _send_chunk(
+    checkpoint: Dict[str, Any], chunk: List[Tuple[str, Dict[str, Any]]], limiter: TokenBucket, dry_run: bool
+) -> None:
+    emails = [email for _, email in chunk]
+    recipients_digest = hashlib.sha256("|".join(email["to"][0] for email in emails).encode("utf-8")).hexdigest()[:16]
+    idempotency_key = f"digest-{checkpoint['run_id']}-{recipients_digest}"
+    try:
+        _send_batch(emails, idempotency_key, limiter, dry_run)
+        checkpoint["sent"] += len(chunk)
+    except Exception:
+        logger.exception("Failed to send digest batch %s", idempotency_key)
+        checkpoint["failed"] += len(chunk)
+        checkpoint["failed_batches"].append([profile_id for profile_id, _ in chunk])
+
+
+def _retry_failed_batches(
+    checkpoint: Dict[str, Any], items_per_email: int, limiter: TokenBucket, dry_run: bool
+) -> None:
+    """Re-sends each recorded failed batch once; batches that fail again stay recorded."""
+    pending, checkpoint["failed_batches"] = checkpoint["failed_batches"], []
+    for profile_ids in pending:
+        checkpoint["failed"] -= len(profile_ids)
+        profiles_by_id = _fetch_profiles(profile_ids)
+        profiles = [
+            profiles_by_id[profile_id]
+            for profile_id in profile_ids
+            if profiles_by_id.get(profile_id, {}).get("is_parent_confirmed")
+        ]
+        chunk = _digest_emails(profiles, checkpoint, items_per_email)
+        checkpoint["skipped"] += len(profile_ids) - len(chunk)
+        if chunk:
+            logger.info("Retrying failed digest batch of %s", len(chunk))
+            _send_chunk(checkpoint, chunk, limiter, dry_run)
+
+
+def dispatch_digests(
+    *,
+    since: str,
+    checkpoint_path: Optional[str] = None,
+    page_size: int = DIGEST_PAGE_SIZE,
+    items_per_email: int = DIGEST_ITEMS_PER_EMAIL,
+    dry_run: bool = False,
+    limiter: Optional[TokenBucket] = None,
+) -> Dict[str, Any]:
+    """Runs (or resumes) a dispatch and returns the final checkpoint as a summary."""
+    if not RESEND_API_KEY and not dry_run:
+        raise RuntimeError("RESEND_API_KEY not configured; cannot send digests.")
+
+    limiter = limiter or TokenBucket(RESEND_REQUESTS_PER_SECOND)
+    checkpoint = _load_checkpoint(checkpoint_path)
+    # A resumed run keeps its original window; ``since`` only applies to a new run.
+    checkpoint.setdefault("since", since)
+
+    while True:
+        profiles = _fetch_confirmed_profiles_page(checkpoint["last_profile_id"], page_size)
+        if not profiles:
+            break
+
+        emails = _digest_emails(profiles, checkpoint, items_per_email)
+        checkpoint["skipped"] += len(profiles) - len(emails)
+
+        for start in range(0, len(emails), RESEND_BATCH_SIZE):
+            _send_chunk(checkpoint, emails[start : start + RESEND_BATCH_SIZE], limiter, dry_run)
+
+        checkpoint["last_profile_id"] = profiles[-1]["id"]
+        _save_checkpoint(checkpoint_path, checkpoint)
+        logger.info(
+            "Digest page done through %s: sent=%s skipped=%s failed=%s",
+            checkpoint["last_profile_id"],
+            checkpoint["sent"],
+            checkpoint["skipped"],
+            checkpoint["failed"],
+        )
+        if len(profiles) < page_size:
+            break
+
+    if checkpoint["failed_batches"]:
+        _retry_failed_batches(checkpoint, items_per_email, limiter, dry_run)
+    checkpoint["rate_limiter"] = limiter.stats()
+    if checkpoint["failed_batches"]:
+        # Left unfinished so re-running with the same checkpoint retries them again.
+        logger.warning(
+            "%s digest batches still failing; re-run with the same checkpoint to retry them.",
+            len(checkpoint["failed_batches"]),
+        )
+        _save_checkpoint(checkpoint_path, checkpoint)
+        return checkpoint
+
+    checkpoint["completed"] = True
+    checkpoint["finished_at"] = dt.datetime.utcnow().isoformat()
+    _save_checkpoint(checkpoint_path, checkpoint)
+    return checkpoint
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Send LifeLoop digests to all confirmed families.")
+    parser.add_argument("--since-days", type=float, default=7.0, help="Include media processed in this window.")
+    parser.add_argument("--checkpoint", default=os.getenv("DIGEST_CHECKPOINT_PATH", "digest_checkpoint.json"))
+    parser.add_argument("--page-size", type=int, default=DIGEST_PAGE_SIZE)
+    parser.add_argument("--items", type=int, default=DIGEST_ITEMS_PER_EMAIL)
+    parser.add_argument("--dry-run", action="store_true", help="Render and rate-limit without sending.")
+    args = parser.parse_args()
+
+    since = (dt.datetime.utcnow() - dt.timedelta(days=args.since_days)).isoformat()
+    summary = dispatch_digests(
+        since=since,
+        checkpoint_path=args.checkpoint,
+        page_size=args.page_size,
+        items_per_email=args.items,
+        dry_run=args.dry_run,
+    )
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,55 @@
+import html
+import os
+import re
 from datetime import datetime
+from functools import lru_cache
+from string import Formatter
 from typing import Any, Dict, List, Optional
 
+DIGEST_FRAGMENT_CACHE_SIZE = int(os.getenv("DIGEST_FRAGMENT_CACHE_SIZE", "20000"))
+DEFAULT_DIGEST_CAPTION = "We captured a new moment for your family archive."
 
-def render_digest_email(media_items: List[Dict[str, Any]], student_name: Optional[str] = None) -> str:
+
+class _CompiledTemplate:
     """
-    Generates an HTML digest highlighting recent Instagram media with optional narration links.
+    A ``{field}`` template parsed once, at import, into its literal chunks and field slots, so
+    rendering only fills the slots with the (already escaped) field values and joins them.
+    """
+
+    def __init__(self, source: str) -> None:
+        chunks: List[str] = []
+        slots: List[Any] = []
+        fields: List[str] = []
+        for literal, field, _, _ in Formatter().parse(source):
+            if literal:
+                chunks.append(literal)
+            if field is not None:
+                if not field.isidentifier():
+                    raise ValueError(f"Invalid template field {field!r}.")
+                slots.append((len(chunks), field))
+                chunks.append("")
+                if field not in fields:
+                    fields.append(field)
+        self.fields = tuple(fields)
+
+        def render(**values: str) -> str:
+            parts = chunks.copy()
+            for index, field in slots:
+                parts[index] = values[field]
+            return "".join(parts)
+
+        self.render = render
+
+
+_ESCAPE_TRIGGERS = re.compile(r"[&<>\"']")
+
+
+def _escape(value: str) -> str:
+    return html.escape(value) if _ESCAPE_TRIGGERS.search(value) else value
+
+
+_AUDIO_SECTION = _CompiledTemplate(
     """
-    intro_name = student_name or "your student"
-    formatted_items = []
-
-    for item in media_items:
-        caption = item.get("caption") or "We captured a new moment for your family archive."
-        audio_url = item.get("audio_url")
-        image_fallback = item.get("source_url") or "#"
-        processed_at = item.get("processed_at") or item.get("created_at")
-        processed_label = ""
-        if processed_at:
-            try:
-                processed_dt = datetime.fromisoformat(processed_at.replace("Z", "+00:00"))
-                processed_label = processed_dt.strftime("%B %d, %Y")
-            except ValueError:
-                processed_label = processed_at
-
-        audio_section = ""
-        if audio_url:
-            audio_section = f"""
                 <p style="margin: 8px 0;">
                     <strong>Listen:</strong>
                     <a href="{audio_url}" style="color: #6C63FF; text-decoration: underline;">Play narrated update</a>
@@ -34,21 +59,22 @@ def render_digest_email(media_items: List[Dict[str, Any]], student_name: Optiona
                     <p>Your device cannot play the audio clip. Download it <a href="{audio_url}">here</a>.</p>
                 </audio>
             """
+)
 
-        formatted_items.append(
-            f"""
+_MEMORY_ROW = _CompiledTemplate(
+    """
             <tr>
                 <td style="padding: 16px; border-bottom: 1px solid #e4e7ec;">
                     <div style="font-size: 14px; color: #475467; margin-bottom: 8px;">{processed_label}</div>
-                    <img src="{image_fallback}" alt="Latest memory from {intro_name}" style="width: 100%; border-radius: 12px; object-fit: cover;" />
+                    <img src="{image_url}" alt="Latest memory from {intro_name}" style="width: 100%; border-radius: 12px; object-fit: cover;" />
                     <p style="margin: 12px 0; font-size: 16px; color: #344054; line-height: 1.4;">{caption}</p>
                     {audio_section}
                 </td>
             </tr>
             """
-        )
+)
 
-    memories_html = "".join(formatted_items) or """
+_EMPTY_MEMORIES = """
         <tr>
             <td style="padding: 32px; text-align: center; color: #667085;">
                 No new memories yet, but we are ready to capture the next moment.
@@ -56,7 +82,8 @@ def render_digest_email(media_items: List[Dict[str, Any]], student_name: Optiona
         </tr>
     """
 
-    return f"""
+_DIGEST_DOCUMENT = _CompiledTemplate(
+    """
     <!DOCTYPE html>
     <html lang="en">
     <head>
@@ -95,6 +122,61 @@ def render_digest_email(media_items: List[Dict[str, Any]], student_name: Optiona
     </body>
     </html>
     """
+)
+
+@lru_cache(maxsize=4096)
+def _format_processed_label(processed_at: str) -> str:
+    try:
+        processed_dt = datetime.fromisoformat(processed_at.replace("Z", "+00:00"))
+        return processed_dt.strftime("%B %d, %Y")
+    except ValueError:
+        return _escape(processed_at)
+
+
+# Rendered per-memory rows. A row only changes when it is reprocessed (new processed_at,
+# caption or narration), so the key covers the media id plus every rendered field.
+@lru_cache(maxsize=DIGEST_FRAGMENT_CACHE_SIZE)
+def _memory_row(
+    media_id: Any,
+    processed_at: Optional[str],
+    audio_url: Optional[str],
+    caption: str,
+    source_url: str,
+    escaped_name: str,
+) -> str:
+    audio_section = _AUDIO_SECTION.render(audio_url=_escape(audio_url)) if audio_url else ""
+    return _MEMORY_ROW.render(
+        processed_label=_format_processed_label(processed_at) if processed_at else "",
+        image_url=_escape(source_url),
+        intro_name=escaped_name,
+        caption=_escape(caption),
+        audio_section=audio_section,
+    )
+
+
+def render_digest_email(media_items: List[Dict[str, Any]], student_name: Optional[str] = None) -> str:
+    """
+    Generates an HTML digest highlighting recent Instagram media with optional narration links.
+    Captions, names and URLs are HTML-escaped; rendered rows are cached per media item.
+    """
+    escaped_name = _escape(student_name or "your student")
+    memories_html = "".join(
+        _memory_row(
+            item.get("id"),
+            item.get("processed_at") or item.get("created_at"),
+            item.get("audio_url"),
+            item.get("caption") or DEFAULT_DIGEST_CAPTION,
+            item.get("source_url") or "#",
+            escaped_name,
+        )
+        for item in media_items
+    ) or _EMPTY_MEMORIES
+    return _DIGEST_DOCUMENT.render(intro_name=escaped_name, memories_html=memories_html)
+
+
+def digest_fragment_cache_stats() -> Dict[str, Any]:
+    info = _memory_row.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "entries": info.currsize, "max_entries": info.maxsize}
 
 
 def render_parent_confirmation_email(
@@ -0,0 +1,227 @@
+"""
+Pooled ``requests`` sessions, one per upstream.
+
+Each upstream gets its own keep-alive connection pool, retry policy (jittered exponential
+backoff on connection errors, 429 and 5xx, honouring ``Retry-After`` up to
+``MAX_RETRY_AFTER_SECONDS``) and default timeouts,
+so helpers reuse TCP/TLS connections instead of opening one per call. Every knob can be
+overridden with ``HTTP_<UPSTREAM>_<SETTING>`` environment variables, e.g.
+``HTTP_GEMINI_READ_TIMEOUT=90``. ``HTTP_<UPSTREAM>_RATE_PER_SECOND`` puts a process-wide token
+bucket in front of the upstream (off by default); retries take a token too. Under a request
+deadline (``deadlines``) each attempt's timeouts are capped at the time left, no call starts once
+it has passed, and a retry whose wait would outlast it is not made.
+"""
+import os
+import threading
+import time
+from dataclasses import dataclass, replace
+from typing import Any, Dict, FrozenSet, Optional, Tuple
+
+import deadlines
+import metrics
+import requests
+from dotenv import load_dotenv
+from rate_limit import TokenBucket
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, ResponseError
+from urllib3.util.retry import Retry
+
+load_dotenv()
+
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE", "TRACE"})
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Longest ``Retry-After`` either client waits; a larger value is treated as this many seconds.
+MAX_RETRY_AFTER_SECONDS = 30.0
+
+
+@dataclass(frozen=True)
+class UpstreamConfig:
+    pool_size: int = 8
+    retries: int = 2
+    backoff_factor: float = 0.5
+    backoff_jitter: float = 0.5
+    connect_timeout: float = 5.0
+    read_timeout: float = 30.0
+    retry_methods: FrozenSet[str] = IDEMPOTENT_METHODS
+    rate_per_second: float = 0.0
+    rate_burst: float = 0.0
+
+
+_RAPIDAPI_TIMEOUT = float(os.getenv("RAPIDAPI_TIMEOUT", "30"))
+
+# Defaults mirror the timeouts the helpers in server.py used before pooling.
+UPSTREAMS: Dict[str, UpstreamConfig] = {
+    "supabase": UpstreamConfig(pool_size=16, read_timeout=30.0),
+    "rapidapi": UpstreamConfig(pool_size=4, read_timeout=_RAPIDAPI_TIMEOUT),
+    "instagram_cdn": UpstreamConfig(pool_size=16, read_timeout=_RAPIDAPI_TIMEOUT),
+    # generateContent is a pure function of its input, so POSTs are safe to retry.
+    "gemini": UpstreamConfig(read_timeout=60.0, retry_methods=IDEMPOTENT_METHODS | {"POST"}),
+    # TTS and voice cloning are billed per call; only retry idempotent methods.
+    "elevenlabs": UpstreamConfig(read_timeout=120.0),
+}
+
+
+class _ThrottledRetry(Retry):
+    """
+    ``Retry`` that takes a token from its session's bucket before every retry attempt. urllib3
+    retries inside the adapter, below ``_UpstreamSession.request``; without this a 429 would be
+    retried straight away, outside the upstream's quota. ``Retry-After`` is capped at
+    ``MAX_RETRY_AFTER_SECONDS``, and a retry whose wait would outlast the request deadline is not
+    made: the last response is returned as it is, or ``DeadlineExceeded`` raised if there is none.
+    """
+
+    owner: Optional["_UpstreamSession"] = None
+    planned_sleep: Optional[float] = None
+
+    def new(self, **kw: Any) -> "_ThrottledRetry":
+        retry = super().new(**kw)
+        retry.owner = self.owner
+        return retry
+
+    def get_retry_after(self, response: Any) -> Optional[float]:
+        retry_after = super().get_retry_after(response)
+        return None if retry_after is None else min(MAX_RETRY_AFTER_SECONDS, retry_after)
+
+    def _wait(self, response: Any) -> float:
+        if self.respect_retry_after_header and response is not None:
+            retry_after = self.get_retry_after(response)
+            if retry_after:
+                return retry_after
+        return self.get_backoff_time()
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):  # type: ignore[override]
+        retry = super().increment(method, url, response, error, _pool, _stacktrace)
+        # Decided here, where urllib3 still lets a status retry give up and return the response.
+        retry.planned_sleep = retry._wait(response)
+        left = deadlines.remaining()
+        if left is not None and retry.planned_sleep >= left:
+            name = self.owner.name if self.owner is not None else "upstream"
+            if response is not None:
+                raise MaxRetryError(_pool, url, ResponseError(f"No time left to retry {name} {method}."))
+            raise deadlines.DeadlineExceeded(f"No time left to retry {name} {method}.")
+        return retry
+
+    def sleep(self, response: Any = None) -> None:
+        delay = self.planned_sleep if self.planned_sleep is not None else self._wait(response)
+        if delay > 0:
+            time.sleep(delay)
+        # Read on every retry so buckets installed later with ``set_rate_limit`` apply too.
+        limiter = self.owner.limiter if self.owner is not None else None
+        if limiter is not None:
+            limiter.acquire()
+
+
+class _UpstreamSession(requests.Session):
+    """
+    Session that applies the upstream's default timeout when callers do not pass one, caps it
+    at the time left before the request deadline and, when the upstream is rate limited, waits
+    for a token before each request. Every request is recorded in the upstream latency and byte
+    metrics.
+    """
+
+    def __init__(
+        self, name: str, default_timeout: Tuple[float, float], limiter: Optional[TokenBucket] = None
+    ) -> None:
+        super().__init__()
+        self.name = name
+        self.default_timeout = default_timeout
+        self.limiter = limiter
+
+    def request(self, method, url, **kwargs):  # type: ignore[override]
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.default_timeout
+        if self.limiter is not None:
+            self.limiter.acquire()
+        kwargs["timeout"] = deadlines.clamp_timeout(kwargs["timeout"], f"{self.name} {method.upper()}")
+        with metrics.track_upstream(self.name, method.upper()) as call:
+            response = super().request(method, url, **kwargs)
+            call.outcome = f"{response.status_code // 100}xx"
+
+        body = response.request.body
+        if body:
+            metrics.BYTES_TRANSFERRED.inc(len(body), upstream=self.name, direction="sent")
+        length = response.headers.get("Content-Length")
+        if length and length.isdigit():
+            metrics.BYTES_TRANSFERRED.inc(int(length), upstream=self.name, direction="received")
+        elif not kwargs.get("stream"):
+            metrics.BYTES_TRANSFERRED.inc(len(response.content), upstream=self.name, direction="received")
+        return response
+
+
+def _env_override(name: str, config: UpstreamConfig) -> UpstreamConfig:
+    prefix = f"HTTP_{name.upper()}_"
+    overrides = {}
+    for field_name, cast in (
+        ("pool_size", int),
+        ("retries", int),
+        ("backoff_factor", float),
+        ("backoff_jitter", float),
+        ("connect_timeout", float),
+        ("read_timeout", float),
+        ("rate_per_second", float),
+        ("rate_burst", float),
+    ):
+        raw = os.getenv(prefix + field_name.upper())
+        if raw:
+            overrides[field_name] = cast(raw)
+    return replace(config, **overrides) if overrides else config
+
+
+def build_session(config: UpstreamConfig, name: str = "http") -> requests.Session:
+    limiter = None
+    if config.rate_per_second > 0:
+        limiter = TokenBucket(config.rate_per_second, config.rate_burst or None)
+    session = _UpstreamSession(name, (config.connect_timeout, config.read_timeout), limiter)
+    retry = _ThrottledRetry(
+        total=config.retries,
+        connect=config.retries,
+        read=config.retries,
+        status=config.retries,
+        backoff_factor=config.backoff_factor,
+        backoff_jitter=config.backoff_jitter,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=config.retry_methods,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    retry.owner = session
+    adapter = HTTPAdapter(pool_connections=10, pool_maxsize=config.pool_size, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+_sessions: Dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+
+def session(upstream: str) -> requests.Session:
+    """Returns the process-wide pooled session for ``upstream`` (one of ``UPSTREAMS``)."""
+    existing = _sessions.get(upstream)
+    if existing is not None:
+        return existing
+    with _sessions_lock:
+        if upstream not in _sessions:
+            config = UPSTREAMS.get(upstream)
+            if config is None:
+                raise KeyError(f"Unknown upstream '{upstream}'.")
+            _sessions[upstream] = build_session(_env_override(upstream, config), upstream)
+        return _sessions[upstream]
+
+
+def set_rate_limit(upstream: str, rate_per_second: float, burst: Optional[float] = None) -> Optional[TokenBucket]:
+    """Installs (or, with a non-positive rate, removes) the token bucket in front of ``upstream``."""
+    upstream_session = session(upstream)
+    upstream_session.limiter = TokenBucket(rate_per_second, burst) if rate_per_second > 0 else None
+    return upstream_session.limiter
+
+
+def limiter_stats() -> Dict[str, Dict[str, Any]]:
+    """Token-bucket counters for every rate-limited upstream whose session has been created."""
+    with _sessions_lock:
+        sessions = dict(_sessions)
+    return {
+        name: upstream.limiter.stats()
+        for name, upstream in sessions.items()
+        if getattr(upstream, "limiter", None) is not None
+    }
@@ -0,0 +1,156 @@
+"""
+Scheduled Instagram ingestion for every parent-confirmed profile.
+
+    python ingest_scheduler.py --concurrency 4
+
+Profiles are read in keyset pages and ingested through ``ingest_profile_media`` on a bounded
+thread pool. Every call to RapidAPI, the Instagram CDN and Supabase passes through a shared
+token bucket per upstream, so the run stays inside each quota however many profiles are in
+flight. Prints a JSON summary when the run finishes.
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+import http_clients
+from server import _fetch_confirmed_profiles_page, ingest_profile_media
+
+logger = logging.getLogger("ingest_scheduler")
+
+SCHEDULER_CONCURRENCY = int(os.getenv("INGEST_SCHEDULER_CONCURRENCY", "4"))
+SCHEDULER_PAGE_SIZE = int(os.getenv("INGEST_SCHEDULER_PAGE_SIZE", "200"))
+SCHEDULER_ITEM_LIMIT = int(os.getenv("INGEST_SCHEDULER_ITEM_LIMIT", "12"))
+SCHEDULER_RATES = {
+    "rapidapi": float(os.getenv("INGEST_RAPIDAPI_RATE_PER_SECOND", "1")),
+    "instagram_cdn": float(os.getenv("INGEST_CDN_RATE_PER_SECOND", "10")),
+    "supabase": float(os.getenv("INGEST_SUPABASE_RATE_PER_SECOND", "20")),
+}
+MAX_REPORTED_ERRORS = 50
+
+
+def _waited_seconds() -> Dict[str, float]:
+    return {name: stats["waited_seconds"] for name, stats in http_clients.limiter_stats().items()}
+
+
+class _RunSummary:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.counts = {
+            "profiles_scanned": 0,
+            "profiles_ingested": 0,
+            "profiles_without_username": 0,
+            "profiles_failed": 0,
+            "items_inserted": 0,
+            "items_skipped": 0,
+        }
+        self.errors = []
+
+    def add(self, **deltas: int) -> None:
+        with self._lock:
+            for key, delta in deltas.items():
+                self.counts[key] += delta
+
+    def record(self, profile_id: str, body: Dict[str, Any], status: int) -> None:
+        with self._lock:
+            if status >= 400:
+                self.counts["profiles_failed"] += 1
+                if len(self.errors) < MAX_REPORTED_ERRORS:
+                    self.errors.append({"profile_id": profile_id, "status": status, "error": body.get("error")})
+                return
+            self.counts["profiles_ingested"] += 1
+            self.counts["items_inserted"] += body.get("inserted", 0)
+            self.counts["items_skipped"] += len(body.get("skipped", []))
+
+
+def _ingest_one(profile: Dict[str, Any], limit: int, summary: _RunSummary) -> None:
+    try:
+        body, status = ingest_profile_media(profile, profile["ig_username"], limit=limit, parallel=False)
+    except Exception as exc:
+        logger.exception("Scheduled ingestion crashed for profile %s", profile["id"])
+        body, status = {"error": str(exc)}, 500
+    summary.record(profile["id"], body, status)
+
+
+def run_scheduled_ingest(
+    *,
+    concurrency: int = SCHEDULER_CONCURRENCY,
+    page_size: int = SCHEDULER_PAGE_SIZE,
+    limit: int = SCHEDULER_ITEM_LIMIT,
+    rates: Optional[Dict[str, float]] = None,
+) -> Dict[str, Any]:
+    """
+    Ingests every confirmed profile with an Instagram username and returns the run summary.
+    Profiles are ingested one item at a time each; ``concurrency`` bounds how many run at once.
+    """
+    for upstream, rate in (rates or SCHEDULER_RATES).items():
+        http_clients.set_rate_limit(upstream, rate)
+    waited_before = _waited_seconds()
+    started = time.perf_counter()
+
+    summary = _RunSummary()
+    # Keeps at most two profiles queued per worker so pages are read as the pool drains.
+    slots = threading.BoundedSemaphore(concurrency * 2)
+    after_id: Optional[str] = None
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="scheduled-ingest") as pool:
+        while True:
+            profiles = _fetch_confirmed_profiles_page(after_id, page_size)
+            if not profiles:
+                break
+            for profile in profiles:
+                summary.add(profiles_scanned=1)
+                if not profile.get("ig_username"):
+                    summary.add(profiles_without_username=1)
+                    continue
+                slots.acquire()
+                future: Future = pool.submit(_ingest_one, profile, limit, summary)
+                future.add_done_callback(lambda _: slots.release())
+            after_id = profiles[-1]["id"]
+            if len(profiles) < page_size:
+                break
+
+    waited_after = _waited_seconds()
+    throttled = {
+        name: round(waited_after[name] - waited_before.get(name, 0.0), 3) for name in waited_after
+    }
+    result = {
+        **summary.counts,
+        "throttled_seconds": throttled,
+        "throttled_seconds_total": round(sum(throttled.values()), 3),
+        "duration_seconds": round(time.perf_counter() - started, 3),
+        "errors": summary.errors,
+    }
+    logger.info("Scheduled ingest finished: %s", json.dumps({k: v for k, v in result.items() if k != "errors"}))
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Ingest Instagram media for all confirmed profiles.")
+    parser.add_argument("--concurrency", type=int, default=SCHEDULER_CONCURRENCY)
+    parser.add_argument("--page-size", type=int, default=SCHEDULER_PAGE_SIZE)
+    parser.add_argument("--limit", type=int, default=SCHEDULER_ITEM_LIMIT, help="Max new items per profile.")
+    parser.add_argument("--rapidapi-rps", type=float, default=SCHEDULER_RATES["rapidapi"])
+    parser.add_argument("--cdn-rps", type=float, default=SCHEDULER_RATES["instagram_cdn"])
+    parser.add_argument("--supabase-rps", type=float, default=SCHEDULER_RATES["supabase"])
+    args = parser.parse_args()
+
+    summary = run_scheduled_ingest(
+        concurrency=max(1, args.concurrency),
+        page_size=args.page_size,
+        limit=max(1, min(args.limit, 40)),
+        rates={
+            "rapidapi": args.rapidapi_rps,
+            "instagram_cdn": args.cdn_rps,
+            "supabase": args.supabase_rps,
+        },
+    )
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
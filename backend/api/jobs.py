@@ -0,0 +1,360 @@
+"""
+SQLite-backed job queue shared by the Flask API (producer) and ``worker.py`` (consumers).
+
+Jobs are leased rather than popped: a worker that dies mid-job simply lets its lease expire
+and the job becomes claimable again. Failures are retried with exponential backoff until
+``max_attempts`` is reached.
+
+Jobs may carry a ``fair_key`` (the student a media job belongs to) and a ``priority``. Leasing
+takes the highest priority first, then rotates across fair keys, least recently served first,
+so one key with a deep backlog cannot starve the others.
+"""
+import datetime as dt
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterable, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "lifeloop_jobs.sqlite3")
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "10"))
+JOB_RETRY_MAX_SECONDS = float(os.getenv("JOB_RETRY_MAX_SECONDS", "600"))
+
+PROCESS_MEDIA_JOB = "process_media"
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_SUCCEEDED = "succeeded"
+STATUS_FAILED = "failed"
+
+_SCHEMA = """
+create table if not exists jobs (
+    id text primary key,
+    kind text not null,
+    payload text not null,
+    dedupe_key text,
+    status text not null,
+    attempts integer not null default 0,
+    max_attempts integer not null,
+    run_at real not null,
+    lease_owner text,
+    lease_expires_at real,
+    stages text not null default '{}',
+    result text,
+    last_error text,
+    created_at real not null,
+    updated_at real not null,
+    fair_key text,
+    priority integer not null default 0
+);
+create table if not exists job_fair_keys (
+    key text primary key,
+    last_leased_at real not null
+);
+"""
+
+# Indexes on columns that databases created before those columns existed only get after _MIGRATIONS.
+_INDEXES = """
+create index if not exists jobs_claim_idx on jobs (status, run_at);
+create index if not exists jobs_dedupe_idx on jobs (dedupe_key, status);
+create index if not exists jobs_fair_key_idx on jobs (fair_key, status);
+"""
+
+_MIGRATIONS = (
+    ("fair_key", "alter table jobs add column fair_key text"),
+    ("priority", "alter table jobs add column priority integer not null default 0"),
+)
+
+
+def _isoformat(timestamp: Optional[float]) -> Optional[str]:
+    if timestamp is None:
+        return None
+    return dt.datetime.utcfromtimestamp(timestamp).isoformat()
+
+
+def _row_to_job(row: sqlite3.Row) -> Dict[str, Any]:
+    return {
+        "id": row["id"],
+        "kind": row["kind"],
+        "payload": json.loads(row["payload"]),
+        "status": row["status"],
+        "attempts": row["attempts"],
+        "max_attempts": row["max_attempts"],
+        "run_at": _isoformat(row["run_at"]),
+        "lease_owner": row["lease_owner"],
+        "lease_expires_at": _isoformat(row["lease_expires_at"]),
+        "stages": json.loads(row["stages"]),
+        "result": json.loads(row["result"]) if row["result"] else None,
+        "last_error": row["last_error"],
+        "fair_key": row["fair_key"],
+        "priority": row["priority"],
+        "created_at": _isoformat(row["created_at"]),
+        "updated_at": _isoformat(row["updated_at"]),
+    }
+
+
+class JobQueue:
+    """Durable FIFO of JSON jobs in a local SQLite file. Safe to share across threads and processes."""
+
+    def __init__(self, path: str = JOBS_DB_PATH) -> None:
+        self.path = path
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("pragma journal_mode=wal")
+            conn.execute("pragma synchronous=normal")
+            self._local.conn = conn
+        if not self._schema_ready:
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(_SCHEMA)
+                    columns = {row["name"] for row in conn.execute("pragma table_info(jobs)")}
+                    for column, statement in _MIGRATIONS:
+                        if column not in columns:
+                            conn.execute(statement)
+                    conn.executescript(_INDEXES)
+                    self._schema_ready = True
+        return conn
+
+    def enqueue(
+        self,
+        kind: str,
+        payload: Dict[str, Any],
+        *,
+        dedupe_key: Optional[str] = None,
+        max_attempts: int = JOB_MAX_ATTEMPTS,
+        fair_key: Optional[str] = None,
+        priority: int = 0,
+    ) -> Dict[str, Any]:
+        """
+        Adds a job and returns it. When ``dedupe_key`` matches a job that is still queued or
+        running, that job is returned instead of creating a second one; a queued duplicate is
+        raised to ``priority`` if that is higher.
+        """
+        conn = self._connection()
+        now = time.time()
+        conn.execute("begin immediate")
+        try:
+            if dedupe_key:
+                existing = conn.execute(
+                    "select * from jobs where dedupe_key = ? and status in (?, ?) limit 1",
+                    (dedupe_key, STATUS_QUEUED, STATUS_RUNNING),
+                ).fetchone()
+                if existing:
+                    if existing["status"] == STATUS_QUEUED and priority > existing["priority"]:
+                        conn.execute(
+                            "update jobs set priority = ?, updated_at = ? where id = ?", (priority, now, existing["id"])
+                        )
+                        existing = conn.execute("select * from jobs where id = ?", (existing["id"],)).fetchone()
+                    conn.execute("commit")
+                    return _row_to_job(existing)
+
+            job_id = str(uuid.uuid4())
+            conn.execute(
+                "insert into jobs (id, kind, payload, dedupe_key, status, max_attempts, run_at, created_at, updated_at,"
+                " fair_key, priority) values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job_id, kind, json.dumps(payload), dedupe_key, STATUS_QUEUED, max_attempts, now, now, now,
+                    fair_key, priority,
+                ),
+            )
+            row = conn.execute("select * from jobs where id = ?", (job_id,)).fetchone()
+            conn.execute("commit")
+        except BaseException:
+            conn.execute("rollback")
+            raise
+        return _row_to_job(row)
+
+    def lease(
+        self,
+        worker_id: str,
+        *,
+        kinds: Optional[Iterable[str]] = None,
+        lease_seconds: int = JOB_LEASE_SECONDS,
+        max_running_per_key: Optional[int] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Atomically claims a runnable job (queued and due, or running with an expired lease) for
+        ``worker_id``: highest priority first, then the fair key served least recently, then the
+        oldest. Keys already running ``max_running_per_key`` jobs are passed over. Returns
+        ``None`` when nothing is runnable.
+
+        A job whose lease expired after its last allowed attempt (its worker crashed or was
+        killed, so ``fail`` never ran) is marked ``failed`` here instead of being leased again.
+        """
+        conn = self._connection()
+        now = time.time()
+        kind_filter = ""
+        params: list = [STATUS_QUEUED, now, STATUS_RUNNING, now]
+        if kinds:
+            kinds = list(kinds)
+            kind_filter = f" and jobs.kind in ({','.join('?' for _ in kinds)})"
+            params.extend(kinds)
+        cap_filter = ""
+        if max_running_per_key:
+            cap_filter = (
+                " and (jobs.fair_key is null or (select count(*) from jobs as running where running.fair_key = jobs.fair_key"
+                " and running.status = ? and running.lease_expires_at > ?) < ?)"
+            )
+            params.extend([STATUS_RUNNING, now, max_running_per_key])
+
+        conn.execute("begin immediate")
+        try:
+            conn.execute(
+                "update jobs set status = ?, last_error = coalesce(last_error || char(10), '') || ?,"
+                " lease_owner = null, lease_expires_at = null, updated_at = ?"
+                " where status = ? and lease_expires_at <= ? and attempts >= max_attempts",
+                (STATUS_FAILED, "Lease expired on the final attempt.", now, STATUS_RUNNING, now),
+            )
+            row = conn.execute(
+                "select jobs.id, jobs.fair_key from jobs left join job_fair_keys on job_fair_keys.key = jobs.fair_key"
+                " where ((jobs.status = ? and jobs.run_at <= ?)"
+                " or (jobs.status = ? and jobs.lease_expires_at <= ? and jobs.attempts < jobs.max_attempts))"
+                f"{kind_filter}{cap_filter}"
+                " order by jobs.priority desc, coalesce(job_fair_keys.last_leased_at, 0), jobs.run_at limit 1",
+                params,
+            ).fetchone()
+            if not row:
+                conn.execute("commit")
+                return None
+            conn.execute(
+                "update jobs set status = ?, lease_owner = ?, lease_expires_at = ?, attempts = attempts + 1,"
+                " updated_at = ? where id = ?",
+                (STATUS_RUNNING, worker_id, now + lease_seconds, now, row["id"]),
+            )
+            if row["fair_key"] is not None:
+                conn.execute(
+                    "insert into job_fair_keys (key, last_leased_at) values (?, ?)"
+                    " on conflict (key) do update set last_leased_at = excluded.last_leased_at",
+                    (row["fair_key"], now),
+                )
+            leased = conn.execute("select * from jobs where id = ?", (row["id"],)).fetchone()
+            conn.execute("commit")
+        except BaseException:
+            conn.execute("rollback")
+            raise
+        return _row_to_job(leased)
+
+    def record_stage(
+        self,
+        job_id: str,
+        worker_id: str,
+        stage: str,
+        detail: Dict[str, Any],
+        *,
+        lease_seconds: int = JOB_LEASE_SECONDS,
+    ) -> None:
+        """Stores the outcome of one processing stage and extends the caller's lease."""
+        conn = self._connection()
+        now = time.time()
+        conn.execute(
+            "update jobs set stages = json_set(stages, '$.' || ?, json(?)), lease_expires_at = ?, updated_at = ?"
+            " where id = ? and lease_owner = ?",
+            (stage, json.dumps(detail), now + lease_seconds, now, job_id, worker_id),
+        )
+
+    def complete(self, job_id: str, worker_id: str, result: Dict[str, Any]) -> None:
+        conn = self._connection()
+        now = time.time()
+        conn.execute(
+            "update jobs set status = ?, result = ?, lease_owner = null, lease_expires_at = null, updated_at = ?"
+            " where id = ? and lease_owner = ?",
+            (STATUS_SUCCEEDED, json.dumps(result), now, job_id, worker_id),
+        )
+
+    def fail(self, job_id: str, worker_id: str, error: str) -> Dict[str, Any]:
+        """
+        Records a failed attempt. The job is re-queued with exponential backoff plus jitter,
+        or marked ``failed`` once it has used all of its attempts.
+        """
+        conn = self._connection()
+        now = time.time()
+        conn.execute("begin immediate")
+        try:
+            row = conn.execute(
+                "select attempts, max_attempts from jobs where id = ? and lease_owner = ?", (job_id, worker_id)
+            ).fetchone()
+            if row is None:
+                conn.execute("commit")
+                return {"retried": False, "reason": "lease_lost"}
+
+            if row["attempts"] >= row["max_attempts"]:
+                conn.execute(
+                    "update jobs set status = ?, last_error = ?, lease_owner = null, lease_expires_at = null,"
+                    " updated_at = ? where id = ?",
+                    (STATUS_FAILED, error, now, job_id),
+                )
+                conn.execute("commit")
+                return {"retried": False, "reason": "max_attempts"}
+
+            delay = min(JOB_RETRY_MAX_SECONDS, JOB_RETRY_BASE_SECONDS * 2 ** (row["attempts"] - 1))
+            delay *= random.uniform(0.8, 1.2)
+            conn.execute(
+                "update jobs set status = ?, last_error = ?, run_at = ?, lease_owner = null, lease_expires_at = null,"
+                " updated_at = ? where id = ?",
+                (STATUS_QUEUED, error, now + delay, now, job_id),
+            )
+            conn.execute("commit")
+        except BaseException:
+            conn.execute("rollback")
+            raise
+        return {"retried": True, "retry_in_seconds": round(delay, 1)}
+
+    def backlog(self, kind: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Per fair key: queued (and priority) jobs, running jobs and how long the oldest has waited."""
+        now = time.time()
+        kind_filter = " and kind = ?" if kind else ""
+        rows = self._connection().execute(
+            "select fair_key, sum(status = ?) as queued, sum(status = ? and priority > 0) as priority_queued,"
+            " sum(status = ?) as running, min(case when status = ? then created_at end) as oldest_queued_at"
+            " from jobs where status in (?, ?)"
+            f"{kind_filter} group by fair_key order by oldest_queued_at is null, oldest_queued_at",
+            [STATUS_QUEUED, STATUS_QUEUED, STATUS_RUNNING, STATUS_QUEUED, STATUS_QUEUED, STATUS_RUNNING]
+            + ([kind] if kind else []),
+        ).fetchall()
+        return [
+            {
+                "fair_key": row["fair_key"],
+                "queued": row["queued"],
+                "priority_queued": row["priority_queued"],
+                "running": row["running"],
+                "oldest_queued_seconds": round(now - row["oldest_queued_at"], 1) if row["oldest_queued_at"] else None,
+            }
+            for row in rows
+        ]
+
+    def oldest_queued_seconds(self, kind: Optional[str] = None) -> Dict[str, float]:
+        """
+        Per lane (``priority`` / ``normal``), how long the oldest due queued job has waited: since it
+        was enqueued, or since its retry came due. Lanes with nothing queued report 0.
+        """
+        now = time.time()
+        kind_filter = " and kind = ?" if kind else ""
+        rows = self._connection().execute(
+            "select priority > 0 as priority_lane, min(max(created_at, run_at)) as waiting_since"
+            f" from jobs where status = ? and run_at <= ?{kind_filter} group by priority > 0",
+            [STATUS_QUEUED, now] + ([kind] if kind else []),
+        ).fetchall()
+        waits = {"priority": 0.0, "normal": 0.0}
+        for row in rows:
+            waits["priority" if row["priority_lane"] else "normal"] = round(now - row["waiting_since"], 1)
+        return waits
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connection().execute("select * from jobs where id = ?", (job_id,)).fetchone()
+        return _row_to_job(row) if row else None
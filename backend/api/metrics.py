@@ -0,0 +1,246 @@
+"""
+Prometheus metrics for the LifeLoop API.
+
+A small in-process registry rendered in the Prometheus text format by ``GET /metrics``. An
+update is one dict lookup under an uncontended lock, so instrumenting hot paths (every
+upstream request, every pipeline stage) costs microseconds. Metrics are per process: the job
+worker and batch scripts keep their own registries.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_registry: List["_Metric"] = []
+_registry_lock = threading.Lock()
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _sample_lines(self) -> List[str]:
+        with self._lock:
+            return [
+                f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(self._values.items())
+            ]
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}", *self._sample_lines()]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: Any) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][index] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def mean(self, **labels: Any) -> Optional[float]:
+        """Average observed value for ``labels``, or ``None`` before the first observation."""
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return state[1] / state[2] if state and state[2] else None
+
+    def _sample_lines(self) -> List[str]:
+        with self._lock:
+            snapshot = [(key, list(state[0]), state[1], state[2]) for key, state in sorted(self._values.items())]
+        lines: List[str] = []
+        for key, bucket_counts, total, count in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', _format_value(bound)))} {cumulative}"
+                )
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', '+Inf'))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+def render() -> str:
+    with _registry_lock:
+        metrics = list(_registry)
+    lines: List[str] = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- LifeLoop instruments ---
+UPSTREAM_REQUEST_SECONDS = Histogram(
+    "lifeloop_upstream_request_seconds",
+    "Latency of calls to external services by upstream, operation and outcome.",
+    ("upstream", "operation", "outcome"),
+)
+UPSTREAM_IN_FLIGHT = Gauge(
+    "lifeloop_upstream_requests_in_flight", "Calls to external services currently in progress.", ("upstream",)
+)
+BYTES_TRANSFERRED = Counter(
+    "lifeloop_bytes_transferred_total", "Payload bytes sent to or received from external services.", ("upstream", "direction")
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "lifeloop_http_request_seconds", "API request duration by route, method and status.", ("route", "method", "status")
+)
+HTTP_IN_FLIGHT = Gauge("lifeloop_http_requests_in_flight", "API requests currently being handled.", ("route",))
+MEDIA_STAGE_SECONDS = Histogram(
+    "lifeloop_media_stage_seconds", "Time spent in each media processing stage.", ("stage", "outcome")
+)
+MEDIA_OLDEST_QUEUED_SECONDS = Gauge(
+    "lifeloop_media_oldest_queued_seconds",
+    "How long the oldest runnable media job has waited for a worker, read from the job queue at scrape time.",
+    ("lane",),
+)
+INGEST_ITEMS = Counter("lifeloop_ingest_items_inserted_total", "Instagram items ingested into R2 and Supabase.")
+INGEST_SKIPPED = Counter("lifeloop_ingest_skipped_total", "Instagram items skipped during ingest by reason.", ("reason",))
+
+
+class _CallOutcome:
+    __slots__ = ("outcome",)
+
+    def __init__(self) -> None:
+        self.outcome = "ok"
+
+
+@contextmanager
+def track_upstream(upstream: str, operation: str) -> Iterator[_CallOutcome]:
+    """Times one upstream call. Callers may set ``.outcome`` (e.g. ``"4xx"``); exceptions record ``"error"``."""
+    call = _CallOutcome()
+    UPSTREAM_IN_FLIGHT.inc(upstream=upstream)
+    started = time.perf_counter()
+    try:
+        yield call
+    except BaseException:
+        call.outcome = "error"
+        raise
+    finally:
+        UPSTREAM_IN_FLIGHT.dec(upstream=upstream)
+        UPSTREAM_REQUEST_SECONDS.observe(
+            time.perf_counter() - started, upstream=upstream, operation=operation, outcome=call.outcome
+        )
+
+
+def _body_size(body: Any) -> int:
+    if isinstance(body, (bytes, bytearray, str)):
+        return len(body)
+    if hasattr(body, "seek") and hasattr(body, "tell"):
+        # botocore wraps bytes bodies in seekable streams before the call is made.
+        position = body.tell()
+        size = body.seek(0, 2) - position
+        body.seek(position)
+        return size
+    return 0
+
+
+def instrument_boto_client(client: Any, upstream: str) -> None:
+    """Records latency, outcome and payload bytes for every operation made through ``client``."""
+    events = client.meta.events
+
+    def before_call(model: Any, params: Dict[str, Any], context: Dict[str, Any], **_: Any) -> None:
+        size = _body_size(params.get("body"))
+        if size:
+            BYTES_TRANSFERRED.inc(size, upstream=upstream, direction="sent")
+        UPSTREAM_IN_FLIGHT.inc(upstream=upstream)
+        context["metrics_call"] = (model.name, time.perf_counter())
+
+    def finish(context: Dict[str, Any], outcome: str) -> None:
+        call = context.pop("metrics_call", None)
+        if call is None:
+            return
+        operation, started = call
+        UPSTREAM_IN_FLIGHT.dec(upstream=upstream)
+        UPSTREAM_REQUEST_SECONDS.observe(
+            time.perf_counter() - started, upstream=upstream, operation=operation, outcome=outcome
+        )
+
+    def after_call(http_response: Any, context: Dict[str, Any], **_: Any) -> None:
+        length = http_response.headers.get("Content-Length") if http_response is not None else None
+        if length and length.isdigit():
+            BYTES_TRANSFERRED.inc(int(length), upstream=upstream, direction="received")
+        status = getattr(http_response, "status_code", 0)
+        finish(context, f"{status // 100}xx" if status else "ok")
+
+    def after_call_error(context: Dict[str, Any], **_: Any) -> None:
+        finish(context, "error")
+
+    service = client.meta.service_model.service_id.hyphenize()
+    events.register(f"before-call.{service}", before_call)
+    events.register(f"after-call.{service}", after_call)
+    events.register(f"after-call-error.{service}", after_call_error)
@@ -0,0 +1,231 @@
+"""
+Thread-based staged pipeline.
+
+Each stage owns a bounded input queue and its own pool of worker threads, so items overlap
+across stages (item N narrating while N+1 captions and N+2 downloads) while each stage's
+width can be tuned independently against its upstream's rate limits. A full queue blocks
+the previous stage, which keeps memory bounded when one upstream is slow.
+
+``AsyncStagedPipeline`` is the same model for coroutine stages on an event loop: a stage's
+width becomes a semaphore instead of a thread pool.
+"""
+import asyncio
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+_SENTINEL = object()
+
+
+@dataclass
+class Stage:
+    name: str
+    func: Callable[[Any], Any]
+    workers: int = 1
+
+
+@dataclass
+class PipelineResult:
+    index: int
+    item: Any
+    error: Optional[BaseException] = None
+    failed_stage: Optional[str] = None
+
+
+@dataclass
+class _StageStats:
+    workers: int
+    completed: int = 0
+    failed: int = 0
+    busy_seconds: float = 0.0
+    queue_wait_seconds: float = 0.0
+    first_started: Optional[float] = None
+    last_finished: Optional[float] = None
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def record(self, enqueued_at: float, begun: float, ended: float, failed: bool) -> None:
+        with self.lock:
+            self.queue_wait_seconds += begun - enqueued_at
+            self.busy_seconds += ended - begun
+            self.first_started = begun if self.first_started is None else min(self.first_started, begun)
+            self.last_finished = ended if self.last_finished is None else max(self.last_finished, ended)
+            if failed:
+                self.failed += 1
+            else:
+                self.completed += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            handled = self.completed + self.failed
+            wall = (
+                self.last_finished - self.first_started
+                if self.first_started is not None and self.last_finished is not None
+                else 0.0
+            )
+            return {
+                "workers": self.workers,
+                "completed": self.completed,
+                "failed": self.failed,
+                "busy_seconds": round(self.busy_seconds, 3),
+                "avg_seconds": round(self.busy_seconds / handled, 3) if handled else 0.0,
+                "avg_queue_wait_seconds": round(self.queue_wait_seconds / handled, 3) if handled else 0.0,
+                "wall_seconds": round(wall, 3),
+                "items_per_second": round(handled / wall, 3) if wall > 0 else None,
+                "utilisation": round(self.busy_seconds / (wall * self.workers), 3) if wall > 0 else None,
+            }
+
+
+class StagedPipeline:
+    """Runs items through ``stages`` concurrently; results come back in input order."""
+
+    def __init__(self, stages: List[Stage], *, queue_size: int = 4) -> None:
+        if not stages:
+            raise ValueError("StagedPipeline needs at least one stage.")
+        self.stages = stages
+        self.queue_size = max(1, queue_size)
+        self._stats: Dict[str, _StageStats] = {}
+        self._wall_seconds = 0.0
+
+    def run(self, items: Iterable[Any]) -> List[PipelineResult]:
+        self._stats = {stage.name: _StageStats(workers=max(1, stage.workers)) for stage in self.stages}
+        queues: List["queue.Queue[Any]"] = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        results: Dict[int, PipelineResult] = {}
+        results_lock = threading.Lock()
+        threads: List[threading.Thread] = []
+        started = time.monotonic()
+
+        for position, stage in enumerate(self.stages):
+            inbox = queues[position]
+            outbox = queues[position + 1] if position + 1 < len(queues) else None
+            next_workers = self.stages[position + 1].workers if outbox is not None else 0
+            remaining = [max(1, stage.workers)]
+            remaining_lock = threading.Lock()
+
+            def finish(result: PipelineResult) -> None:
+                with results_lock:
+                    results[result.index] = result
+
+            def worker(
+                stage: Stage = stage,
+                inbox: "queue.Queue[Any]" = inbox,
+                outbox: Optional["queue.Queue[Any]"] = outbox,
+                next_workers: int = next_workers,
+                remaining: List[int] = remaining,
+                remaining_lock: threading.Lock = remaining_lock,
+            ) -> None:
+                stats = self._stats[stage.name]
+                while True:
+                    envelope = inbox.get()
+                    if envelope is _SENTINEL:
+                        break
+                    result, enqueued_at = envelope
+                    if result.error is None:
+                        begun = time.monotonic()
+                        try:
+                            result.item = stage.func(result.item)
+                            failed = False
+                        except Exception as exc:  # noqa: BLE001 - surfaced per item
+                            result.error = exc
+                            result.failed_stage = stage.name
+                            failed = True
+                        stats.record(enqueued_at, begun, time.monotonic(), failed)
+                    if outbox is None:
+                        finish(result)
+                    else:
+                        outbox.put((result, time.monotonic()))
+
+                with remaining_lock:
+                    remaining[0] -= 1
+                    last_out = remaining[0] == 0
+                if last_out and outbox is not None:
+                    for _ in range(max(1, next_workers)):
+                        outbox.put(_SENTINEL)
+
+            for index in range(max(1, stage.workers)):
+                thread = threading.Thread(target=worker, name=f"pipeline-{stage.name}-{index}", daemon=True)
+                thread.start()
+                threads.append(thread)
+
+        count = 0
+        for index, item in enumerate(items):
+            queues[0].put((PipelineResult(index=index, item=item), time.monotonic()))
+            count += 1
+        for _ in range(max(1, self.stages[0].workers)):
+            queues[0].put(_SENTINEL)
+
+        for thread in threads:
+            thread.join()
+
+        self._wall_seconds = time.monotonic() - started
+        return [results[index] for index in range(count)]
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-stage throughput of the most recent ``run``."""
+        return {
+            "wall_seconds": round(self._wall_seconds, 3),
+            "stages": {name: stats.snapshot() for name, stats in self._stats.items()},
+        }
+
+
+class AsyncStagedPipeline:
+    """
+    ``StagedPipeline`` for ``async`` stage functions. Each stage admits at most ``workers`` items
+    at a time, and at most as many items as the threaded pipeline could hold (every worker busy
+    and every queue full) are in flight at once. Results and ``stats()`` have the same shape.
+    """
+
+    def __init__(self, stages: List[Stage], *, queue_size: int = 4) -> None:
+        if not stages:
+            raise ValueError("AsyncStagedPipeline needs at least one stage.")
+        self.stages = stages
+        self.queue_size = max(1, queue_size)
+        self._stats: Dict[str, _StageStats] = {}
+        self._wall_seconds = 0.0
+
+    async def run(self, items: Iterable[Any]) -> List[PipelineResult]:
+        self._stats = {stage.name: _StageStats(workers=max(1, stage.workers)) for stage in self.stages}
+        gates = {stage.name: asyncio.Semaphore(max(1, stage.workers)) for stage in self.stages}
+        capacity = sum(max(1, stage.workers) for stage in self.stages) + self.queue_size * len(self.stages)
+        admission = asyncio.Semaphore(capacity)
+        started = time.monotonic()
+
+        async def advance(result: PipelineResult) -> None:
+            ready_at = time.monotonic()
+            try:
+                for stage in self.stages:
+                    func: Callable[[Any], Awaitable[Any]] = stage.func
+                    async with gates[stage.name]:
+                        begun = time.monotonic()
+                        try:
+                            result.item = await func(result.item)
+                        except Exception as exc:  # noqa: BLE001 - surfaced per item
+                            result.error = exc
+                            result.failed_stage = stage.name
+                        ended = time.monotonic()
+                    self._stats[stage.name].record(ready_at, begun, ended, result.error is not None)
+                    if result.error is not None:
+                        break
+                    ready_at = ended
+            finally:
+                admission.release()
+
+        results: List[PipelineResult] = []
+        tasks: List["asyncio.Task[None]"] = []
+        for index, item in enumerate(items):
+            await admission.acquire()
+            result = PipelineResult(index=index, item=item)
+            results.append(result)
+            tasks.append(asyncio.ensure_future(advance(result)))
+        await asyncio.gather(*tasks)
+
+        self._wall_seconds = time.monotonic() - started
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-stage throughput of the most recent ``run``."""
+        return {
+            "wall_seconds": round(self._wall_seconds, 3),
+            "stages": {name: stats.snapshot() for name, stats in self._stats.items()},
+        }
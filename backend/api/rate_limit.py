@@ -0,0 +1,72 @@
+"""
+Token-bucket rate limiting shared by batch jobs (digest dispatch, scheduled ingestion).
+"""
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+class TokenBucket:
+    """
+    Allows ``rate`` acquisitions per second on average with bursts of up to ``capacity``.
+    ``acquire`` blocks until a token is available and is safe to call from many threads;
+    ``reserve`` is the non-blocking form for async callers.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None) -> None:
+        if rate <= 0:
+            raise ValueError("TokenBucket rate must be positive.")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self._acquired = 0
+        self._throttled = 0
+        self._waited_seconds = 0.0
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """Takes ``tokens`` from the bucket, sleeping as needed. Returns the seconds spent waiting."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    self._acquired += 1
+                    if waited:
+                        self._throttled += 1
+                        self._waited_seconds += waited
+                    return waited
+                delay = (tokens - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def reserve(self, tokens: float = 1.0) -> float:
+        """
+        Takes ``tokens`` now, going into debt if the bucket is short, and returns how long the
+        caller must wait before using them. For event loops, which sleep without blocking.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= tokens
+            self._acquired += 1
+            delay = max(0.0, -self._tokens / self.rate)
+            if delay:
+                self._throttled += 1
+                self._waited_seconds += delay
+            return delay
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "rate_per_second": self.rate,
+                "acquired": self._acquired,
+                "throttled": self._throttled,
+                "waited_seconds": round(self._waited_seconds, 3),
+            }
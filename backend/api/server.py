@@ -1,18 +1,39 @@
+import atexit
 import base64
 import datetime as dt
+import hashlib
+import itertools
 import json
 import logging
 import os
+import socket
+import threading
+import time
 import uuid
-from typing import Any, Dict, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Set, Tuple
+from urllib.parse import quote, urlencode
 
 import boto3
+import deadlines
+import http_clients
+import metrics
 import requests
 import resend
+from botocore.config import Config as BotoConfig
+from botocore.exceptions import ClientError
 from email_templates import (render_digest_email,
                              render_parent_confirmation_email)
-from flask import Flask, Response, jsonify, request
+from auth import TokenVerifier
+from batching import BatchWriter
+from cache import TTLCache, build_cache
+from image_preprocessing import derived_image_key, downsize_for_caption
+from jobs import PROCESS_MEDIA_JOB, JobQueue
+from pipeline import Stage, StagedPipeline
+from flask import Flask, Response, g, jsonify, request
 from flask_cors import CORS
+from werkzeug.http import http_date, parse_date
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -23,7 +44,7 @@ CORS(
     app,
     resources={r"/*": {"origins": ALLOWED_ORIGINS}},
     supports_credentials=True,
-    allow_headers=["Content-Type", "Authorization"],
+    allow_headers=["Content-Type", "Authorization", deadlines.DEADLINE_HEADER],
     expose_headers=["Content-Type"],
 )
 
@@ -37,19 +58,45 @@ s3 = boto3.client(
     endpoint_url=os.getenv("R2_ENDPOINT_URL"),
     aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
     aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+    config=BotoConfig(
+        max_pool_connections=int(os.getenv("R2_MAX_POOL_CONNECTIONS", "32")),
+        retries={"max_attempts": int(os.getenv("R2_MAX_ATTEMPTS", "3")), "mode": "standard"},
+    ),
 )
 
+metrics.instrument_boto_client(s3, "r2")
+deadlines.guard_boto_client(s3)
+
 BUCKET_NAME = os.getenv("R2_BUCKET_NAME")
 R2_PUBLIC_BASE_URL = os.getenv("R2_PUBLIC_BASE_URL")
+# Multipart part size. R2 requires every part but the last to be the same size and at least 5 MiB.
+R2_MIN_PART_BYTES = 5 * 1024 * 1024
+R2_TRANSFER_CHUNK_BYTES = max(R2_MIN_PART_BYTES, int(os.getenv("R2_TRANSFER_CHUNK_BYTES", str(8 * 1024 * 1024))))
+HTTP_READ_CHUNK_BYTES = 64 * 1024
 APP_BASE_URL = os.getenv("APP_BASE_URL")
 
+# Media delivery for GET /transcribe-image: "proxy" streams bytes through this API, "presigned"
+# redirects to a short-lived presigned R2 URL so media bypasses the Flask workers.
+MEDIA_DELIVERY_MODE = os.getenv("MEDIA_DELIVERY_MODE", "proxy").lower()
+# Base URL of this API, used to store stable (redirecting) media URLs when the bucket is private.
+API_PUBLIC_BASE_URL = (os.getenv("API_PUBLIC_BASE_URL") or "").rstrip("/")
+R2_PRESIGNED_URL_TTL_SECONDS = int(os.getenv("R2_PRESIGNED_URL_TTL_SECONDS", "3600"))
+# A cached signature is reused until it has less than this long left to live.
+R2_PRESIGNED_URL_MIN_REMAINING_SECONDS = int(os.getenv("R2_PRESIGNED_URL_MIN_REMAINING_SECONDS", "300"))
+presigned_url_cache = TTLCache(max_entries=int(os.getenv("R2_PRESIGNED_URL_CACHE_SIZE", "4096")))
+
+# Media served through /transcribe-image. Keys can be rewritten (re-narration), so clients
+# revalidate with the ETag after max-age instead of treating objects as immutable.
+MEDIA_CACHE_MAX_AGE_SECONDS = int(os.getenv("MEDIA_CACHE_MAX_AGE_SECONDS", str(7 * 24 * 3600)))
+MEDIA_CACHE_CONTROL = f"private, max-age={MEDIA_CACHE_MAX_AGE_SECONDS}"
+
 
 # --- Supabase REST Configuration ---
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_REST_URL = f"{SUPABASE_URL.rstrip('/')}/rest/v1" if SUPABASE_URL else None
 SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
 
-supabase_session = requests.Session()
+supabase_session = http_clients.session("supabase")
 if SUPABASE_SERVICE_KEY:
     supabase_session.headers.update(
         {
@@ -60,6 +107,12 @@ if SUPABASE_SERVICE_KEY:
         }
     )
 
+# Profiles are read on every consent check; cache them briefly and drop entries on our own writes.
+PROFILE_CACHE_TTL_SECONDS = float(os.getenv("PROFILE_CACHE_TTL_SECONDS", "60"))
+PROFILE_CACHE_MAX_ENTRIES = int(os.getenv("PROFILE_CACHE_MAX_ENTRIES", "4096"))
+PROFILE_BULK_FETCH_CHUNK = 200
+profile_cache = TTLCache(max_entries=PROFILE_CACHE_MAX_ENTRIES, ttl=PROFILE_CACHE_TTL_SECONDS)
+
 
 def _supabase_headers(prefer: Optional[str] = None) -> Dict[str, str]:
     if not SUPABASE_SERVICE_KEY:
@@ -79,13 +132,12 @@ def _fetch_authenticated_user(access_token: str) -> Dict[str, Any]:
     if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
         raise RuntimeError("Supabase authentication not configured.")
 
-    response = requests.get(
+    response = supabase_session.get(
         f"{SUPABASE_URL.rstrip('/')}/auth/v1/user",
         headers={
             "Authorization": f"Bearer {access_token}",
             "apikey": SUPABASE_SERVICE_KEY,
         },
-        timeout=30,
     )
 
     if response.status_code == 401:
@@ -95,40 +147,76 @@ def _fetch_authenticated_user(access_token: str) -> Dict[str, Any]:
     return response.json()
 
 
+token_verifier = TokenVerifier(remote_lookup=_fetch_authenticated_user)
+
+
 def _upsert_user_profile(payload: Dict[str, Any]) -> Dict[str, Any]:
     headers = _supabase_headers("return=representation,resolution=merge-duplicates")
-    response = requests.post(
+    response = supabase_session.post(
         f"{SUPABASE_REST_URL}/user_profiles",
         headers=headers,
         data=json.dumps([payload]),
-        timeout=30,
     )
     response.raise_for_status()
+    profile_cache.delete(payload["id"])
     body = response.json()
     return body[0] if body else payload
 
 
 def _insert_parent_confirmation(payload: Dict[str, Any]) -> Dict[str, Any]:
     headers = _supabase_headers("return=representation")
-    response = requests.post(
+    response = supabase_session.post(
         f"{SUPABASE_REST_URL}/parent_confirmations",
         headers=headers,
         data=json.dumps(payload),
-        timeout=30,
     )
     response.raise_for_status()
     body = response.json()
     return body[0] if isinstance(body, list) and body else body
 
 
-def _upload_voice_sample_for_user(user_id: str, filename: str, body: bytes, content_type: Optional[str]) -> str:
-    if not BUCKET_NAME:
-        raise RuntimeError("R2 bucket configuration missing. Set R2_BUCKET_NAME.")
+def _object_url(key: str) -> str:
+    """
+    URL to store for an uploaded object: the public R2 URL when the bucket is public, a stable
+    API URL that redirects to a fresh presigned URL in presigned mode, otherwise the bare key.
+    """
+    if R2_PUBLIC_BASE_URL:
+        return f"{R2_PUBLIC_BASE_URL.rstrip('/')}/{key}"
+    if MEDIA_DELIVERY_MODE == "presigned" and API_PUBLIC_BASE_URL:
+        return f"{API_PUBLIC_BASE_URL}/transcribe-image?{urlencode({'filename': key})}"
+    return key
+
+
+def _presigned_media_url(key: str) -> Tuple[str, int]:
+    """
+    Returns a presigned GET URL for ``key`` and how many more seconds it may be handed out.
+    Signatures are cached so repeated requests for the same object share one URL (and one
+    browser cache entry) until it nears expiry.
+    """
+    cached = presigned_url_cache.get(key)
+    if cached is not None:
+        return cached["url"], max(0, int(cached["reuse_until"] - time.time()))
+
+    url = s3.generate_presigned_url(
+        "get_object", Params={"Bucket": BUCKET_NAME, "Key": key}, ExpiresIn=R2_PRESIGNED_URL_TTL_SECONDS
+    )
+    reuse_for = max(0, R2_PRESIGNED_URL_TTL_SECONDS - R2_PRESIGNED_URL_MIN_REMAINING_SECONDS)
+    if reuse_for:
+        presigned_url_cache.set(key, {"url": url, "reuse_until": time.time() + reuse_for}, ttl=reuse_for)
+    return url, reuse_for
+
 
+def _voice_sample_key(user_id: str, filename: str) -> str:
     safe_name = filename or "voice-sample"
     safe_name = safe_name.replace(" ", "_")
-    key = f"voice-samples/{user_id}/{int(dt.datetime.utcnow().timestamp())}-{safe_name}"
+    return f"voice-samples/{user_id}/{int(dt.datetime.utcnow().timestamp())}-{safe_name}"
 
+
+def _upload_voice_sample_for_user(user_id: str, filename: str, body: bytes, content_type: Optional[str]) -> str:
+    if not BUCKET_NAME:
+        raise RuntimeError("R2 bucket configuration missing. Set R2_BUCKET_NAME.")
+
+    key = _voice_sample_key(user_id, filename)
     s3.put_object(
         Bucket=BUCKET_NAME,
         Key=key,
@@ -136,10 +224,7 @@ def _upload_voice_sample_for_user(user_id: str, filename: str, body: bytes, cont
         ContentType=content_type or "audio/mpeg",
         ACL="private",
     )
-
-    if R2_PUBLIC_BASE_URL:
-        return f"{R2_PUBLIC_BASE_URL.rstrip('/')}/{key}"
-    return key
+    return _object_url(key)
 
 
 def _register_elevenlabs_voice(user_id: str, filename: str, body: bytes, content_type: Optional[str]) -> Optional[str]:
@@ -156,12 +241,11 @@ def _register_elevenlabs_voice(user_id: str, filename: str, body: bytes, content
     }
     data = {"name": f"LifeLoop-{user_id}"}
     try:
-        response = requests.post(
-            "https://api.elevenlabs.io/v1/voices/add",
+        response = http_clients.session("elevenlabs").post(
+            f"{ELEVENLABS_API_BASE_URL}/v1/voices/add",
             headers={"xi-api-key": ELEVENLABS_API_KEY},
             files=files,
             data=data,
-            timeout=120,
         )
         if not response.ok:
             logger.warning("ElevenLabs voice clone failed: %s", response.text)
@@ -181,6 +265,25 @@ RAPIDAPI_URL = os.getenv(
     "https://instagram-scraper-api3.p.rapidapi.com/user_posts",
 )
 RAPIDAPI_TIMEOUT = int(os.getenv("RAPIDAPI_TIMEOUT", "30"))
+RAPIDAPI_PAGINATION_PARAM = os.getenv("RAPIDAPI_PAGINATION_PARAM", "pagination_token")
+# Upper bound on pages walked per incremental ingest before giving up on reaching known media.
+INGEST_MAX_PAGES = max(1, int(os.getenv("INGEST_MAX_PAGES", "5")))
+
+
+# --- Ingestion Concurrency ---
+INGEST_PARALLEL = os.getenv("INGEST_PARALLEL", "true").lower() in {"true", "1", "yes"}
+# Downloads stream straight into R2, so a download slot holds one CDN response open for the
+# whole transfer; upload slots cap the R2 writes (PUTs and parts) those transfers make at once.
+# INGEST_TRANSFER_CONCURRENCY is the older name of the download limit.
+INGEST_DOWNLOAD_CONCURRENCY = max(
+    1, int(os.getenv("INGEST_DOWNLOAD_CONCURRENCY") or os.getenv("INGEST_TRANSFER_CONCURRENCY") or "6")
+)
+INGEST_UPLOAD_CONCURRENCY = max(1, int(os.getenv("INGEST_UPLOAD_CONCURRENCY", "4")))
+INGEST_MAX_OBJECT_BYTES = int(os.getenv("INGEST_MAX_OBJECT_BYTES", str(100 * 1024 * 1024)))
+# Skip reasons that leave an item eligible for the next run; the ingest cursor never moves past them.
+INGEST_RETRYABLE_SKIPS = frozenset({"lookup_failed", "download_failed", "upload_failed", "deadline_exceeded"})
+# Signed CDN URLs are long; the dedup lookup splits them so each query string stays under this.
+INGEST_LOOKUP_MAX_QUERY_CHARS = max(1024, int(os.getenv("INGEST_LOOKUP_MAX_QUERY_CHARS", "6000")))
 
 
 # --- Gemini Configuration ---
@@ -196,11 +299,91 @@ DEFAULT_GEMINI_PROMPT = (
     "Write in a warm, conversational tone with one evocative detail."
 )
 
+# Captions are keyed by image content + prompt + model, so re-ingested posts and reposts reuse them.
+CAPTION_CACHE_MAX_ENTRIES = int(os.getenv("CAPTION_CACHE_MAX_ENTRIES", "2048"))
+CAPTION_CACHE_TTL_SECONDS = float(os.getenv("CAPTION_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+CAPTION_CACHE_DB_PATH = os.getenv("CAPTION_CACHE_DB_PATH", "lifeloop_cache.sqlite3")
+caption_cache = build_cache(
+    namespace="gemini_captions",
+    max_entries=CAPTION_CACHE_MAX_ENTRIES,
+    ttl=CAPTION_CACHE_TTL_SECONDS,
+    sqlite_path=CAPTION_CACHE_DB_PATH,
+)
+
 
 # --- ElevenLabs Configuration ---
 ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
+ELEVENLABS_API_BASE_URL = os.getenv("ELEVENLABS_API_BASE_URL", "https://api.elevenlabs.io").rstrip("/")
 ELEVENLABS_VOICE_ID = os.getenv("ELEVENLABS_VOICE_ID") or os.getenv("ELEVENLABS_SAMPLE_VOICE_ID")
 ELEVENLABS_MODEL_ID = os.getenv("ELEVENLABS_MODEL_ID", "eleven_multilingual_v2")
+ELEVENLABS_DEFAULT_VOICE_ID = "21m00Tcm4TlvDq8ikWAM"  # Rachel
+NARRATION_VOICE_SETTINGS = {
+    "stability": 0.4,
+    "similarity_boost": 0.6,
+    "style": 0.5,
+}
+
+# Streaming mode reads the /stream TTS endpoint straight into R2 (multipart past one part) instead
+# of buffering the whole clip before uploading it.
+NARRATION_STREAMING = os.getenv("NARRATION_STREAMING", "true").lower() in {"true", "1", "yes"}
+
+# Identical (voice, model, settings, text) narrations reuse the first uploaded R2 object.
+NARRATION_CACHE_MAX_ENTRIES = int(os.getenv("NARRATION_CACHE_MAX_ENTRIES", "2048"))
+NARRATION_CACHE_TTL_SECONDS = float(os.getenv("NARRATION_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+NARRATION_CACHE_DB_PATH = os.getenv("NARRATION_CACHE_DB_PATH", "lifeloop_cache.sqlite3")
+narration_cache = build_cache(
+    namespace="elevenlabs_narrations",
+    max_entries=NARRATION_CACHE_MAX_ENTRIES,
+    ttl=NARRATION_CACHE_TTL_SECONDS,
+    sqlite_path=NARRATION_CACHE_DB_PATH,
+)
+
+# --- Media Processing Pipeline ---
+# Worker threads per stage; tune against each upstream's rate limits.
+PIPELINE_STAGE_WORKERS = {
+    "fetch_image": max(1, int(os.getenv("PIPELINE_FETCH_WORKERS", "4"))),
+    "preprocess": max(1, int(os.getenv("PIPELINE_PREPROCESS_WORKERS", "2"))),
+    "caption": max(1, int(os.getenv("PIPELINE_CAPTION_WORKERS", "2"))),
+    "narration": max(1, int(os.getenv("PIPELINE_NARRATION_WORKERS", "2"))),
+    "update_record": max(1, int(os.getenv("PIPELINE_UPDATE_WORKERS", "2"))),
+}
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "4"))
+
+# --- Media Processing Leases ---
+# Rows are claimed through the claim_instagram_media RPC (docs/supabase.sql) before processing, so
+# concurrent calls and workers never pay twice for one row. A lease must outlast the slowest
+# pass; rows left behind by a crashed run become claimable again once it expires.
+MEDIA_LEASE_SECONDS = int(os.getenv("MEDIA_LEASE_SECONDS", "600"))
+
+# --- Media Processing Fairness ---
+# Rows and queued jobs are dealt round-robin across students, with at most
+# MEDIA_MAX_IN_FLIGHT_PER_USER in flight per student (0: no cap). First-time students and explicit
+# media_id requests go in the priority lane.
+MEDIA_MAX_IN_FLIGHT_PER_USER = int(os.getenv("MEDIA_MAX_IN_FLIGHT_PER_USER", "2"))
+MEDIA_PRIORITY_LANE = 1
+# Queue mode deals its batch round-robin from this many of the newest unprocessed rows.
+MEDIA_FAIR_SCAN_ROWS = int(os.getenv("MEDIA_FAIR_SCAN_ROWS", "200"))
+
+# --- Media Result Write-back ---
+# Processed rows are written back in one bulk upsert per RESULT_WRITE_BATCH_SIZE rows, or after
+# RESULT_WRITE_MAX_DELAY_MS, instead of a PATCH per record.
+RESULT_WRITE_BATCH_SIZE = max(1, int(os.getenv("RESULT_WRITE_BATCH_SIZE", "50")))
+RESULT_WRITE_MAX_DELAY_MS = float(os.getenv("RESULT_WRITE_MAX_DELAY_MS", "100"))
+
+# --- Request Deadlines ---
+# A request's budget comes from the X-Request-Timeout-Ms header, else its route's default here
+# (0: none). Upstream timeouts shrink to what is left, and media items that can no longer finish
+# are skipped and reported as deadline_exceeded. Keep the defaults under the proxy timeout.
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "0"))
+ROUTE_DEADLINE_SECONDS = {
+    "/process/instagram-media": float(os.getenv("PROCESS_MEDIA_DEADLINE_SECONDS", "55")),
+    "/ingest/instagram": float(os.getenv("INGEST_DEADLINE_SECONDS", "55")),
+}
+DEADLINE_EXCEEDED = "deadline_exceeded"
+
+# --- Background Jobs ---
+PROCESSING_MODE = os.getenv("PROCESSING_MODE", "sync").lower()
+job_queue = JobQueue()
 
 # --- Resend Configuration ---
 RESEND_API_KEY = os.getenv("RESEND_API_KEY")
@@ -230,60 +413,385 @@ def _upload_audio_to_r2(key: str, audio_bytes: bytes, content_type: str) -> str:
         raise RuntimeError("R2 bucket configuration missing. Set R2_BUCKET_NAME.")
 
     s3.put_object(Bucket=BUCKET_NAME, Key=key, Body=audio_bytes, ContentType=content_type, ACL="private")
-    if R2_PUBLIC_BASE_URL:
-        return f"{R2_PUBLIC_BASE_URL.rstrip('/')}/{key}"
-    return key
+    return _object_url(key)
 
 
-def _fetch_instagram_media(
-    media_id: Optional[str] = None, *, limit: int = 10, only_unprocessed: bool = True
-) -> List[Dict[str, Any]]:
-    _require_supabase_configuration()
+def _instagram_media_query(media_id: Optional[str], limit: int, only_unprocessed: bool) -> Dict[str, Any]:
     params: Dict[str, Any] = {"select": "*", "limit": limit, "order": "created_at.desc"}
     if media_id:
         params["id"] = f"eq.{media_id}"
     elif only_unprocessed:
         params["processed_at"] = "is.null"
+    return params
+
 
-    response = supabase_session.get(f"{SUPABASE_REST_URL}/instagram_media", params=params, timeout=30)
+def _fetch_instagram_media(
+    media_id: Optional[str] = None, *, limit: int = 10, only_unprocessed: bool = True
+) -> List[Dict[str, Any]]:
+    _require_supabase_configuration()
+    response = supabase_session.get(
+        f"{SUPABASE_REST_URL}/instagram_media", params=_instagram_media_query(media_id, limit, only_unprocessed)
+    )
     response.raise_for_status()
     return response.json()
 
 
-def _fetch_recent_media_for_user(user_id: str, limit: int = 5) -> List[Dict[str, Any]]:
+def _fair_scan_params(limit: int) -> Dict[str, Any]:
+    """
+    Queue mode's fair scan: the newest ``limit`` unprocessed rows not under a live lease (so rows
+    an inline run is processing are not queued behind it), with just the columns the
+    round-robin and the enqueue read.
+    """
+    now = dt.datetime.utcnow().isoformat()
+    return {
+        "select": "id,user_id,created_at",
+        "processed_at": "is.null",
+        "or": f"(lease_expires_at.is.null,lease_expires_at.lte.{now})",
+        "order": "created_at.desc",
+        "limit": limit,
+    }
+
+
+def _fetch_fair_scan_rows(limit: int) -> List[Dict[str, Any]]:
     _require_supabase_configuration()
-    params: Dict[str, Any] = {
+    response = supabase_session.get(f"{SUPABASE_REST_URL}/instagram_media", params=_fair_scan_params(limit))
+    response.raise_for_status()
+    return response.json()
+
+
+def _media_lease_owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def _claim_request(owner: str, media_id: Optional[str], limit: int, only_unprocessed: bool) -> Dict[str, Any]:
+    return {
+        "p_owner": owner,
+        "p_limit": limit,
+        "p_lease_seconds": MEDIA_LEASE_SECONDS,
+        "p_media_id": media_id,
+        "p_only_unprocessed": only_unprocessed,
+        "p_max_per_user": MEDIA_MAX_IN_FLIGHT_PER_USER if MEDIA_MAX_IN_FLIGHT_PER_USER > 0 else None,
+    }
+
+
+def _fair_order(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Deals ``records`` round-robin across ``user_id``s: each student's newest row, then each
+    student's second newest, and so on, so one deep backlog does not go first as a block.
+    Students are taken in the order their first row appears.
+    """
+    by_user: Dict[Any, List[Dict[str, Any]]] = {}
+    for record in records:
+        by_user.setdefault(record.get("user_id"), []).append(record)
+    queues = [
+        sorted(rows, key=lambda row: row.get("created_at") or "", reverse=True) for rows in by_user.values()
+    ]
+    ordered: List[Dict[str, Any]] = []
+    for slot in range(max((len(rows) for rows in queues), default=0)):
+        ordered.extend(rows[slot] for rows in queues if slot < len(rows))
+    return ordered
+
+
+def _claim_instagram_media(
+    owner: str, *, media_id: Optional[str] = None, limit: int = 10, only_unprocessed: bool = True
+) -> List[Dict[str, Any]]:
+    """
+    Leases up to ``limit`` rows to ``owner`` in one atomic RPC, in ``_fair_order``. Rows under
+    another caller's live lease are skipped, so concurrent claims never overlap; the RPC also
+    applies the per-student cap and puts first-time students first.
+    """
+    _require_supabase_configuration()
+    response = supabase_session.post(
+        f"{SUPABASE_REST_URL}/rpc/claim_instagram_media",
+        data=json.dumps(_claim_request(owner, media_id, limit, only_unprocessed)),
+    )
+    response.raise_for_status()
+    return _fair_order(response.json())
+
+
+def _processed_users_query(user_ids: List[str]) -> Dict[str, Any]:
+    return {"select": "user_id", "user_id": _postgrest_in_filter(user_ids), "processed_at": "not.is.null"}
+
+
+def _users_with_processed_media(user_ids: List[str]) -> Set[str]:
+    """The subset of ``user_ids`` with at least one processed row, i.e. not first-time students."""
+    if not user_ids:
+        return set()
+    _require_supabase_configuration()
+    response = supabase_session.get(f"{SUPABASE_REST_URL}/instagram_media", params=_processed_users_query(user_ids))
+    response.raise_for_status()
+    return {row.get("user_id") for row in response.json()}
+
+
+def _media_job_priority(record: Dict[str, Any], explicit: bool, returning_users: Set[str]) -> int:
+    if explicit or record.get("user_id") not in returning_users:
+        return MEDIA_PRIORITY_LANE
+    return 0
+
+
+def _fetch_media_backlog() -> List[Dict[str, Any]]:
+    _require_supabase_configuration()
+    response = supabase_session.post(f"{SUPABASE_REST_URL}/rpc/media_processing_backlog", data="{}")
+    response.raise_for_status()
+    return response.json()
+
+
+def _merge_media_backlog(rows: List[Dict[str, Any]], jobs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Joins the Supabase per-student backlog with the job queue's per-``fair_key`` counts."""
+    now = dt.datetime.now(dt.timezone.utc)
+    jobs_by_user = {entry["fair_key"]: entry for entry in jobs}
+    merged: List[Dict[str, Any]] = []
+    for row in rows:
+        oldest = _parse_sortable_timestamp(row.get("oldest_unprocessed_at"))
+        job_stats = jobs_by_user.pop(row.get("user_id"), None)
+        merged.append(
+            {
+                "user_id": row.get("user_id"),
+                "lane": "priority" if row.get("first_time") else "normal",
+                "unprocessed": row.get("unprocessed", 0),
+                "in_flight": row.get("leased", 0),
+                "oldest_waiting_seconds": round((now - oldest).total_seconds(), 1) if oldest else None,
+                "jobs": {key: value for key, value in job_stats.items() if key != "fair_key"} if job_stats else None,
+            }
+        )
+    for user_id, job_stats in jobs_by_user.items():
+        if user_id is None:
+            continue
+        merged.append(
+            {
+                "user_id": user_id,
+                "lane": None,
+                "unprocessed": 0,
+                "in_flight": 0,
+                "oldest_waiting_seconds": None,
+                "jobs": {key: value for key, value in job_stats.items() if key != "fair_key"},
+            }
+        )
+    return merged
+
+
+def _lease_release_query(media_ids: List[str], owner: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """``(params, body)`` of the PATCH that drops ``owner``'s leases on ``media_ids``."""
+    params = {"id": _postgrest_in_filter(media_ids), "lease_owner": f"eq.{owner}"}
+    return params, {"lease_owner": None, "lease_expires_at": None}
+
+
+def _release_instagram_media_leases(media_ids: List[str], owner: str) -> None:
+    """Makes rows that failed processing claimable again without waiting for the lease to expire."""
+    if not media_ids:
+        return
+    try:
+        _require_supabase_configuration()
+        params, body = _lease_release_query(media_ids, owner)
+        with deadlines.suspended():
+            response = supabase_session.patch(
+                f"{SUPABASE_REST_URL}/instagram_media", params=params, data=json.dumps(body)
+            )
+        response.raise_for_status()
+    except Exception:
+        logger.exception("Failed to release leases on %s media rows; they free up when the lease expires.", len(media_ids))
+
+
+def _recent_media_query(user_id: str, limit: int) -> Dict[str, Any]:
+    return {
         "select": "*",
         "user_id": f"eq.{user_id}",
         "processed_at": "not.is.null",
         "order": "processed_at.desc",
         "limit": limit,
     }
-    response = supabase_session.get(f"{SUPABASE_REST_URL}/instagram_media", params=params, timeout=30)
+
+
+def _fetch_recent_media_for_user(user_id: str, limit: int = 5) -> List[Dict[str, Any]]:
+    _require_supabase_configuration()
+    response = supabase_session.get(
+        f"{SUPABASE_REST_URL}/instagram_media", params=_recent_media_query(user_id, limit)
+    )
     response.raise_for_status()
     return response.json()
 
 
+def _fetch_recent_media_for_users(
+    user_ids: List[str], *, since: str, until: Optional[str] = None, per_user_limit: int = 5
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Loads each user's newest ``per_user_limit`` items processed since ``since`` (and before
+    ``until``, if given) with one ``recent_media_for_users`` RPC. The limit is applied per user
+    in SQL, so PostgREST's ``max-rows`` cannot silently cut off the users late in the page.
+    """
+    if not user_ids:
+        return {}
+    _require_supabase_configuration()
+    response = supabase_session.post(
+        f"{SUPABASE_REST_URL}/rpc/recent_media_for_users",
+        data=json.dumps(
+            {"p_user_ids": user_ids, "p_since": since, "p_until": until, "p_per_user": per_user_limit}
+        ),
+    )
+    response.raise_for_status()
+
+    media_by_user: Dict[str, List[Dict[str, Any]]] = {user_id: [] for user_id in user_ids}
+    for row in response.json():
+        media_by_user.setdefault(row["user_id"], []).append(row)
+    return media_by_user
+
+
+def _fetch_confirmed_profiles_page(after_id: Optional[str], page_size: int) -> List[Dict[str, Any]]:
+    """
+    One keyset page of parent-confirmed profiles ordered by id, starting after ``after_id``.
+    The rows prime the profile cache, so per-profile lookups later in a batch run stay in memory.
+    """
+    _require_supabase_configuration()
+    params: Dict[str, Any] = {
+        "select": "*",
+        "is_parent_confirmed": "eq.true",
+        "order": "id.asc",
+        "limit": page_size,
+    }
+    if after_id:
+        params["id"] = f"gt.{after_id}"
+    response = supabase_session.get(f"{SUPABASE_REST_URL}/user_profiles", params=params)
+    response.raise_for_status()
+    profiles = response.json()
+    for profile in profiles:
+        profile_cache.set(profile["id"], dict(profile))
+    return profiles
+
+
 def _update_instagram_media(media_id: str, updates: Dict[str, Any]) -> Dict[str, Any]:
     _require_supabase_configuration()
     response = supabase_session.patch(
-        f"{SUPABASE_REST_URL}/instagram_media", params={"id": f"eq.{media_id}"}, data=json.dumps(updates), timeout=30
+        f"{SUPABASE_REST_URL}/instagram_media", params={"id": f"eq.{media_id}"}, data=json.dumps(updates)
     )
     response.raise_for_status()
     data = response.json()
-    return data[0] if data else updates
+    if not data:
+        raise RuntimeError(f"Media record {media_id} no longer exists.")
+    return data[0]
+
+
+def _media_result_row(record: Dict[str, Any], updates: Dict[str, Any]) -> Dict[str, Any]:
+    return {"id": record["id"], **updates}
+
+
+def _update_instagram_media_results(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Update-only bulk write via the ``update_instagram_media_results`` RPC; returns the rows it matched."""
+    _require_supabase_configuration()
+    response = supabase_session.post(
+        f"{SUPABASE_REST_URL}/rpc/update_instagram_media_results",
+        data=json.dumps({"p_rows": rows}),
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def _write_media_results(entries: List[Tuple[Dict[str, Any], Dict[str, Any]]]) -> List[Any]:
+    """
+    ``BatchWriter`` callback for ``(record, updates)`` pairs: one bulk update for the batch. Rows
+    it did not match (deleted while their result was buffered) come back as per-row errors. If
+    the bulk update fails, each row is retried with its own PATCH so an error is reported
+    against the row that caused it, as it was before batching.
+    """
+    rows = [_media_result_row(record, updates) for record, updates in entries]
+    try:
+        written = {row.get("id"): row for row in _update_instagram_media_results(rows)}
+        return [
+            written.get(row["id"]) or RuntimeError(f"Media record {row['id']} no longer exists.") for row in rows
+        ]
+    except Exception:
+        logger.warning("Bulk write of %s media results failed; retrying row by row.", len(rows), exc_info=True)
+
+    results: List[Any] = []
+    for record, updates in entries:
+        try:
+            results.append(_update_instagram_media(record["id"], updates))
+        except Exception as exc:
+            results.append(exc)
+    return results
+
 
+media_result_writer = BatchWriter(
+    _write_media_results,
+    max_batch=RESULT_WRITE_BATCH_SIZE,
+    max_delay=RESULT_WRITE_MAX_DELAY_MS / 1000,
+    name="media-result-writer",
+)
+atexit.register(media_result_writer.close)
+
+
+def _postgrest_in_filter(values: List[str]) -> str:
+    quoted = []
+    for value in values:
+        escaped = value.replace("\\", "\\\\").replace('"', '\\"')
+        quoted.append(f'"{escaped}"')
+    return f"in.({','.join(quoted)})"
+
+
+def _in_filter_chunks(values: List[str], max_chars: int) -> List[List[str]]:
+    """Splits ``values`` into groups whose URL-encoded ``in.(...)`` filter stays under ``max_chars``."""
+    overhead = 32  # column name, "in.(" and ")", encoded
+    chunks: List[List[str]] = []
+    current: List[str] = []
+    size = overhead
+    for value in values:
+        # The value plus its two quotes and a comma, each percent-encoded.
+        length = len(quote(value, safe="")) + 9
+        if current and size + length > max_chars:
+            chunks.append(current)
+            current, size = [], overhead
+        current.append(value)
+        size += length
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _fetch_profile(profile_id: str, *, use_cache: bool = True) -> Optional[Dict[str, Any]]:
+    if use_cache:
+        cached = profile_cache.get(profile_id)
+        if cached is not None:
+            return dict(cached)
 
-def _fetch_profile(profile_id: str) -> Optional[Dict[str, Any]]:
     _require_supabase_configuration()
     response = supabase_session.get(
         f"{SUPABASE_REST_URL}/user_profiles",
         params={"id": f"eq.{profile_id}", "select": "*"},
-        timeout=30,
     )
     response.raise_for_status()
     data = response.json()
-    return data[0] if data else None
+    if not data:
+        return None
+    profile_cache.set(profile_id, data[0])
+    return dict(data[0])
+
+
+def _fetch_profiles(profile_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Loads many profiles at once, serving what it can from the profile cache and fetching the
+    rest with ``in.(...)`` queries. Returns a mapping of id to profile; unknown ids are absent.
+    """
+    profiles: Dict[str, Dict[str, Any]] = {}
+    missing: List[str] = []
+    for profile_id in dict.fromkeys(profile_ids):
+        cached = profile_cache.get(profile_id)
+        if cached is not None:
+            profiles[profile_id] = dict(cached)
+        else:
+            missing.append(profile_id)
+
+    if missing:
+        _require_supabase_configuration()
+    for start in range(0, len(missing), PROFILE_BULK_FETCH_CHUNK):
+        chunk = missing[start : start + PROFILE_BULK_FETCH_CHUNK]
+        response = supabase_session.get(
+            f"{SUPABASE_REST_URL}/user_profiles",
+            params={"id": _postgrest_in_filter(chunk), "select": "*"},
+        )
+        response.raise_for_status()
+        for row in response.json():
+            profile_cache.set(row["id"], row)
+            profiles[row["id"]] = dict(row)
+    return profiles
 
 
 def _update_profile(profile_id: str, updates: Dict[str, Any]) -> Optional[Dict[str, Any]]:
@@ -292,41 +800,51 @@ def _update_profile(profile_id: str, updates: Dict[str, Any]) -> Optional[Dict[s
         f"{SUPABASE_REST_URL}/user_profiles",
         params={"id": f"eq.{profile_id}"},
         data=json.dumps(updates),
-        timeout=30,
     )
     response.raise_for_status()
+    profile_cache.delete(profile_id)
     payload = response.json()
     return payload[0] if payload else None
 
 
-def _instagram_media_exists(profile_id: str, source_url: str) -> bool:
+def _existing_source_url_queries(profile_id: str, source_urls: List[str]) -> List[Dict[str, Any]]:
+    return [
+        {"user_id": f"eq.{profile_id}", "source_url": _postgrest_in_filter(chunk), "select": "source_url"}
+        for chunk in _in_filter_chunks(source_urls, INGEST_LOOKUP_MAX_QUERY_CHARS)
+    ]
+
+
+def _fetch_existing_source_urls(profile_id: str, source_urls: List[str]) -> set:
+    """
+    Returns the subset of ``source_urls`` already stored for ``profile_id`` using ``in.(...)``
+    queries, as few as ``INGEST_LOOKUP_MAX_QUERY_CHARS`` allows (usually one per page).
+    """
+    if not source_urls:
+        return set()
     _require_supabase_configuration()
-    params = {
-        "user_id": f"eq.{profile_id}",
-        "source_url": f"eq.{source_url}",
-        "select": "id",
-        "limit": 1,
-    }
-    response = supabase_session.get(
-        f"{SUPABASE_REST_URL}/instagram_media",
-        params=params,
-        timeout=15,
-    )
-    response.raise_for_status()
-    return bool(response.json())
+    existing = set()
+    for params in _existing_source_url_queries(profile_id, source_urls):
+        response = supabase_session.get(f"{SUPABASE_REST_URL}/instagram_media", params=params)
+        response.raise_for_status()
+        existing.update(row["source_url"] for row in response.json() if row.get("source_url"))
+    return existing
 
 
 def _insert_instagram_media_rows(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Upserts against the ``(user_id, source_url)`` unique constraint. Rows that already exist
+    (e.g. written by a concurrent ingest) are left untouched and omitted from the response.
+    """
     if not rows:
         return []
     _require_supabase_configuration()
     headers = dict(supabase_session.headers)
-    headers["Prefer"] = "return=representation,resolution=merge-duplicates"
+    headers["Prefer"] = "return=representation,resolution=ignore-duplicates"
     response = supabase_session.post(
         f"{SUPABASE_REST_URL}/instagram_media",
+        params={"on_conflict": "user_id,source_url"},
         headers=headers,
         data=json.dumps(rows),
-        timeout=30,
     )
     response.raise_for_status()
     return response.json()
@@ -369,7 +887,8 @@ def _send_parent_confirmation_email(
     }
 
     try:
-        response = resend.Emails.send(params)
+        with metrics.track_upstream("resend", "emails.send"):
+            response = resend.Emails.send(params)
         logger.info("Sent parent invite email via Resend to %s", parent_email)
         return response  # Resend returns dict-like payload
     except Exception as exc:
@@ -429,12 +948,11 @@ def _normalise_instagram_media(media: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
-def _download_remote_media(url: str) -> Optional[Dict[str, Any]]:
+def _open_remote_media(url: str) -> Optional[requests.Response]:
     try:
-        response = requests.get(url, timeout=RAPIDAPI_TIMEOUT)
+        response = http_clients.session("instagram_cdn").get(url, stream=True)
         response.raise_for_status()
-        content_type = response.headers.get("Content-Type", "image/jpeg")
-        return {"body": response.content, "content_type": content_type}
+        return response
     except requests.RequestException as exc:
         logger.warning("Failed to download media %s: %s", url, exc)
         return None
@@ -448,40 +966,256 @@ def _build_storage_key(profile_id: str, media_id: str, content_type: str) -> str
     return f"instagram/{profile_id}/{media_id}.{subtype}"
 
 
-def _upload_media_to_r2(storage_key: str, payload: Dict[str, Any]) -> None:
+class _PartBuffer:
+    """
+    Cuts a streamed body into ``R2_TRANSFER_CHUNK_BYTES`` upload parts, holding at most one part
+    in memory, and enforces ``max_bytes``. This is the I/O-free half of ``_stream_to_r2``, shared
+    with its async twin in ``asgi_app``.
+    """
+
+    def __init__(self, key: str, max_bytes: Optional[int] = None) -> None:
+        self.key = key
+        self.max_bytes = max_bytes
+        self.total = 0
+        self._buffer = bytearray()
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        """Adds ``chunk`` and returns the parts it completed, ready to upload in order."""
+        self.total += len(chunk)
+        if self.max_bytes is not None and self.total > self.max_bytes:
+            raise ValueError(f"Object {self.key} exceeds the {self.max_bytes} byte limit.")
+        self._buffer.extend(chunk)
+        parts: List[bytes] = []
+        while len(self._buffer) >= R2_TRANSFER_CHUNK_BYTES:
+            parts.append(bytes(self._buffer[:R2_TRANSFER_CHUNK_BYTES]))
+            del self._buffer[:R2_TRANSFER_CHUNK_BYTES]
+        return parts
+
+    def rest(self) -> bytes:
+        """What is left after the last full part: the whole body when it fits in one part."""
+        return bytes(self._buffer)
+
+
+def _stream_to_r2(
+    key: str,
+    chunks: Iterable[bytes],
+    content_type: str,
+    *,
+    max_bytes: Optional[int] = None,
+    acl: Optional[str] = None,
+    upload_slots: Optional[threading.Semaphore] = None,
+) -> int:
+    """
+    Uploads ``chunks`` to R2 holding at most one part in memory. Bodies that fit in a single
+    part go up with one ``put_object``; anything larger becomes a multipart upload, which is
+    aborted if the source fails or grows past ``max_bytes``. Each PUT or part upload holds one
+    of ``upload_slots`` when given. Returns the object size.
+    """
     if not BUCKET_NAME:
         raise RuntimeError("R2 bucket configuration missing. Set R2_BUCKET_NAME.")
-    body = payload["body"]
-    content_type = payload["content_type"]
-    s3.put_object(Bucket=BUCKET_NAME, Key=storage_key, Body=body, ContentType=content_type)
 
+    slot = upload_slots if upload_slots is not None else nullcontext()
+    extra: Dict[str, Any] = {"ContentType": content_type}
+    if acl:
+        extra["ACL"] = acl
 
-def _fetch_instagram_posts_via_rapidapi(username: str, limit: int = 12) -> List[Dict[str, Any]]:
-    if not RAPIDAPI_KEY:
-        raise RuntimeError("RAPIDAPI_KEY not configured; cannot fetch Instagram content.")
+    buffer = _PartBuffer(key, max_bytes)
+    upload_id: Optional[str] = None
+    parts: List[Dict[str, Any]] = []
 
-    headers = {
-        "X-RapidAPI-Key": RAPIDAPI_KEY,
-    }
-    if RAPIDAPI_HOST:
-        headers["X-RapidAPI-Host"] = RAPIDAPI_HOST
+    def upload_part(body: bytes) -> None:
+        part_number = len(parts) + 1
+        with slot:
+            result = s3.upload_part(
+                Bucket=BUCKET_NAME, Key=key, UploadId=upload_id, PartNumber=part_number, Body=body
+            )
+        parts.append({"PartNumber": part_number, "ETag": result["ETag"]})
 
-    params = {"username": username, "amount": limit}
-    response = requests.get(RAPIDAPI_URL, headers=headers, params=params, timeout=RAPIDAPI_TIMEOUT)
-    response.raise_for_status()
-    payload = response.json()
+    try:
+        for chunk in chunks:
+            if not chunk:
+                continue
+            for part in buffer.feed(chunk):
+                if upload_id is None:
+                    upload_id = s3.create_multipart_upload(Bucket=BUCKET_NAME, Key=key, **extra)["UploadId"]
+                upload_part(part)
+
+        rest = buffer.rest()
+        if upload_id is None:
+            with slot:
+                s3.put_object(Bucket=BUCKET_NAME, Key=key, Body=rest, **extra)
+            return buffer.total
+
+        if rest:
+            upload_part(rest)
+        s3.complete_multipart_upload(
+            Bucket=BUCKET_NAME, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts}
+        )
+        return buffer.total
+    except BaseException:
+        if upload_id is not None:
+            try:
+                s3.abort_multipart_upload(Bucket=BUCKET_NAME, Key=key, UploadId=upload_id)
+            except Exception:
+                logger.warning("Failed to abort multipart upload %s for %s", upload_id, key)
+        raise
 
+
+def _extract_instagram_items(payload: Any) -> List[Dict[str, Any]]:
     if isinstance(payload, dict):
         for key in ("data", "items", "results", "posts"):
             items = payload.get(key)
             if isinstance(items, list):
                 return items
+            if isinstance(items, dict):
+                nested = items.get("items")
+                if isinstance(nested, list):
+                    return nested
     elif isinstance(payload, list):
         return payload
 
     raise ValueError("Unexpected response format from RapidAPI Instagram endpoint.")
 
 
+def _extract_next_cursor(payload: Any) -> Optional[str]:
+    """Finds the next-page token; RapidAPI Instagram providers name it differently."""
+    if not isinstance(payload, dict):
+        return None
+    containers = [payload]
+    for key in ("data", "page_info", "pagination"):
+        if isinstance(payload.get(key), dict):
+            containers.append(payload[key])
+    for container in containers:
+        for key in ("pagination_token", "next_max_id", "end_cursor", "next_cursor", "max_id"):
+            value = container.get(key)
+            if value:
+                return str(value)
+    return None
+
+
+def _rapidapi_request(username: str, limit: int, cursor: Optional[str]) -> Tuple[Dict[str, str], Dict[str, Any]]:
+    if not RAPIDAPI_KEY:
+        raise RuntimeError("RAPIDAPI_KEY not configured; cannot fetch Instagram content.")
+
+    headers = {
+        "X-RapidAPI-Key": RAPIDAPI_KEY,
+    }
+    if RAPIDAPI_HOST:
+        headers["X-RapidAPI-Host"] = RAPIDAPI_HOST
+
+    params: Dict[str, Any] = {"username": username, "amount": limit}
+    if cursor:
+        params[RAPIDAPI_PAGINATION_PARAM] = cursor
+    return headers, params
+
+
+def _parse_sortable_timestamp(value: Optional[str]) -> Optional[dt.datetime]:
+    if not value:
+        return None
+    try:
+        parsed = dt.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=dt.timezone.utc)
+
+
+def _is_known_media(
+    normalized: Dict[str, Any], last_media_id: Optional[str], last_captured: Optional[dt.datetime]
+) -> bool:
+    if last_media_id and normalized.get("media_id") == last_media_id:
+        return True
+    captured = _parse_sortable_timestamp(normalized.get("captured_at"))
+    return bool(last_captured and captured and captured <= last_captured)
+
+
+def _collect_new_media(
+    media_items: List[Dict[str, Any]],
+    new_items: List[Dict[str, Any]],
+    stats: Dict[str, Any],
+    last_media_id: Optional[str],
+    last_captured: Optional[dt.datetime],
+) -> None:
+    """Appends one page's items newer than the mark to ``new_items`` and updates the walk ``stats``."""
+    stats["pages"] += 1
+    for media in media_items:
+        normalized = _normalise_instagram_media(media)
+        if stats["incremental"] and _is_known_media(normalized, last_media_id, last_captured):
+            if media.get("is_pinned") or media.get("pinned"):
+                continue
+            stats["reached_known"] = True
+            break
+        new_items.append(normalized)
+
+
+class _FeedWalk:
+    """
+    The I/O-free part of ``_fetch_new_instagram_posts``: which page to request next, what each
+    page adds and when to stop. Shared with the async twin in ``asgi_app``.
+    """
+
+    def __init__(
+        self, username: str, limit: int, last_media_id: Optional[str], last_captured_at: Optional[str]
+    ) -> None:
+        self.username = username
+        self.limit = limit
+        self.last_media_id = last_media_id
+        self.last_captured = _parse_sortable_timestamp(last_captured_at)
+        self.incremental = bool(last_media_id or self.last_captured)
+        self.new_items: List[Dict[str, Any]] = []
+        self.stats: Dict[str, Any] = {"incremental": self.incremental, "pages": 0, "reached_known": False}
+        self.cursor: Optional[str] = None
+        self.finished = False
+
+    def next_request(self) -> Optional[Tuple[Dict[str, str], Dict[str, Any]]]:
+        """RapidAPI ``(headers, params)`` for the next page, or ``None`` once the walk is over."""
+        if self.finished or self.stats["pages"] >= INGEST_MAX_PAGES:
+            return None
+        return _rapidapi_request(self.username, self.limit, self.cursor)
+
+    def add_page(self, payload: Any) -> None:
+        self.cursor = _extract_next_cursor(payload)
+        _collect_new_media(
+            _extract_instagram_items(payload), self.new_items, self.stats, self.last_media_id, self.last_captured
+        )
+        self.finished = not self.incremental or self.stats["reached_known"] or not self.cursor
+
+    def result(self) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        if self.incremental and not self.stats["reached_known"] and self.cursor:
+            logger.warning(
+                "Stopped after %s pages without reaching known media for %s; older posts are not backfilled.",
+                self.stats["pages"],
+                self.username,
+            )
+        self.stats["new"] = len(self.new_items)
+        return self.new_items, self.stats
+
+
+def _fetch_new_instagram_posts(
+    username: str,
+    limit: int,
+    *,
+    last_media_id: Optional[str],
+    last_captured_at: Optional[str],
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Walks the feed newest-first until it reaches media at or before the profile's high-water
+    mark, following RapidAPI pagination for up to ``INGEST_MAX_PAGES`` pages.
+
+    Returns the normalised new items (newest first) and cursor stats. Without a mark this is a
+    single page of ``limit`` items, as before. Pinned posts sit at the top of the feed out of
+    date order, so only an unpinned known post ends the walk.
+    """
+    walk = _FeedWalk(username, limit, last_media_id, last_captured_at)
+    request_args = walk.next_request()
+    while request_args is not None:
+        headers, params = request_args
+        response = http_clients.session("rapidapi").get(RAPIDAPI_URL, headers=headers, params=params)
+        response.raise_for_status()
+        walk.add_page(response.json())
+        request_args = walk.next_request()
+    return walk.result()
+
+
 def _probability_to_score(probability: Optional[str]) -> float:
     mapping = {
         "NEGLIGIBLE": 0.95,
@@ -496,13 +1230,15 @@ def _probability_to_score(probability: Optional[str]) -> float:
     return mapping.get(probability.upper(), 0.6)
 
 
-def generate_gemini_caption(image_bytes: bytes, mime_type: str) -> Tuple[str, float]:
-    if not GEMINI_API_KEY:
-        logger.warning("GEMINI_API_KEY not set; returning placeholder caption.")
-        return ("A cherished campus moment captured for the family legacy demo.", 0.5)
+def _caption_cache_key(image_bytes: bytes) -> str:
+    prompt_digest = hashlib.sha256(DEFAULT_GEMINI_PROMPT.encode("utf-8")).hexdigest()[:16]
+    image_digest = hashlib.sha256(image_bytes).hexdigest()
+    return f"{GEMINI_MODEL}:{prompt_digest}:{image_digest}"
 
+
+def _gemini_request_payload(image_bytes: bytes, mime_type: str) -> Dict[str, Any]:
     inline_data = base64.b64encode(image_bytes).decode("utf-8")
-    payload = {
+    return {
         "contents": [
             {
                 "role": "user",
@@ -514,14 +1250,8 @@ def generate_gemini_caption(image_bytes: bytes, mime_type: str) -> Tuple[str, fl
         ]
     }
 
-    response = requests.post(
-        GEMINI_API_ENDPOINT,
-        params={"key": GEMINI_API_KEY},
-        json=payload,
-        timeout=60,
-    )
-    response.raise_for_status()
-    body = response.json()
+
+def _parse_gemini_caption(body: Dict[str, Any]) -> Tuple[str, float]:
     candidates = body.get("candidates", [])
     if not candidates:
         raise RuntimeError("Gemini returned no candidates.")
@@ -546,27 +1276,57 @@ def generate_gemini_caption(image_bytes: bytes, mime_type: str) -> Tuple[str, fl
     return caption_text, round(confidence, 2)
 
 
-def synthesize_audio_narration(text: str, media_id: str) -> Tuple[Optional[bytes], Optional[str]]:
-    if not ELEVENLABS_API_KEY:
-        logger.warning("ELEVENLABS_API_KEY not set; skipping narration synthesis.")
-        return None, None
+def generate_gemini_caption(image_bytes: bytes, mime_type: str) -> Tuple[str, float]:
+    if not GEMINI_API_KEY:
+        logger.warning("GEMINI_API_KEY not set; returning placeholder caption.")
+        return ("A cherished campus moment captured for the family legacy demo.", 0.5)
+
+    cache_key = _caption_cache_key(image_bytes)
+    cached = caption_cache.get(cache_key)
+    if cached is not None:
+        return cached["caption"], cached["confidence"]
+
+    response = http_clients.session("gemini").post(
+        GEMINI_API_ENDPOINT,
+        params={"key": GEMINI_API_KEY},
+        json=_gemini_request_payload(image_bytes, mime_type),
+    )
+    response.raise_for_status()
+    caption_text, confidence = _parse_gemini_caption(response.json())
+    caption_cache.set(cache_key, {"caption": caption_text, "confidence": confidence})
+    return caption_text, confidence
+
 
+def _narration_voice_id() -> str:
     if not ELEVENLABS_VOICE_ID:
         # TODO: swap default voice with per-student cloned voice once sample capture flow is complete.
         logger.warning("ELEVENLABS_VOICE_ID not set; using ElevenLabs default voice.")
-        default_voice = "21m00Tcm4TlvDq8ikWAM"  # Rachel
-    else:
-        default_voice = ELEVENLABS_VOICE_ID
+        return ELEVENLABS_DEFAULT_VOICE_ID
+    return ELEVENLABS_VOICE_ID
+
+
+def _narration_cache_key(text: str) -> str:
+    material = json.dumps(
+        {
+            "voice_id": ELEVENLABS_VOICE_ID or ELEVENLABS_DEFAULT_VOICE_ID,
+            "model_id": ELEVENLABS_MODEL_ID,
+            "voice_settings": NARRATION_VOICE_SETTINGS,
+            "text": text,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
 
-    url = f"https://api.elevenlabs.io/v1/text-to-speech/{default_voice}"
+def _narration_request(text: str, *, stream: bool = False) -> Tuple[str, Dict[str, Any], Dict[str, str]]:
+    """URL, JSON payload and headers of the ElevenLabs text-to-speech call for ``text``."""
+    url = f"{ELEVENLABS_API_BASE_URL}/v1/text-to-speech/{_narration_voice_id()}"
+    if stream:
+        url = f"{url}/stream"
     payload = {
         "text": text,
         "model_id": ELEVENLABS_MODEL_ID,
-        "voice_settings": {
-            "stability": 0.4,
-            "similarity_boost": 0.6,
-            "style": 0.5,
-        },
+        "voice_settings": NARRATION_VOICE_SETTINGS,
     }
 
     headers = {
@@ -574,52 +1334,814 @@ def synthesize_audio_narration(text: str, media_id: str) -> Tuple[Optional[bytes
         "Accept": "audio/mpeg",
         "Content-Type": "application/json",
     }
+    return url, payload, headers
+
 
-    response = requests.post(url, json=payload, headers=headers, timeout=120)
+def synthesize_audio_narration(text: str, media_id: str) -> Tuple[Optional[bytes], Optional[str]]:
+    if not ELEVENLABS_API_KEY:
+        logger.warning("ELEVENLABS_API_KEY not set; skipping narration synthesis.")
+        return None, None
+
+    url, payload, headers = _narration_request(text)
+    response = http_clients.session("elevenlabs").post(url, json=payload, headers=headers)
     response.raise_for_status()
     audio_bytes = response.content
     content_type = response.headers.get("Content-Type", "audio/mpeg")
     return audio_bytes, content_type
 
 
-def process_media_record(record: Dict[str, Any]) -> Dict[str, Any]:
-    storage_key = record.get("storage_key")
+def stream_audio_narration_to_r2(text: str) -> Tuple[Optional[str], int]:
+    """
+    Streams ElevenLabs synthesis into R2 as it arrives, holding at most one upload part in
+    memory. Returns ``(storage_key, bytes)``, or ``(None, 0)`` when nothing was synthesized.
+    """
+    if not ELEVENLABS_API_KEY:
+        logger.warning("ELEVENLABS_API_KEY not set; skipping narration synthesis.")
+        return None, 0
+
+    url, payload, headers = _narration_request(text, stream=True)
+    response = http_clients.session("elevenlabs").post(url, json=payload, headers=headers, stream=True)
+    with response:
+        response.raise_for_status()
+        chunks = (chunk for chunk in response.iter_content(chunk_size=HTTP_READ_CHUNK_BYTES) if chunk)
+        first = next(chunks, None)
+        if first is None:
+            return None, 0
+        content_type = response.headers.get("Content-Type", "audio/mpeg")
+        key = _narration_storage_key(_narration_cache_key(text), content_type)
+        size = _stream_to_r2(key, itertools.chain([first], chunks), content_type or "audio/mpeg", acl="private")
+    return key, size
+
+
+NARRATION_OBJECT_PREFIX = "narrations/by-hash/"
+
+
+def _narration_storage_key(narration_key: str, content_type: Optional[str]) -> str:
+    """
+    Content-addressed: one object per distinct narration, shared by every row that uses it.
+    Objects are never rewritten, so reprocessing one row cannot change another row's audio.
+    """
+    audio_ext = ".mp3" if "mpeg" in (content_type or "") else ".wav"
+    return f"{NARRATION_OBJECT_PREFIX}{narration_key}{audio_ext}"
+
+
+def _r2_object_exists(key: str) -> bool:
+    if not BUCKET_NAME:
+        raise RuntimeError("R2 bucket configuration missing. Set R2_BUCKET_NAME.")
+    try:
+        s3.head_object(Bucket=BUCKET_NAME, Key=key)
+    except ClientError as exc:
+        if exc.response.get("ResponseMetadata", {}).get("HTTPStatusCode") == 404:
+            return False
+        raise
+    return True
+
+
+StageCallback = Callable[[str, Dict[str, Any]], None]
+
+
+def _image_sources(ctx: Dict[str, Any]) -> Tuple[str, Optional[str]]:
+    """
+    The record's original key and, when an earlier pass stored one, its caption-sized copy to
+    try first. The row records that copy, so a first pass does not probe R2 for a copy that
+    cannot exist yet.
+    """
+    storage_key = ctx["record"].get("storage_key")
     if not storage_key:
         raise ValueError("instagram_media record missing storage_key.")
+    derived_key = derived_image_key(storage_key)
+    ctx["caption_image_key"] = ctx["record"].get("caption_image_key")
+    ctx["preprocessed"] = False
+    return storage_key, derived_key if ctx["caption_image_key"] == derived_key else None
+
+
+def _fetched_image_detail(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    return {"bytes": len(ctx["image_bytes"]), "mime_type": ctx["mime_type"], "derived": ctx["preprocessed"]}
 
-    image_bytes, mime_type = _fetch_image_from_r2(storage_key)
-    caption, confidence = generate_gemini_caption(image_bytes, mime_type)
 
-    audio_url: Optional[str] = None
-    if caption:
+def _stage_fetch_image(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    storage_key, derived_key = _image_sources(ctx)
+    if derived_key:
+        try:
+            ctx["image_bytes"], ctx["mime_type"] = _fetch_image_from_r2(derived_key)
+            ctx["preprocessed"] = True
+        except s3.exceptions.NoSuchKey:
+            ctx["caption_image_key"] = None
+    if not ctx["preprocessed"]:
+        ctx["image_bytes"], ctx["mime_type"] = _fetch_image_from_r2(storage_key)
+    return _fetched_image_detail(ctx)
+
+
+def _reused_image_stats(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    ctx["image_stats"] = {"payload_bytes": len(ctx["image_bytes"]), "encode_seconds": 0.0, "reused": True}
+    return ctx["image_stats"]
+
+
+def _finish_preprocess(
+    ctx: Dict[str, Any], storage_key: str, payload: bytes, mime_type: str, stats: Dict[str, Any]
+) -> Dict[str, Any]:
+    ctx["image_bytes"], ctx["mime_type"] = payload, mime_type
+    ctx["image_stats"] = stats
+    logger.info(
+        "Prepared %s for captioning: %s -> %s bytes in %ss",
+        storage_key,
+        stats["original_bytes"],
+        stats["payload_bytes"],
+        stats["encode_seconds"],
+    )
+    return stats
+
+
+def _stage_preprocess(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    if ctx["preprocessed"]:
+        return _reused_image_stats(ctx)
+
+    storage_key = ctx["record"]["storage_key"]
+    payload, mime_type, stats = downsize_for_caption(ctx["image_bytes"], ctx["mime_type"])
+    if stats["resized"]:
+        try:
+            derived_key = derived_image_key(storage_key)
+            s3.put_object(Bucket=BUCKET_NAME, Key=derived_key, Body=payload, ContentType=mime_type)
+            ctx["caption_image_key"] = derived_key
+        except Exception:
+            logger.warning("Failed to store caption-sized copy of %s", storage_key, exc_info=True)
+    return _finish_preprocess(ctx, storage_key, payload, mime_type, stats)
+
+
+def _stage_caption(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    ctx["caption"], ctx["confidence"] = generate_gemini_caption(ctx["image_bytes"], ctx["mime_type"])
+    # The image is not needed past this point; drop it so queued items stay small.
+    ctx.pop("image_bytes", None)
+    return {"confidence": ctx["confidence"]}
+
+
+def _stage_narration(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    record = ctx["record"]
+    caption = ctx["caption"]
+    ctx["audio_url"] = None
+    if not caption:
+        return {"skipped": True}
+
+    narration_key = _narration_cache_key(caption)
+    ctx["audio_url"] = _cached_narration_url(narration_cache.get(narration_key))
+    if ctx["audio_url"]:
+        return {"cached": True, "audio_url": ctx["audio_url"]}
+
+    if not ELEVENLABS_API_KEY:
+        logger.warning("ELEVENLABS_API_KEY not set; skipping narration synthesis.")
+        return {"bytes": 0}
+
+    # The cache entry may have expired while the object is still in R2.
+    existing_key = _narration_storage_key(narration_key, "audio/mpeg")
+    if _r2_object_exists(existing_key):
+        ctx["audio_url"] = _remember_narration(narration_key, existing_key)
+        return {"cached": True, "audio_url": ctx["audio_url"]}
+
+    if NARRATION_STREAMING:
+        audio_key, size = stream_audio_narration_to_r2(caption)
+        if not audio_key:
+            return {"bytes": 0}
+    else:
         audio_bytes, audio_content_type = synthesize_audio_narration(caption, record["id"])
-        if audio_bytes:
-            audio_ext = ".mp3" if "mpeg" in (audio_content_type or "") else ".wav"
-            audio_key = f"narrations/{record['id']}{audio_ext}"
-            audio_url = _upload_audio_to_r2(audio_key, audio_bytes, audio_content_type or "audio/mpeg")
-
-    updates = {
-        "caption": caption,
-        "caption_confidence": confidence,
-        "audio_url": audio_url,
+        if not audio_bytes:
+            return {"bytes": 0}
+        size = len(audio_bytes)
+        audio_key = _narration_storage_key(narration_key, audio_content_type)
+        _upload_audio_to_r2(audio_key, audio_bytes, audio_content_type or "audio/mpeg")
+
+    ctx["audio_url"] = _remember_narration(narration_key, audio_key)
+    return {"bytes": size, "audio_url": ctx["audio_url"], "streamed": NARRATION_STREAMING}
+
+
+def _cached_narration_url(entry: Optional[Dict[str, Any]]) -> Optional[str]:
+    """
+    The audio URL of a narration cache entry. Entries from before narrations were
+    content-addressed point at per-row objects that reprocessing overwrites; treat them as misses.
+    """
+    if entry is not None and entry.get("storage_key", "").startswith(NARRATION_OBJECT_PREFIX):
+        return entry["audio_url"]
+    return None
+
+
+def _remember_narration(narration_key: str, audio_key: str) -> str:
+    """Caches the narration stored at ``audio_key`` under its content key and returns its URL."""
+    audio_url = _object_url(audio_key)
+    narration_cache.set(narration_key, {"audio_url": audio_url, "storage_key": audio_key})
+    return audio_url
+
+
+def _media_record_updates(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "caption": ctx["caption"],
+        "caption_confidence": ctx["confidence"],
+        "audio_url": ctx["audio_url"],
+        "caption_image_key": ctx.get("caption_image_key"),
         "processed_at": dt.datetime.utcnow().isoformat(),
+        "lease_owner": None,
+        "lease_expires_at": None,
     }
-    updated_record = _update_instagram_media(record["id"], updates)
-    return {"record": updated_record}
 
 
-@app.route("/parent-request", methods=["POST"])
-def parent_request() -> Response:
-    auth_header = request.headers.get("Authorization", "")
+def _stage_update_record(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    # Buffered: the row is written with the next bulk upsert and callers wait on the future.
+    ctx["pending_update"] = media_result_writer.submit((ctx["record"], _media_record_updates(ctx)))
+    return {}
+
+
+MEDIA_PROCESSING_STAGES: Tuple[Tuple[str, Callable[[Dict[str, Any]], Dict[str, Any]]], ...] = (
+    ("fetch_image", _stage_fetch_image),
+    ("preprocess", _stage_preprocess),
+    ("caption", _stage_caption),
+    ("narration", _stage_narration),
+    ("update_record", _stage_update_record),
+)
+
+
+def _check_stage_deadline(name: str) -> None:
+    """
+    Raises ``DeadlineExceeded`` before ``name`` when the time left cannot cover it and the paid
+    stages after it, going by their average so far. Writing the record back is never skipped:
+    by then the upstream work has been paid for.
+    """
+    left = deadlines.remaining()
+    if left is None or name == "update_record":
+        return
+    names = [stage_name for stage_name, _ in MEDIA_PROCESSING_STAGES if stage_name != "update_record"]
+    needed = sum(
+        metrics.MEDIA_STAGE_SECONDS.mean(stage=stage_name, outcome="ok") or 0.0
+        for stage_name in names[names.index(name):]
+    )
+    if left <= 0 or left < needed:
+        raise deadlines.DeadlineExceeded(f"{left:.1f}s left before {name}; the remaining stages average {needed:.1f}s.")
+
+
+def _run_timed_stage(
+    name: str, stage: Callable[[Dict[str, Any]], Dict[str, Any]], ctx: Dict[str, Any]
+) -> Tuple[Dict[str, Any], float]:
+    _check_stage_deadline(name)
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        detail = stage(ctx)
+        outcome = "ok"
+        return detail, time.perf_counter() - started
+    except Exception as exc:
+        cut_short = _stage_cut_short(name, exc)
+        if cut_short is not None:
+            raise cut_short from exc
+        raise
+    finally:
+        metrics.MEDIA_STAGE_SECONDS.observe(time.perf_counter() - started, stage=name, outcome=outcome)
+
+
+def _stage_cut_short(name: str, exc: BaseException) -> Optional[deadlines.DeadlineExceeded]:
+    """An upstream timeout cut short by the deadline is reported as the deadline."""
+    if deadlines.expired() and not isinstance(exc, deadlines.DeadlineExceeded):
+        return deadlines.DeadlineExceeded(f"Deadline passed during {name}: {exc}")
+    return None
+
+
+def process_media_record(record: Dict[str, Any], on_stage: Optional[StageCallback] = None) -> Dict[str, Any]:
+    """
+    Captions, narrates and persists one ``instagram_media`` row. ``on_stage`` is called after
+    each stage with its name and a small summary (timings, sizes) so callers such as the job
+    worker can record progress.
+    """
+    ctx: Dict[str, Any] = {"record": record}
+    for name, stage in MEDIA_PROCESSING_STAGES:
+        detail, seconds = _run_timed_stage(name, stage, ctx)
+        if on_stage:
+            on_stage(name, {"seconds": round(seconds, 3), **detail})
+    return {"record": ctx["pending_update"].result()}
+
+
+def _media_error_entry(record_id: Optional[str], error: BaseException, stage: Optional[str]) -> Dict[str, Any]:
+    if isinstance(error, deadlines.DeadlineExceeded):
+        logger.info("Skipped media %s at stage %s: %s", record_id, stage, error)
+        return {"id": record_id, "error": DEADLINE_EXCEEDED, "stage": stage}
+    logger.error("Processing failed for media %s at stage %s", record_id, stage, exc_info=error)
+    return {"id": record_id, "error": str(error)}
+
+
+def _build_media_pipeline() -> StagedPipeline:
+    def run_stage(
+        name: str, stage: Callable[[Dict[str, Any]], Dict[str, Any]]
+    ) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+        def wrapped(ctx: Dict[str, Any]) -> Dict[str, Any]:
+            with deadlines.bind(ctx.get("deadline")):
+                _run_timed_stage(name, stage, ctx)
+            return ctx
+
+        return wrapped
+
+    return StagedPipeline(
+        [
+            Stage(name, run_stage(name, stage), workers=PIPELINE_STAGE_WORKERS[name])
+            for name, stage in MEDIA_PROCESSING_STAGES
+        ],
+        queue_size=PIPELINE_QUEUE_SIZE,
+    )
+
+
+def process_media_records(records: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Processes ``records`` through the overlapping stage pipeline. Returns the per-record results
+    in input order (same shape as the sequential loop) and the per-stage throughput stats.
+    """
+    pipeline = _build_media_pipeline()
+    # Stage threads do not inherit the request's context, so each item carries its deadline.
+    deadline = deadlines.current()
+    results = pipeline.run({"record": record, "deadline": deadline} for record in records)
+    media_result_writer.flush()
+
+    processed: List[Dict[str, Any]] = []
+    for result in results:
+        if result.error is None:
+            try:
+                result.item["updated_record"] = result.item["pending_update"].result()
+            except Exception as exc:
+                result.error, result.failed_stage = exc, "update_record"
+        processed.append(_media_result_entry(result))
+    return processed, _media_pipeline_stats(pipeline, len(records))
+
+
+def _media_result_entry(result: Any) -> Dict[str, Any]:
+    """The response entry for one pipeline result, once its pending write has been resolved."""
+    record_id = result.item["record"].get("id")
+    if result.error is not None:
+        return _media_error_entry(record_id, result.error, result.failed_stage)
+    return {"id": record_id, "record": result.item["updated_record"], "image": result.item.get("image_stats")}
+
+
+def _media_pipeline_stats(pipeline: Any, count: int) -> Dict[str, Any]:
+    stats = pipeline.stats()
+    logger.info("Media pipeline processed %s records: %s", count, json.dumps(stats["stages"]))
+    return stats
+
+
+def _ingest_media_item(
+    profile_id: str, normalized: Dict[str, Any], upload_slots: Optional[threading.Semaphore] = None
+) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """
+    Streams one deduplicated item from the Instagram CDN into R2, its R2 writes holding
+    ``upload_slots``.
+    Returns ``(row, None)`` when the item should be inserted, otherwise ``(None, skipped_entry)``.
+    """
+    media_id = normalized.get("media_id")
+    source_url = normalized["source_url"]
+
+    response = _open_remote_media(source_url)
+    if response is None:
+        return None, {"media_id": media_id, "reason": "download_failed"}
+
+    with response:
+        oversized = _oversized_media_skip(normalized, response.headers)
+        if oversized:
+            return None, oversized
+
+        content_type = response.headers.get("Content-Type", "image/jpeg")
+        storage_key = _build_storage_key(profile_id, media_id, content_type)
+        try:
+            _stream_to_r2(
+                storage_key,
+                response.iter_content(chunk_size=HTTP_READ_CHUNK_BYTES),
+                content_type,
+                max_bytes=INGEST_MAX_OBJECT_BYTES,
+                upload_slots=upload_slots,
+            )
+        except deadlines.DeadlineExceeded:
+            raise
+        except Exception as exc:
+            return None, _transfer_failure_skip(
+                normalized, storage_key, exc, download_failed=isinstance(exc, requests.RequestException)
+            )
+
+    return _instagram_media_row(profile_id, normalized, storage_key), None
+
+
+def _oversized_media_skip(normalized: Dict[str, Any], headers: Mapping[str, str]) -> Optional[Dict[str, Any]]:
+    """A ``too_large`` skip when the CDN announces a body over ``INGEST_MAX_OBJECT_BYTES``."""
+    content_length = headers.get("Content-Length")
+    if content_length and content_length.isdigit() and int(content_length) > INGEST_MAX_OBJECT_BYTES:
+        logger.warning("Skipping media %s: %s bytes exceeds limit", normalized["source_url"], content_length)
+        return {"media_id": normalized.get("media_id"), "reason": "too_large"}
+    return None
+
+
+def _transfer_failure_skip(
+    normalized: Dict[str, Any], storage_key: Optional[str], exc: BaseException, *, download_failed: bool
+) -> Dict[str, Any]:
+    """Logs a failed CDN-to-R2 copy and returns its skipped entry; call from the ``except`` block."""
+    source_url = normalized["source_url"]
+    if download_failed:
+        logger.warning("Failed to download media %s: %s", source_url, exc)
+        reason = "download_failed"
+    elif isinstance(exc, ValueError):
+        logger.warning("Skipping media %s: %s", source_url, exc)
+        reason = "too_large"
+    else:
+        logger.exception("Failed to upload media %s to R2", storage_key)
+        reason = "upload_failed"
+    return {"media_id": normalized.get("media_id"), "reason": reason}
+
+
+def _deadline_skip(item: Dict[str, Any]) -> Dict[str, Any]:
+    return {"media_id": item.get("media_id"), "reason": DEADLINE_EXCEEDED}
+
+
+def _settle_transfer_skip(skip: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """A retryable skip whose timeout was cut short by the deadline is reported as the deadline."""
+    if skip and skip["reason"] in INGEST_RETRYABLE_SKIPS and deadlines.expired():
+        return {**skip, "reason": DEADLINE_EXCEEDED}
+    return skip
+
+
+def _instagram_media_row(profile_id: str, normalized: Dict[str, Any], storage_key: str) -> Dict[str, Any]:
+    return {
+        "user_id": profile_id,
+        "source_url": normalized["source_url"],
+        "storage_key": storage_key,
+        "caption": normalized.get("caption"),
+        "caption_confidence": None,
+        "audio_url": None,
+        "captured_at": normalized.get("captured_at"),
+        "processed_at": None,
+    }
+
+
+def _presort_instagram_media(
+    normalized_items: List[Dict[str, Any]]
+) -> Tuple[List[Optional[Dict[str, Any]]], List[str]]:
+    """
+    Skips items without a source URL and repeats within the page. Returns verdicts aligned with
+    ``normalized_items`` (``None`` when still undecided) and the source URLs left to look up.
+    """
+    verdicts: List[Optional[Dict[str, Any]]] = []
+    seen: Dict[str, None] = {}
+    for normalized in normalized_items:
+        media_id = normalized.get("media_id")
+        source_url = normalized.get("source_url")
+        if not source_url:
+            verdicts.append({"media_id": media_id, "reason": "missing_source_url"})
+        elif source_url in seen:
+            verdicts.append({"media_id": media_id, "reason": "duplicate"})
+        else:
+            seen[source_url] = None
+            verdicts.append(None)
+    return verdicts, list(seen)
+
+
+def _apply_existing_source_urls(
+    normalized_items: List[Dict[str, Any]],
+    verdicts: List[Optional[Dict[str, Any]]],
+    existing: Optional[set],
+) -> List[Optional[Dict[str, Any]]]:
+    """Marks undecided items already stored as ``duplicate``; ``existing=None`` means the lookup failed."""
+    if existing is None:
+        return [
+            verdict or {"media_id": normalized.get("media_id"), "reason": "lookup_failed"}
+            for normalized, verdict in zip(normalized_items, verdicts)
+        ]
+    return [
+        {"media_id": normalized.get("media_id"), "reason": "duplicate"}
+        if verdict is None and normalized["source_url"] in existing
+        else verdict
+        for normalized, verdict in zip(normalized_items, verdicts)
+    ]
+
+
+def _dedup_instagram_media(
+    profile_id: str, normalized_items: List[Dict[str, Any]]
+) -> List[Optional[Dict[str, Any]]]:
+    """
+    Resolves every item that can be skipped without touching the CDN, in one Supabase query.
+    Returns a list aligned with ``normalized_items``: a skipped entry, or ``None`` when the
+    item still needs to be downloaded.
+    """
+    verdicts, source_urls = _presort_instagram_media(normalized_items)
+    try:
+        existing: Optional[set] = _fetch_existing_source_urls(profile_id, source_urls)
+    except Exception:
+        logger.exception("Lookup failed for existing media of profile %s", profile_id)
+        existing = None
+    return _apply_existing_source_urls(normalized_items, verdicts, existing)
+
+
+def _ingest_cursor_mark(
+    normalized_items: List[Dict[str, Any]],
+    outcomes: List[Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]],
+) -> Optional[Dict[str, Any]]:
+    """
+    The newest item handled in this run, stopping short of the oldest item that failed for a
+    retryable reason so the next run picks it up again.
+    """
+    mark: Optional[Dict[str, Any]] = None
+    for normalized, (_, skip) in reversed(list(zip(normalized_items, outcomes))):
+        if skip and skip["reason"] in INGEST_RETRYABLE_SKIPS:
+            break
+        if normalized.get("captured_at") or mark is None:
+            mark = {"ig_last_media_id": normalized["media_id"], "ig_last_captured_at": normalized.get("captured_at")}
+    return mark
+
+
+def _advance_ingest_cursor(
+    profile_id: str,
+    normalized_items: List[Dict[str, Any]],
+    outcomes: List[Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]],
+) -> Optional[Dict[str, Any]]:
+    """Persists the profile's high-water mark (see ``_ingest_cursor_mark``) and returns it."""
+    mark = _ingest_cursor_mark(normalized_items, outcomes)
+    if mark is None:
+        return None
+
+    try:
+        _update_profile(profile_id, mark)
+    except Exception:
+        logger.exception("Failed to persist ingest cursor for profile %s", profile_id)
+        return None
+    return mark
+
+
+def ingest_profile_media(
+    profile: Dict[str, Any],
+    instagram_username: str,
+    *,
+    limit: int = 12,
+    parallel: bool = INGEST_PARALLEL,
+    full_refresh: bool = False,
+) -> Tuple[Dict[str, Any], int]:
+    """
+    Ingests new posts for an already consent-checked profile. Returns ``(body, http_status)``
+    so the route can respond with it directly and batch callers can inspect it.
+    """
+    profile_id = profile["id"]
+    try:
+        new_items, cursor_stats = _fetch_new_instagram_posts(
+            instagram_username,
+            limit,
+            last_media_id=None if full_refresh else profile.get("ig_last_media_id"),
+            last_captured_at=None if full_refresh else profile.get("ig_last_captured_at"),
+        )
+    except Exception as exc:
+        return _ingest_fetch_failure(exc, instagram_username)
+
+    if not new_items:
+        return _no_new_media_body(cursor_stats), 200
+
+    normalized_items = _ingest_window(new_items, cursor_stats, limit)
+    verdicts = _dedup_instagram_media(profile_id, normalized_items)
+    pending = [normalized for normalized, verdict in zip(normalized_items, verdicts) if verdict is None]
+
+    def transfer(item: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        try:
+            row, skip = _ingest_media_item(profile_id, item, uploads)
+        except deadlines.DeadlineExceeded:
+            return None, _deadline_skip(item)
+        return row, _settle_transfer_skip(skip)
+
+    workers = INGEST_DOWNLOAD_CONCURRENCY if parallel else 1
+    uploads = threading.BoundedSemaphore(INGEST_UPLOAD_CONCURRENCY if parallel else 1)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest") as pool:
+        transfers = list(pool.map(deadlines.wrap(transfer), pending))
+
+    outcomes = _ingest_outcomes(verdicts, transfers)
+    inserted_payloads: List[Dict[str, Any]] = [row for row, _ in outcomes if row]
+    skipped: List[Dict[str, Any]] = [skip for _, skip in outcomes if skip]
+
+    try:
+        # Objects already copied to R2 are recorded even past the deadline, or the copy is wasted.
+        with deadlines.suspended():
+            persisted = _insert_instagram_media_rows(inserted_payloads)
+    except Exception as exc:
+        return _ingest_insert_failure(exc, profile_id, inserted_payloads)
+
+    _record_ingest_metrics(persisted, skipped)
+    with deadlines.suspended():
+        cursor_stats["advanced_to"] = _advance_ingest_cursor(profile_id, normalized_items, outcomes)
+    return _ingest_response(instagram_username, new_items, persisted, skipped, cursor_stats), 200
+
+
+def _ingest_fetch_failure(exc: BaseException, instagram_username: str) -> Tuple[Dict[str, Any], int]:
+    if isinstance(exc, deadlines.DeadlineExceeded) or deadlines.expired():
+        logger.info("Deadline passed while fetching Instagram posts for %s", instagram_username)
+        return {"error": DEADLINE_EXCEEDED}, 504
+    logger.exception("RapidAPI Instagram fetch failed for %s", instagram_username)
+    return {"error": str(exc)}, 502
+
+
+def _no_new_media_body(cursor_stats: Dict[str, Any]) -> Dict[str, Any]:
+    message = "No new Instagram media." if cursor_stats["incremental"] else "No Instagram media returned."
+    return {"message": message, "count": 0, "cursor": cursor_stats}
+
+
+def _ingest_window(
+    new_items: List[Dict[str, Any]], cursor_stats: Dict[str, Any], limit: int
+) -> List[Dict[str, Any]]:
+    """
+    The feed is newest first. Take the oldest ``limit`` new posts so the high-water mark can
+    advance past them and the next run continues with the newer ones.
+    """
+    return new_items[-limit:] if cursor_stats["incremental"] else new_items
+
+
+def _ingest_outcomes(
+    verdicts: List[Optional[Dict[str, Any]]],
+    transfers: List[Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]],
+) -> List[Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]]:
+    """Slots the transfer results back between the items dedup already skipped."""
+    remaining = iter(transfers)
+    return [(None, verdict) if verdict else next(remaining) for verdict in verdicts]
+
+
+def _ingest_insert_failure(
+    exc: BaseException, profile_id: str, inserted_payloads: List[Dict[str, Any]]
+) -> Tuple[Dict[str, Any], int]:
+    logger.exception("Failed to insert instagram_media rows for profile %s", profile_id)
+    metrics.INGEST_SKIPPED.inc(len(inserted_payloads), reason="insert_failed")
+    return {"error": str(exc)}, 500
+
+
+def _record_ingest_metrics(persisted: List[Dict[str, Any]], skipped: List[Dict[str, Any]]) -> None:
+    metrics.INGEST_ITEMS.inc(len(persisted))
+    for skip in skipped:
+        metrics.INGEST_SKIPPED.inc(reason=skip["reason"])
+
+
+def _ingest_response(
+    instagram_username: str,
+    new_items: List[Dict[str, Any]],
+    persisted: List[Dict[str, Any]],
+    skipped: List[Dict[str, Any]],
+    cursor_stats: Dict[str, Any],
+) -> Dict[str, Any]:
+    logger.info(
+        "Ingested %s instagram items for %s (skipped %s)",
+        len(persisted),
+        instagram_username,
+        len(skipped),
+    )
+    return {
+        "inserted": len(persisted),
+        "skipped": skipped,
+        "total_returned": len(new_items),
+        "records": persisted,
+        "cursor": cursor_stats,
+    }
+
+
+def _parent_request_fields(payload: Any) -> Tuple[str, str, Optional[str]]:
+    """Reads the username and parent email from a form or JSON body; the last item is a 400 message."""
+    instagram_username = (
+        payload.get("instagramUsername") or payload.get("instagram_username") or ""
+    ).strip()
+    parent_email = (payload.get("parentEmail") or payload.get("parent_email") or "").strip()
+    consent_flag = payload.get("consentGranted") or payload.get("consent_granted")
+
+    if not instagram_username:
+        return instagram_username, parent_email, "Instagram username is required."
+    if not parent_email:
+        return instagram_username, parent_email, "Parent email is required."
+    if str(consent_flag).lower() not in {"true", "1", "yes"}:
+        return instagram_username, parent_email, "Consent must be granted before notifying a parent."
+    return instagram_username, parent_email, None
+
+
+def _parent_profile_payload(
+    user: Dict[str, Any],
+    instagram_username: str,
+    parent_email: str,
+    voice_sample_url: Optional[str],
+    voice_profile_id: Optional[str],
+) -> Dict[str, Any]:
+    profile_payload: Dict[str, Any] = {
+        "id": user["id"],
+        "email": user.get("email"),
+        "ig_username": instagram_username,
+        "parent_email": parent_email,
+        "is_parent_confirmed": False,
+    }
+    if voice_sample_url:
+        profile_payload["voice_sample_url"] = voice_sample_url
+    if voice_profile_id:
+        profile_payload["voice_profile_id"] = voice_profile_id
+    return profile_payload
+
+
+def _parent_confirmation_payload(user_id: str, parent_email: str) -> Dict[str, Any]:
+    return {
+        "user_id": user_id,
+        "parent_email": parent_email,
+        "token": str(uuid.uuid4()),
+        "status": "pending",
+        "expires_at": (dt.datetime.utcnow() + dt.timedelta(days=3)).isoformat(),
+    }
+
+
+def _ingest_request_options(payload: Dict[str, Any]) -> Tuple[int, bool, bool]:
+    """``(limit, full_refresh, parallel)`` from an ingest request body."""
+    try:
+        limit = int(payload.get("limit", 12))
+    except (TypeError, ValueError):
+        limit = 12
+    limit = max(1, min(limit, 40))
+
+    full_refresh = payload.get("full", False)
+    if isinstance(full_refresh, str):
+        full_refresh = full_refresh.lower() in {"true", "1", "yes"}
+    parallel = payload.get("parallel", INGEST_PARALLEL)
+    if isinstance(parallel, str):
+        parallel = parallel.lower() in {"true", "1", "yes"}
+    return limit, full_refresh, parallel
+
+
+def _bearer_token(auth_header: str) -> Optional[str]:
     if not auth_header.startswith("Bearer "):
-        return jsonify({"error": "Unauthorized"}), 401
+        return None
+    return auth_header.split(" ", 1)[1].strip() or None
+
+
+def _parent_confirmation_url(confirmation: Dict[str, Any]) -> Optional[str]:
+    """The link mailed to the parent; ``None`` when ``APP_BASE_URL`` is not configured."""
+    if not APP_BASE_URL:
+        return None
+    return f"{APP_BASE_URL.rstrip('/')}/api/parent-request/confirm?token={confirmation['token']}"
+
+
+def _parent_request_response(
+    profile: Dict[str, Any],
+    email_result: Any,
+    confirmation: Dict[str, Any],
+    voice_sample_url: Optional[str],
+    voice_profile_id: Optional[str],
+) -> Tuple[Dict[str, Any], int]:
+    if isinstance(email_result, dict) and email_result.get("skipped"):
+        return {"warning": "Email delivery skipped due to missing configuration.", "profile": profile}, 503
+    return {
+        "message": "Parent confirmation email sent.",
+        "profile": profile,
+        "voice_sample_url": voice_sample_url,
+        "voice_profile_id": voice_profile_id,
+        "expires_at": confirmation["expires_at"],
+    }, 200
+
+
+def _missing_ingest_fields(payload: Dict[str, Any]) -> Optional[str]:
+    missing_fields = [field for field in ("profile_id", "instagram_username") if not payload.get(field)]
+    return f"Missing fields: {', '.join(missing_fields)}" if missing_fields else None
+
+
+def _process_request_options(payload: Dict[str, Any]) -> Tuple[Optional[str], int, bool]:
+    """``(media_id, limit, run_async)`` from a process request body."""
+    run_async = payload.get("async", PROCESSING_MODE == "queue")
+    if isinstance(run_async, str):
+        run_async = run_async.lower() in {"true", "1", "yes"}
+    return payload.get("media_id"), int(payload.get("limit", 5)), run_async
+
+
+def _media_user_ids(records: List[Dict[str, Any]]) -> List[str]:
+    return sorted({record["user_id"] for record in records if record.get("user_id")})
+
 
-    access_token = auth_header.split(" ", 1)[1].strip()
+def _enqueue_media_jobs(
+    records: List[Dict[str, Any]], media_id: Optional[str], returning_users: Set[str]
+) -> List[Dict[str, Any]]:
+    return [
+        job_queue.enqueue(
+            PROCESS_MEDIA_JOB,
+            {"media_id": record["id"], "reprocess": bool(media_id)},
+            dedupe_key=f"{PROCESS_MEDIA_JOB}:{record['id']}",
+            fair_key=record.get("user_id"),
+            priority=_media_job_priority(record, bool(media_id), returning_users),
+        )
+        for record in records
+    ]
+
+
+def _queued_media_body(jobs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "message": f"Queued {len(jobs)} media records for processing.",
+        "jobs": [{"id": job["id"], "media_id": job["payload"]["media_id"], "status": job["status"]} for job in jobs],
+    }
+
+
+def _failed_media_ids(processed: List[Dict[str, Any]]) -> List[str]:
+    """Rows whose processing failed; their leases are released so another run can retry them."""
+    return [entry["id"] for entry in processed if "error" in entry]
+
+
+def _digest_preview_options(payload: Dict[str, Any]) -> Tuple[Optional[str], int, Optional[str]]:
+    """``(user_id, limit, student_name)`` from a digest preview request body."""
+    return payload.get("user_id"), int(payload.get("limit", 5)), payload.get("student_name")
+
+
+@app.route("/parent-request", methods=["POST"])
+def parent_request() -> Response:
+    access_token = _bearer_token(request.headers.get("Authorization", ""))
     if not access_token:
         return jsonify({"error": "Unauthorized"}), 401
 
     try:
-        user = _fetch_authenticated_user(access_token)
+        user = token_verifier.verify(access_token)
     except PermissionError:
         return jsonify({"error": "Unauthorized"}), 401
     except Exception as exc:
@@ -636,18 +2158,9 @@ def parent_request() -> Response:
     else:
         payload = request.get_json(silent=True) or {}
 
-    instagram_username = (
-        payload.get("instagramUsername") or payload.get("instagram_username") or ""
-    ).strip()
-    parent_email = (payload.get("parentEmail") or payload.get("parent_email") or "").strip()
-    consent_flag = payload.get("consentGranted") or payload.get("consent_granted")
-
-    if not instagram_username:
-        return jsonify({"error": "Instagram username is required."}), 400
-    if not parent_email:
-        return jsonify({"error": "Parent email is required."}), 400
-    if str(consent_flag).lower() not in {"true", "1", "yes"}:
-        return jsonify({"error": "Consent must be granted before notifying a parent."}), 400
+    instagram_username, parent_email, error = _parent_request_fields(payload)
+    if error:
+        return jsonify({"error": error}), 400
 
     voice_file = request.files.get("voiceSample") or request.files.get("voice_sample")
     voice_sample_url: Optional[str] = None
@@ -676,46 +2189,26 @@ def parent_request() -> Response:
         else:
             logger.warning("Received empty voice sample for user %s", user_id)
 
-    profile_payload: Dict[str, Any] = {
-        "id": user_id,
-        "email": user.get("email"),
-        "ig_username": instagram_username,
-        "parent_email": parent_email,
-        "is_parent_confirmed": False,
-    }
-    if voice_sample_url:
-        profile_payload["voice_sample_url"] = voice_sample_url
-    if voice_profile_id:
-        profile_payload["voice_profile_id"] = voice_profile_id
-
+    profile_payload = _parent_profile_payload(
+        user, instagram_username, parent_email, voice_sample_url, voice_profile_id
+    )
     try:
         profile = _upsert_user_profile(profile_payload)
     except Exception as exc:
         logger.exception("Failed to upsert user profile for %s", user_id)
         return jsonify({"error": f"Failed to save profile: {exc}"}), 500
 
-    token = str(uuid.uuid4())
-    expires_at = (dt.datetime.utcnow() + dt.timedelta(days=3)).isoformat()
-
+    confirmation = _parent_confirmation_payload(user_id, parent_email)
     try:
-        _insert_parent_confirmation(
-            {
-                "user_id": user_id,
-                "parent_email": parent_email,
-                "token": token,
-                "status": "pending",
-                "expires_at": expires_at,
-            }
-        )
+        _insert_parent_confirmation(confirmation)
     except Exception as exc:
         logger.exception("Failed to insert parent confirmation for %s", user_id)
         return jsonify({"error": f"Failed to record parent confirmation request: {exc}"}), 500
 
-    if not APP_BASE_URL:
+    confirmation_url = _parent_confirmation_url(confirmation)
+    if not confirmation_url:
         return jsonify({"error": "APP_BASE_URL is not configured on the backend."}), 500
 
-    confirmation_url = f"{APP_BASE_URL.rstrip('/')}/api/parent-request/confirm?token={token}"
-
     try:
         email_result = _send_parent_confirmation_email(
             parent_email=parent_email,
@@ -727,23 +2220,10 @@ def parent_request() -> Response:
         logger.exception("Failed to dispatch parent confirmation email.")
         return jsonify({"error": f"Failed to send confirmation email: {exc}"}), 502
 
-    if isinstance(email_result, dict) and email_result.get("skipped"):
-        return jsonify(
-            {
-                "warning": "Email delivery skipped due to missing configuration.",
-                "profile": profile,
-            }
-        ), 503
-
-    return jsonify(
-        {
-            "message": "Parent confirmation email sent.",
-            "profile": profile,
-            "voice_sample_url": voice_sample_url,
-            "voice_profile_id": voice_profile_id,
-            "expires_at": expires_at,
-        }
+    response_body, status = _parent_request_response(
+        profile, email_result, confirmation, voice_sample_url, voice_profile_id
     )
+    return jsonify(response_body), status
 
 
 @app.route("/confirm-parent", methods=["POST"])
@@ -789,18 +2269,11 @@ def ingest_instagram() -> Response:
     payload = request.get_json(silent=True) or {}
     profile_id = payload.get("profile_id")
     instagram_username = payload.get("instagram_username")
+    limit, full_refresh, parallel = _ingest_request_options(payload)
 
-    try:
-        limit = int(payload.get("limit", 12))
-    except (TypeError, ValueError):
-        limit = 12
-    limit = max(1, min(limit, 40))
-
-    missing_fields = [
-        field for field in ("profile_id", "instagram_username") if not payload.get(field)
-    ]
-    if missing_fields:
-        return jsonify({"error": f"Missing fields: {', '.join(missing_fields)}"}), 400
+    missing = _missing_ingest_fields(payload)
+    if missing:
+        return jsonify({"error": missing}), 400
 
     try:
         profile = _fetch_profile(profile_id)
@@ -811,122 +2284,101 @@ def ingest_instagram() -> Response:
     if not profile:
         return jsonify({"error": "Profile not found."}), 404
 
+    if not profile.get("is_parent_confirmed"):
+        # Consent can be granted outside this API (the Next.js confirm route writes directly),
+        # so re-check the database before refusing on a possibly stale cached profile.
+        try:
+            profile = _fetch_profile(profile_id, use_cache=False) or profile
+        except Exception as exc:
+            logger.exception("Failed to refresh profile %s during ingestion", profile_id)
+            return jsonify({"error": str(exc)}), 500
+
     if not profile.get("is_parent_confirmed"):
         return jsonify({"error": "Parent confirmation required before ingestion."}), 403
 
-    try:
-        media_items = _fetch_instagram_posts_via_rapidapi(instagram_username, limit=limit)
-    except Exception as exc:
-        logger.exception("RapidAPI Instagram fetch failed for %s", instagram_username)
-        return jsonify({"error": str(exc)}), 502
+    response_body, status = ingest_profile_media(
+        profile, instagram_username, limit=limit, parallel=parallel, full_refresh=full_refresh
+    )
+    return jsonify(response_body), status
 
-    if not media_items:
-        return jsonify({"message": "No Instagram media returned.", "count": 0}), 200
 
-    inserted_payloads: List[Dict[str, Any]] = []
-    skipped: List[Dict[str, Any]] = []
+@app.route("/process/instagram-media", methods=["POST"])
+def process_instagram_media() -> Response:
+    media_id, limit, run_async = _process_request_options(request.get_json(silent=True) or {})
 
-    for media in media_items:
-        normalized = _normalise_instagram_media(media)
-        media_id = normalized.get("media_id")
-        source_url = normalized.get("source_url")
+    # Inline processing claims its rows; queued jobs are claimed by the worker that runs them.
+    lease_owner = _media_lease_owner()
+    try:
+        if run_async and media_id:
+            records = _fetch_instagram_media(media_id=media_id, limit=limit, only_unprocessed=False)
+        elif run_async:
+            records = _fair_order(_fetch_fair_scan_rows(max(limit, MEDIA_FAIR_SCAN_ROWS)))[:limit]
+        else:
+            records = _claim_instagram_media(lease_owner, media_id=media_id, limit=limit, only_unprocessed=not media_id)
+    except Exception as exc:
+        logger.exception("Failed to fetch instagram_media rows.")
+        return jsonify({"error": str(exc)}), 500
 
-        if not source_url:
-            skipped.append({"media_id": media_id, "reason": "missing_source_url"})
-            continue
+    if not records:
+        return jsonify({"message": "No media queued for processing.", "processed": []})
 
+    if run_async:
         try:
-            if _instagram_media_exists(profile_id, source_url):
-                skipped.append({"media_id": media_id, "reason": "duplicate"})
-                continue
+            returning_users = _users_with_processed_media(_media_user_ids(records))
+            jobs = _enqueue_media_jobs(records, media_id, returning_users)
         except Exception as exc:
-            logger.exception("Lookup failed for existing media %s", source_url)
-            skipped.append({"media_id": media_id, "reason": "lookup_failed"})
-            continue
+            logger.exception("Failed to enqueue instagram_media processing jobs.")
+            return jsonify({"error": str(exc)}), 500
+        return jsonify(_queued_media_body(jobs)), 202
 
-        download = _download_remote_media(source_url)
-        if not download:
-            skipped.append({"media_id": media_id, "reason": "download_failed"})
-            continue
+    processed, pipeline_stats = process_media_records(records)
+    _release_instagram_media_leases(_failed_media_ids(processed), lease_owner)
+    return jsonify({"processed": processed, "pipeline": pipeline_stats})
 
-        storage_key = _build_storage_key(profile_id, media_id, download["content_type"])
-        try:
-            _upload_media_to_r2(storage_key, download)
-        except Exception as exc:
-            logger.exception("Failed to upload media %s to R2", storage_key)
-            skipped.append({"media_id": media_id, "reason": "upload_failed"})
-            continue
-
-        row = {
-            "user_id": profile_id,
-            "source_url": source_url,
-            "storage_key": storage_key,
-            "caption": normalized.get("caption"),
-            "caption_confidence": None,
-            "audio_url": None,
-            "captured_at": normalized.get("captured_at"),
-            "processed_at": None,
-        }
-        inserted_payloads.append(row)
 
+@app.route("/process/backlog", methods=["GET"])
+def media_processing_backlog() -> Response:
     try:
-        persisted = _insert_instagram_media_rows(inserted_payloads)
+        rows = _fetch_media_backlog()
+        jobs = job_queue.backlog(PROCESS_MEDIA_JOB)
     except Exception as exc:
-        logger.exception("Failed to insert instagram_media rows for profile %s", profile_id)
+        logger.exception("Failed to load the media processing backlog.")
         return jsonify({"error": str(exc)}), 500
 
-    response_body = {
-        "inserted": len(persisted),
-        "skipped": skipped,
-        "total_returned": len(media_items),
-        "records": persisted,
-    }
-    logger.info(
-        "Ingested %s instagram items for %s (skipped %s)",
-        len(persisted),
-        instagram_username,
-        len(skipped),
+    users = _merge_media_backlog(rows, jobs)
+    return jsonify(
+        {
+            "users": users,
+            "totals": {
+                "users": len(users),
+                "unprocessed": sum(entry["unprocessed"] for entry in users),
+                "in_flight": sum(entry["in_flight"] for entry in users),
+                "priority_users": sum(1 for entry in users if entry["lane"] == "priority"),
+            },
+            "max_in_flight_per_user": MEDIA_MAX_IN_FLIGHT_PER_USER,
+        }
     )
-    return jsonify(response_body)
-
 
-@app.route("/process/instagram-media", methods=["POST"])
-def process_instagram_media() -> Response:
-    payload = request.get_json(silent=True) or {}
-    media_id = payload.get("media_id")
-    limit = int(payload.get("limit", 5))
 
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id: str) -> Response:
     try:
-        records = _fetch_instagram_media(media_id=media_id, limit=limit, only_unprocessed=not media_id)
+        job = job_queue.get(job_id)
     except Exception as exc:
-        logger.exception("Failed to fetch instagram_media rows.")
+        logger.exception("Failed to load job %s", job_id)
         return jsonify({"error": str(exc)}), 500
 
-    if not records:
-        return jsonify({"message": "No media queued for processing.", "processed": []})
-
-    processed: List[Dict[str, Any]] = []
-    for record in records:
-        try:
-            processed_result = process_media_record(record)
-            processed.append({"id": record.get("id"), **processed_result})
-        except Exception as exc:
-            logger.exception("Processing failed for media %s", record.get("id"))
-            processed.append({"id": record.get("id"), "error": str(exc)})
-
-    return jsonify({"processed": processed})
+    if not job:
+        return jsonify({"error": "Job not found."}), 404
+    return jsonify({"job": job})
 
 
 @app.route("/email/digest-preview", methods=["POST"])
 def email_digest_preview() -> Response:
-    payload = request.get_json(silent=True) or {}
-    user_id = payload.get("user_id")
+    user_id, limit, student_name = _digest_preview_options(request.get_json(silent=True) or {})
     if not user_id:
         return jsonify({"error": "user_id is required"}), 400
 
-    limit = int(payload.get("limit", 5))
-    student_name = payload.get("student_name")
-
     try:
         media_items = _fetch_recent_media_for_user(user_id=user_id, limit=limit)
     except Exception as exc:
@@ -937,6 +2389,73 @@ def email_digest_preview() -> Response:
     return Response(html, mimetype="text/html")
 
 
+@app.before_request
+def _start_request_deadline() -> None:
+    default = ROUTE_DEADLINE_SECONDS.get(request.path, REQUEST_DEADLINE_SECONDS)
+    g.deadline_token = deadlines.start(deadlines.budget(request.headers.get(deadlines.DEADLINE_HEADER), default))
+
+
+@app.before_request
+def _start_request_metrics() -> None:
+    g.metrics_route = request.url_rule.rule if request.url_rule else "unmatched"
+    g.metrics_started = time.perf_counter()
+    metrics.HTTP_IN_FLIGHT.inc(route=g.metrics_route)
+
+
+@app.after_request
+def _capture_response_status(response: Response) -> Response:
+    g.metrics_status = response.status_code
+    return response
+
+
+@app.teardown_request
+def _finish_request_deadline(_exc: Optional[BaseException]) -> None:
+    # Request threads are reused, so the deadline must not outlive the request.
+    deadlines.reset(g.pop("deadline_token", None))
+
+
+@app.teardown_request
+def _finish_request_metrics(_exc: Optional[BaseException]) -> None:
+    started = g.pop("metrics_started", None)
+    if started is None:
+        return
+    route = g.metrics_route
+    metrics.HTTP_IN_FLIGHT.dec(route=route)
+    metrics.HTTP_REQUEST_SECONDS.observe(
+        time.perf_counter() - started, route=route, method=request.method, status=g.get("metrics_status", 500)
+    )
+
+
+def _observe_media_queue_wait() -> None:
+    """Sets the queue-wait gauge from the shared job queue; workers do not serve ``/metrics`` themselves."""
+    try:
+        waits = job_queue.oldest_queued_seconds(PROCESS_MEDIA_JOB)
+    except Exception:
+        logger.warning("Failed to read media queue wait for metrics.", exc_info=True)
+        return
+    for lane, seconds in waits.items():
+        metrics.MEDIA_OLDEST_QUEUED_SECONDS.set(seconds, lane=lane)
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint() -> Response:
+    _observe_media_queue_wait()
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats() -> Response:
+    return jsonify(
+        {
+            "caption": caption_cache.stats(),
+            "narration": narration_cache.stats(),
+            "auth": token_verifier.stats(),
+            "profile": profile_cache.stats(),
+            "presigned_urls": presigned_url_cache.stats(),
+        }
+    )
+
+
 @app.route("/hello", methods=["GET"])
 def hello() -> Response:
     return jsonify({"message": "Hello, world!"})
@@ -948,31 +2467,127 @@ def echo() -> Response:
     return jsonify({"you_sent": data})
 
 
-@app.route("/transcribe-image", methods=["POST"])
+def _wants_presigned_media(method: str, delivery: Optional[str]) -> bool:
+    """Whether a ``/transcribe-image`` request is answered with a redirect instead of the bytes."""
+    mode = MEDIA_DELIVERY_MODE if delivery is None else delivery
+    return method == "GET" and mode.lower() in {"presigned", "redirect"}
+
+
+def _presigned_redirect_headers(url: str, reuse_for: int) -> Dict[str, str]:
+    # Browsers may reuse the redirect for as long as the signature stays cached here.
+    return {"Location": url, "Cache-Control": f"private, max-age={reuse_for}" if reuse_for else "no-store"}
+
+
+def _conditional_media_headers(method: str, headers: Mapping[str, str]) -> Dict[str, str]:
+    """The ``Range`` and validator headers of a GET that R2 evaluates for us."""
+    forwarded: Dict[str, str] = {}
+    if method != "GET":
+        return forwarded
+    if headers.get("Range"):
+        forwarded["Range"] = headers["Range"]
+    if headers.get("If-None-Match"):
+        forwarded["If-None-Match"] = headers["If-None-Match"]
+    elif headers.get("If-Modified-Since"):
+        forwarded["If-Modified-Since"] = headers["If-Modified-Since"]
+    return forwarded
+
+
+def _not_modified_headers(etag: Optional[str]) -> Dict[str, str]:
+    headers = {"Cache-Control": MEDIA_CACHE_CONTROL}
+    if etag:
+        headers["ETag"] = etag
+    return headers
+
+
+def _media_response_headers(
+    content_length: Optional[str], content_range: Optional[str], etag: Optional[str], last_modified: Optional[str]
+) -> Dict[str, str]:
+    headers = {"Accept-Ranges": "bytes", "Cache-Control": MEDIA_CACHE_CONTROL}
+    for name, value in (
+        ("Content-Length", content_length),
+        ("Content-Range", content_range),
+        ("ETag", etag),
+        ("Last-Modified", last_modified),
+    ):
+        if value:
+            headers[name] = value
+    return headers
+
+
+@app.route("/transcribe-image", methods=["GET", "POST"])
 def transcribe_image() -> Response:
     """
-    Expected input JSON:
-    {
-      "filename": "image_name_in_bucket.png"
-    }
+    Streams an object from R2.
+
+    GET /transcribe-image?filename=<key> is the cacheable form: it honours ``Range`` (206) and
+    ``If-None-Match`` / ``If-Modified-Since`` (304), which R2 evaluates so nothing is transferred
+    twice. With ``MEDIA_DELIVERY_MODE=presigned`` (or ``?delivery=presigned``) a GET instead
+    redirects to a cached presigned R2 URL. POST with ``{"filename": "image_name_in_bucket.png"}``
+    is kept for existing callers and always proxies.
     """
-    try:
-        data = request.get_json()
-        filename = data.get("filename")
+    if request.method == "GET":
+        filename = request.args.get("filename")
+    else:
+        filename = (request.get_json(silent=True) or {}).get("filename")
 
-        if not filename:
-            return jsonify({"error": "Missing 'filename' field"}), 400
+    if not filename:
+        return jsonify({"error": "Missing 'filename' field"}), 400
 
-        obj = s3.get_object(Bucket=BUCKET_NAME, Key=filename)
-        img_bytes = obj["Body"].read()
-        content_type = obj.get("ContentType", "image/jpeg")
-        return Response(img_bytes, mimetype=content_type)
+    if _wants_presigned_media(request.method, request.args.get("delivery")):
+        try:
+            url, reuse_for = _presigned_media_url(filename)
+        except Exception as exc:
+            logger.exception("Failed to presign %s", filename)
+            return jsonify({"error": str(exc)}), 500
+        return Response(status=302, headers=_presigned_redirect_headers(url, reuse_for))
+
+    params: Dict[str, Any] = {"Bucket": BUCKET_NAME, "Key": filename}
+    conditional = _conditional_media_headers(request.method, request.headers)
+    if "Range" in conditional:
+        params["Range"] = conditional["Range"]
+    if "If-None-Match" in conditional:
+        params["IfNoneMatch"] = conditional["If-None-Match"]
+    if_modified_since = parse_date(conditional.get("If-Modified-Since"))
+    if if_modified_since:
+        params["IfModifiedSince"] = if_modified_since
 
+    try:
+        obj = s3.get_object(**params)
     except s3.exceptions.NoSuchKey:
         return jsonify({"error": "Image not found in bucket"}), 404
+    except ClientError as exc:
+        status = exc.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+        if status == 304:
+            upstream_headers = exc.response["ResponseMetadata"].get("HTTPHeaders", {})
+            return Response(status=304, headers=_not_modified_headers(upstream_headers.get("etag")))
+        if status == 416:
+            return jsonify({"error": "Requested range not satisfiable"}), 416
+        return jsonify({"error": str(exc)}), 500
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+    body = obj["Body"]
+
+    def stream() -> Iterable[bytes]:
+        try:
+            yield from body.iter_chunks(chunk_size=HTTP_READ_CHUNK_BYTES)
+        finally:
+            body.close()
+
+    headers = _media_response_headers(
+        None if obj.get("ContentLength") is None else str(obj["ContentLength"]),
+        obj.get("ContentRange"),
+        obj.get("ETag"),
+        http_date(obj["LastModified"]) if obj.get("LastModified") else None,
+    )
+    return Response(
+        stream(),
+        status=206 if obj.get("ContentRange") else 200,
+        mimetype=obj.get("ContentType", "image/jpeg"),
+        headers=headers,
+        direct_passthrough=True,
+    )
+
 
 if __name__ == "__main__":
     app.run(debug=True, port=5000)
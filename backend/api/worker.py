@@ -0,0 +1,105 @@
+"""
+Standalone worker that drains the LifeLoop job queue.
+
+    python worker.py --concurrency 4
+
+Run as many worker processes as upstream rate limits allow; they coordinate through the
+SQLite queue at ``JOBS_DB_PATH``, so throughput scales by adding processes.
+"""
+import argparse
+import logging
+import os
+import signal
+import socket
+import threading
+from typing import Any, Dict
+
+import deadlines
+from jobs import PROCESS_MEDIA_JOB, JobQueue
+from server import (MEDIA_LEASE_SECONDS, MEDIA_MAX_IN_FLIGHT_PER_USER, _claim_instagram_media, _fetch_instagram_media,
+                    _release_instagram_media_leases, process_media_record)
+
+logger = logging.getLogger("worker")
+
+WORKER_POLL_SECONDS = float(os.getenv("WORKER_POLL_SECONDS", "1"))
+
+
+def run_process_media_job(queue: JobQueue, job: Dict[str, Any], worker_id: str) -> Dict[str, Any]:
+    media_id = job["payload"]["media_id"]
+    reprocess = job["payload"].get("reprocess", False)
+    records = _claim_instagram_media(worker_id, media_id=media_id, limit=1, only_unprocessed=not reprocess)
+    if not records:
+        existing = _fetch_instagram_media(media_id=media_id, limit=1, only_unprocessed=False)
+        if not existing:
+            return {"id": media_id, "skipped": "not_found"}
+        if existing[0].get("processed_at") and not reprocess:
+            return {"id": media_id, "skipped": "already_processed"}
+        # Leased by another worker or API call; retry with backoff in case that run fails.
+        raise RuntimeError(f"Media {media_id} is leased by {existing[0].get('lease_owner')}.")
+
+    def on_stage(stage: str, detail: Dict[str, Any]) -> None:
+        queue.record_stage(job["id"], worker_id, stage, detail)
+
+    try:
+        # Past the lease another worker may claim the row, so stop paying for stages by then.
+        with deadlines.scope(MEDIA_LEASE_SECONDS):
+            result = process_media_record(records[0], on_stage=on_stage)
+    except Exception:
+        _release_instagram_media_leases([media_id], worker_id)
+        raise
+    return {"id": media_id, **result}
+
+
+HANDLERS = {
+    PROCESS_MEDIA_JOB: run_process_media_job,
+}
+
+
+def work_loop(queue: JobQueue, worker_id: str, stop: threading.Event) -> None:
+    while not stop.is_set():
+        # Round-robin across students, capped per student; priority-lane jobs go first.
+        job = queue.lease(worker_id, kinds=HANDLERS.keys(), max_running_per_key=MEDIA_MAX_IN_FLIGHT_PER_USER or None)
+        if not job:
+            stop.wait(WORKER_POLL_SECONDS)
+            continue
+        logger.info("Worker %s leased job %s (%s, attempt %s)", worker_id, job["id"], job["kind"], job["attempts"])
+        try:
+            result = HANDLERS[job["kind"]](queue, job, worker_id)
+        except Exception as exc:
+            logger.exception("Job %s failed", job["id"])
+            outcome = queue.fail(job["id"], worker_id, str(exc))
+            logger.info("Job %s failure recorded: %s", job["id"], outcome)
+            continue
+        queue.complete(job["id"], worker_id, result)
+        logger.info("Job %s completed", job["id"])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Process queued LifeLoop jobs.")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("WORKER_CONCURRENCY", "1")))
+    args = parser.parse_args()
+
+    queue = JobQueue()
+    stop = threading.Event()
+
+    def request_stop(signum: int, _frame: Any) -> None:
+        logger.info("Received signal %s; finishing in-flight jobs.", signum)
+        stop.set()
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    base_id = f"{socket.gethostname()}:{os.getpid()}"
+    threads = [
+        threading.Thread(target=work_loop, args=(queue, f"{base_id}:{index}", stop), name=f"worker-{index}")
+        for index in range(max(1, args.concurrency))
+    ]
+    for thread in threads:
+        thread.start()
+    logger.info("Started %s worker thread(s) on %s", len(threads), queue.path)
+    for thread in threads:
+        thread.join()
+
+
+if __name__ == "__main__":
+    main()
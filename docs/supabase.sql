@@ -8,6 +8,11 @@ alter table public.user_profiles
   add column if not exists voice_sample_url text,
   add column if not exists voice_profile_id text;
 
+-- Instagram ingest high-water mark: newest media already ingested for the profile
+alter table public.user_profiles
+  add column if not exists ig_last_media_id text,
+  add column if not exists ig_last_captured_at timestamptz;
+
 -- Parent confirmation tracking
 create table if not exists public.parent_confirmations (
   id uuid primary key default gen_random_uuid(),
@@ -24,3 +29,215 @@ create index if not exists parent_confirmations_token_idx on public.parent_confi
 
 -- Optional: leave RLS disabled for parent_confirmations (admin writes only)
 alter table public.parent_confirmations disable row level security;
+
+-- Instagram media dedup: one row per (user, source URL), used as the ingest upsert conflict target
+do $$
+begin
+  if not exists (
+    select 1 from pg_constraint where conname = 'instagram_media_user_source_url_key'
+  ) then
+    -- The old ingest insert was racy, so duplicates may exist. Keep one row per (user, source
+    -- URL) -- a processed one if there is any, else the oldest -- or the constraint will fail.
+    delete from public.instagram_media as media
+    using (
+      select id,
+             row_number() over (
+               partition by user_id, source_url
+               order by processed_at is null, created_at, id
+             ) as duplicate_rank
+      from public.instagram_media
+      where source_url is not null
+    ) as ranked
+    where media.id = ranked.id
+      and ranked.duplicate_rank > 1;
+
+    alter table public.instagram_media
+      add constraint instagram_media_user_source_url_key unique (user_id, source_url);
+  end if;
+end $$;
+
+-- Processing leases: rows are claimed before captioning/narration so concurrent API calls and
+-- workers never process (and pay for) the same row twice
+alter table public.instagram_media
+  add column if not exists lease_owner text,
+  add column if not exists lease_expires_at timestamptz;
+
+-- Caption-sized image copy stored next to the original; reprocessing reads it only when recorded
+alter table public.instagram_media
+  add column if not exists caption_image_key text;
+
+create index if not exists instagram_media_unprocessed_idx
+  on public.instagram_media (created_at desc)
+  where processed_at is null;
+
+create index if not exists instagram_media_leased_idx
+  on public.instagram_media (user_id)
+  where lease_owner is not null;
+
+-- Leases up to p_limit rows for p_owner: unprocessed rows (any row when p_only_unprocessed is
+-- false) that are not under a live lease. Rows are dealt round-robin across students, newest
+-- first within each, and no student holds more than p_max_per_user live leases (null: no cap;
+-- an explicit p_media_id is never capped). Students with nothing processed yet go first.
+-- SKIP LOCKED lets concurrent callers claim disjoint rows instead of waiting on each other;
+-- expired leases are reclaimed.
+drop function if exists public.claim_instagram_media(text, integer, integer, uuid, boolean);
+
+create or replace function public.claim_instagram_media(
+  p_owner text,
+  p_limit integer default 5,
+  p_lease_seconds integer default 600,
+  p_media_id uuid default null,
+  p_only_unprocessed boolean default true,
+  p_max_per_user integer default 2
+)
+returns setof public.instagram_media
+language sql
+volatile
+as $$
+  with candidates as (
+    select id, user_id, created_at
+    from public.instagram_media
+    where (p_media_id is null or id = p_media_id)
+      and (not p_only_unprocessed or processed_at is null)
+      and (lease_expires_at is null or lease_expires_at <= now())
+  ),
+  in_flight as (
+    select user_id, count(*) as leased
+    from public.instagram_media
+    where lease_owner is not null and lease_expires_at > now()
+    group by user_id
+  ),
+  ranked as (
+    select candidates.id,
+           candidates.created_at,
+           coalesce(in_flight.leased, 0)
+             + row_number() over (partition by candidates.user_id order by candidates.created_at desc) as user_slot,
+           not exists (
+             select 1 from public.instagram_media as done
+             where done.user_id = candidates.user_id and done.processed_at is not null
+           ) as first_time
+    from candidates
+    left join in_flight on in_flight.user_id = candidates.user_id
+  ),
+  claimable as (
+    select media.id
+    from public.instagram_media as media
+    join ranked on ranked.id = media.id
+    where (p_media_id is not null or p_max_per_user is null or ranked.user_slot <= p_max_per_user)
+      and (media.lease_expires_at is null or media.lease_expires_at <= now())
+    order by ranked.first_time desc, ranked.user_slot, ranked.created_at desc
+    limit p_limit
+    for update of media skip locked
+  )
+  update public.instagram_media as media
+  set lease_owner = p_owner,
+      lease_expires_at = now() + make_interval(secs => p_lease_seconds)
+  from claimable
+  where media.id = claimable.id
+  returning media.*;
+$$;
+
+-- Only the service role (the backend) may claim rows
+revoke execute on function public.claim_instagram_media(text, integer, integer, uuid, boolean, integer)
+  from public, anon, authenticated;
+
+-- Bulk result write-back: applies each row's caption, narration and processed_at and releases its
+-- lease. Update-only, so a row deleted while its result was buffered stays deleted; the ids that
+-- matched are returned and the backend reports the rest as per-row errors.
+create or replace function public.update_instagram_media_results(p_rows jsonb)
+returns setof public.instagram_media
+language sql
+volatile
+as $$
+  update public.instagram_media as media
+  set caption = results.caption,
+      caption_confidence = results.caption_confidence,
+      audio_url = results.audio_url,
+      caption_image_key = results.caption_image_key,
+      processed_at = results.processed_at,
+      lease_owner = results.lease_owner,
+      lease_expires_at = results.lease_expires_at
+  from jsonb_to_recordset(p_rows) as results(
+    id uuid,
+    caption text,
+    caption_confidence numeric,
+    audio_url text,
+    caption_image_key text,
+    processed_at timestamptz,
+    lease_owner text,
+    lease_expires_at timestamptz
+  )
+  where media.id = results.id
+  returning media.*;
+$$;
+
+revoke execute on function public.update_instagram_media_results(jsonb)
+  from public, anon, authenticated;
+
+-- Per-student processing backlog, served by GET /process/backlog
+create or replace function public.media_processing_backlog()
+returns table (
+  user_id uuid,
+  unprocessed bigint,
+  leased bigint,
+  oldest_unprocessed_at timestamptz,
+  first_time boolean
+)
+language sql
+stable
+as $$
+  select media.user_id,
+         count(*) as unprocessed,
+         count(*) filter (where media.lease_owner is not null and media.lease_expires_at > now()) as leased,
+         min(media.created_at) as oldest_unprocessed_at,
+         not exists (
+           select 1 from public.instagram_media as done
+           where done.user_id = media.user_id and done.processed_at is not null
+         ) as first_time
+  from public.instagram_media as media
+  where media.processed_at is null
+  group by media.user_id
+  order by min(media.created_at);
+$$;
+
+revoke execute on function public.media_processing_backlog()
+  from public, anon, authenticated;
+
+-- Newest p_per_user media per student processed in [p_since, p_until), for digest dispatch.
+-- The per-student limit is applied here rather than after the fact, so one page of students is
+-- never cut short by PostgREST's max-rows; only the columns the digest template renders are returned.
+create or replace function public.recent_media_for_users(
+  p_user_ids uuid[],
+  p_since timestamptz,
+  p_until timestamptz default null,
+  p_per_user integer default 5
+)
+returns table (
+  id uuid,
+  user_id uuid,
+  caption text,
+  audio_url text,
+  source_url text,
+  processed_at timestamptz,
+  created_at timestamptz
+)
+language sql
+stable
+as $$
+  select ranked.id, ranked.user_id, ranked.caption, ranked.audio_url, ranked.source_url,
+         ranked.processed_at, ranked.created_at
+  from (
+    select media.id, media.user_id, media.caption, media.audio_url, media.source_url,
+           media.processed_at, media.created_at,
+           row_number() over (partition by media.user_id order by media.processed_at desc, media.id) as recency
+    from public.instagram_media as media
+    where media.user_id = any(p_user_ids)
+      and media.processed_at >= p_since
+      and (p_until is null or media.processed_at < p_until)
+  ) as ranked
+  where ranked.recency <= p_per_user
+  order by ranked.user_id, ranked.processed_at desc;
+$$;
+
+revoke execute on function public.recent_media_for_users(uuid[], timestamptz, timestamptz, integer)
+  from public, anon, authenticated;